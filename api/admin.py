@@ -1,7 +1,9 @@
 from django.contrib import admin
+from django.utils import timezone
 from django.utils.html import format_html
+from django.db.models import Max, OuterRef, Subquery
 from django import forms
-from .models import InsurancePolicy, PlanDocument, AnnualValue, MembershipPlan, UserQuota, GeminiUsage, MediaLibrary, InsuranceCompany, InsuranceProduct, InsuranceCompanyRequest, PagePermission, UserProductSettings
+from .models import InsurancePolicy, PlanDocument, AnnualValue, MembershipPlan, UserQuota, GeminiUsage, MediaLibrary, InsuranceCompany, InsuranceProduct, InsuranceCompanyRequest, PagePermission, UserProductSettings, IllustrationSweep, ImageGenerationJob, QuotaReservation, QuotaLedgerEntry, GeminiUsageRollup, MediaFile, PersonalVoice
 import json
 
 
@@ -193,13 +195,22 @@ class UserQuotaAdmin(admin.ModelAdmin):
         )
     total_purchased_display.short_description = '累计购买'
 
+    def get_queryset(self, request):
+        """列表页从调用汇总的累计行一次取出最后成功时间，避免逐行查询调用记录"""
+        last_success = GeminiUsageRollup.objects.filter(
+            user=OuterRef('user'), granularity='total'
+        ).order_by().values('user').annotate(last=Max('last_success_at')).values('last')
+        return super().get_queryset(request).select_related('user').annotate(
+            last_success_at=Subquery(last_success)
+        )
+
     def last_used(self, obj):
         """最后使用时间"""
-        last_usage = GeminiUsage.objects.filter(user=obj.user, success=True).order_by('-created_at').first()
-        if last_usage:
-            return last_usage.created_at.strftime('%Y-%m-%d %H:%M')
+        if obj.last_success_at:
+            return timezone.localtime(obj.last_success_at).strftime('%Y-%m-%d %H:%M')
         return '从未使用'
     last_used.short_description = '最后使用'
+    last_used.admin_order_field = 'last_success_at'
 
     actions = ['add_10_quota', 'add_50_quota', 'add_100_quota', 'reset_to_3_quota']
 
@@ -207,7 +218,7 @@ class UserQuotaAdmin(admin.ModelAdmin):
         """批量增加10次额度"""
         count = 0
         for quota in queryset:
-            quota.add_quota(10)
+            quota.add_quota(10, source=f'admin:{request.user.username}')
             count += 1
         self.message_user(request, f'成功为 {count} 个用户增加了 10 次额度')
     add_10_quota.short_description = '➕ 增加 10 次额度'
@@ -216,7 +227,7 @@ class UserQuotaAdmin(admin.ModelAdmin):
         """批量增加50次额度"""
         count = 0
         for quota in queryset:
-            quota.add_quota(50)
+            quota.add_quota(50, source=f'admin:{request.user.username}')
             count += 1
         self.message_user(request, f'成功为 {count} 个用户增加了 50 次额度')
     add_50_quota.short_description = '➕ 增加 50 次额度'
@@ -225,18 +236,85 @@ class UserQuotaAdmin(admin.ModelAdmin):
         """批量增加100次额度"""
         count = 0
         for quota in queryset:
-            quota.add_quota(100)
+            quota.add_quota(100, source=f'admin:{request.user.username}')
             count += 1
         self.message_user(request, f'成功为 {count} 个用户增加了 100 次额度')
     add_100_quota.short_description = '➕ 增加 100 次额度'
 
     def reset_to_3_quota(self, request, queryset):
         """批量重置为3次额度"""
-        count = queryset.update(available_quota=3)
+        from .quota_ledger import adjust_to
+        count = 0
+        for user_id in queryset.values_list('user_id', flat=True):
+            adjust_to(user_id, 3, source=f'admin:{request.user.username}')
+            count += 1
         self.message_user(request, f'成功为 {count} 个用户重置额度为 3 次')
     reset_to_3_quota.short_description = '🔄 重置为 3 次额度'
 
 
+@admin.register(QuotaReservation)
+class QuotaReservationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'original_amount', 'amount', 'status', 'source', 'expires_at', 'created_at', 'settled_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['user__username', 'source']
+    date_hierarchy = 'created_at'
+    ordering = ['-created_at']
+    list_select_related = ['user']
+    readonly_fields = ['user', 'amount', 'original_amount', 'status', 'source', 'expires_at', 'created_at', 'settled_at']
+
+
+@admin.register(QuotaLedgerEntry)
+class QuotaLedgerEntryAdmin(admin.ModelAdmin):
+    """额度流水只追加，后台只读"""
+    list_display = ['id', 'user', 'entry_type', 'delta', 'source', 'reservation', 'created_at']
+    list_filter = ['entry_type', 'created_at']
+    search_fields = ['user__username', 'source']
+    date_hierarchy = 'created_at'
+    ordering = ['-created_at']
+    list_select_related = ['user']
+    readonly_fields = ['user', 'entry_type', 'delta', 'source', 'reservation', 'created_at']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(GeminiUsageRollup)
+class GeminiUsageRollupAdmin(admin.ModelAdmin):
+    """调用汇总由信号和定时任务维护，后台只读"""
+    list_display = ['user', 'generation_type', 'granularity', 'bucket', 'total_count', 'success_count', 'last_success_at']
+    list_filter = ['granularity', 'generation_type']
+    search_fields = ['user__username']
+    ordering = ['-bucket']
+    list_select_related = ['user']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ImageGenerationJob)
+class ImageGenerationJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'generation_type', 'status', 'quota_reservation', 'created_at', 'finished_at']
+    list_filter = ['generation_type', 'status', 'created_at']
+    search_fields = ['user__username', 'celery_task_id', 'error_message']
+    date_hierarchy = 'created_at'
+    ordering = ['-created_at']
+    list_select_related = ['user']
+    readonly_fields = ['user', 'generation_type', 'params', 'input_image_path', 'status', 'quota_reservation',
+                       'result', 'error_message', 'celery_task_id', 'created_at', 'started_at', 'finished_at']
+
+
 @admin.register(GeminiUsage)
 class GeminiUsageAdmin(admin.ModelAdmin):
     list_display = ['id', 'user_display', 'generation_type_display', 'success_display', 'prompt_preview', 'created_at']
@@ -314,6 +392,42 @@ class GeminiUsageAdmin(admin.ModelAdmin):
         return True
 
 
+@admin.register(MediaFile)
+class MediaFileAdmin(admin.ModelAdmin):
+    """内容寻址的素材文件，引用数由素材保存/删除维护，后台只读"""
+    list_display = ['id', 'sha256', 'path', 'file_size', 'width', 'height', 'ref_count', 'created_at']
+    search_fields = ['sha256', 'path']
+    ordering = ['-created_at']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PersonalVoice)
+class PersonalVoiceAdmin(admin.ModelAdmin):
+    """个人语音（修改后清除相关用户的列表缓存，删除时由信号清除）"""
+    list_display = ['id', 'voice_key', 'name', 'user', 'voice_id', 'status', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['voice_key', 'name', 'voice_id', 'user__username']
+    raw_id_fields = ['user']
+    readonly_fields = ['voice_key', 'voice_id', 'voice_prefix', 'created_at']
+    ordering = ['-created_at']
+
+    def save_model(self, request, obj, form, change):
+        from .personal_voices import invalidate_voice_list
+        previous_user_id = form.initial.get('user') if change else None
+        super().save_model(request, obj, form, change)
+        invalidate_voice_list(obj.user_id)
+        if previous_user_id != obj.user_id:
+            invalidate_voice_list(previous_user_id)
+
+
 @admin.register(MediaLibrary)
 class MediaLibraryAdmin(admin.ModelAdmin):
     list_display = ['id', 'user_display', 'media_type_display', 'image_thumbnail', 'prompt_preview', 'size_display', 'is_favorite', 'created_at']
@@ -321,14 +435,18 @@ class MediaLibraryAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'user__wechatuser__nickname', 'prompt']
     date_hierarchy = 'created_at'
     ordering = ['-created_at']
-    readonly_fields = ['user', 'media_type', 'original_url', 'local_path', 'image_preview', 'width', 'height', 'file_size', 'created_at', 'updated_at']
+    readonly_fields = ['user', 'media_type', 'original_url', 'local_path', 'media_file', 'thumbnail_path', 'variants', 'variants_generated_at', 'image_preview', 'width', 'height', 'file_size', 'created_at', 'updated_at']
 
     fieldsets = (
         ('基本信息', {
             'fields': ('user', 'media_type', 'is_favorite')
         }),
         ('图片信息', {
-            'fields': ('image_preview', 'original_url', 'local_path', 'width', 'height', 'file_size')
+            'fields': ('image_preview', 'original_url', 'local_path', 'media_file', 'width', 'height', 'file_size')
+        }),
+        ('多尺寸版本', {
+            'fields': ('thumbnail_path', 'variants', 'variants_generated_at'),
+            'classes': ('collapse',)
         }),
         ('描述信息', {
             'fields': ('prompt', 'related_ip_image_id')
@@ -368,9 +486,9 @@ class MediaLibraryAdmin(admin.ModelAdmin):
     media_type_display.short_description = '类型'
 
     def image_thumbnail(self, obj):
-        """缩略图显示"""
+        """缩略图显示（优先使用生成的缩略图）"""
         if obj.local_path:
-            url = f"/media/{obj.local_path}"
+            url = f"/media/{obj.thumbnail_path or obj.local_path}"
             return format_html('<img src="{}" style="width: 60px; height: 60px; object-fit: cover; border-radius: 4px;" />', url)
         elif obj.original_url:
             return format_html('<img src="{}" style="width: 60px; height: 60px; object-fit: cover; border-radius: 4px;" />', obj.original_url)
@@ -742,8 +860,8 @@ class InsuranceCompanyRequestAdmin(admin.ModelAdmin):
             'description': '请求的基本标识信息'
         }),
         ('API配置', {
-            'fields': ('request_url', 'request_method', 'requires_bearer_token'),
-            'description': '接口的URL和请求方法'
+            'fields': ('request_url', 'request_method', 'requires_bearer_token', 'response_cache_ttl'),
+            'description': '接口的URL、请求方法和响应缓存时长'
         }),
         ('HTTP Headers', {
             'fields': ('headers_text',),
@@ -888,6 +1006,11 @@ class InsuranceProductAdmin(admin.ModelAdmin):
                          '  - total: 总现金价值（预期价值）',
             'classes': ('collapse',)
         }),
+        ('自动刷新', {
+            'fields': ('illustration_request', 'illustration_params', 'surrender_table_refreshed_at'),
+            'description': '配置后，定时任务会用该保险公司API请求重新生成退保价值表，只更新有变化的产品',
+            'classes': ('collapse',)
+        }),
         ('身故赔偿表', {
             'fields': ('death_benefit_table',),
             'description': '<strong>身故保险赔偿表配置</strong><br>'
@@ -911,7 +1034,8 @@ class InsuranceProductAdmin(admin.ModelAdmin):
         }),
     )
 
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at', 'surrender_table_refreshed_at']
+    raw_id_fields = ['illustration_request']
 
     def company_display(self, obj):
         """保险公司显示"""
@@ -1021,3 +1145,12 @@ class UserProductSettingsAdmin(admin.ModelAdmin):
     def product_count(self, obj):
         return len(obj.selected_product_ids) if obj.selected_product_ids else 0
     product_count.short_description = '选择的产品数量'
+
+
+@admin.register(IllustrationSweep)
+class IllustrationSweepAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'request_config', 'total_points', 'completed_points', 'failed_points', 'status', 'created_at', 'finished_at']
+    list_filter = ['status', 'request_config__company', 'created_at']
+    search_fields = ['user__username', 'request_config__request_name']
+    list_select_related = ['user', 'request_config__company']
+    readonly_fields = ['created_at', 'finished_at']
@@ -9,6 +9,8 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from datetime import datetime, timedelta
+from .insurer_http import insurer_request
+from .insurer_response_cache import cached_insurer_call, cache_status_headers, get_default_cache_ttl
 
 
 @api_view(['POST'])
@@ -192,47 +194,60 @@ def calculate_withdrawal(request):
         print(f"发送提取金额计算请求到安盛API: {axa_api_url}")
         print(f"保费: {premium}, 提取金额: {withdrawal_amount}")
 
-        response = requests.post(
-            axa_api_url,
-            json=payload,
-            headers=headers,
-            timeout=30,
-            verify=True
+        def fetch():
+            response = insurer_request(
+                'POST',
+                axa_api_url,
+                insurer='axa',
+                json=payload,
+                headers=headers
+            )
+            print(f"安盛API响应状态: {response.status_code}")
+            return {
+                'status_code': response.status_code,
+                'headers': {},
+                'body': response.json() if response.status_code == 200 else response.text
+            }
+
+        # 相同保费/提取金额的成功结果会被缓存（请求体中含当天日期，缓存不会跨天）
+        api_result, cache_status = cached_insurer_call(
+            'axa', 'calculate_withdrawal', payload, get_default_cache_ttl(), fetch,
+            bypass=bool(request.data.get('no_cache'))
         )
 
-        print(f"安盛API响应状态: {response.status_code}")
-
         # 检查响应状态
-        if response.status_code == 200:
-            result = response.json()
-
+        if api_result['status_code'] == 200:
             # 返回成功响应，包含POST URL、Request和Response
-            return Response({
+            response = Response({
                 'status': 'success',
                 'post_url': axa_api_url,
                 'post_request': payload,
-                'data': result,
+                'data': api_result['body'],
                 'message': '计算成功'
             })
-        elif response.status_code == 401:
-            return Response({
+        elif api_result['status_code'] == 401:
+            response = Response({
                 'status': 'error',
                 'message': '需要安盛API的Bearer Token。请提供有效的token。',
                 'post_url': axa_api_url,
                 'post_request': payload,
-                'details': response.text,
+                'details': api_result['body'],
                 'status_code': 401
             }, status=status.HTTP_401_UNAUTHORIZED)
         else:
-            return Response({
+            response = Response({
                 'status': 'error',
-                'message': f'安盛API调用失败 (HTTP {response.status_code})',
+                'message': f'安盛API调用失败 (HTTP {api_result["status_code"]})',
                 'post_url': axa_api_url,
                 'post_request': payload,
-                'details': response.text[:1000],
-                'status_code': response.status_code
+                'details': api_result['body'][:1000],
+                'status_code': api_result['status_code']
             }, status=status.HTTP_502_BAD_GATEWAY)
 
+        for key, value in cache_status_headers(api_result, cache_status).items():
+            response[key] = value
+        return response
+
     except requests.exceptions.Timeout:
         return Response({
             'status': 'error',
@@ -256,6 +271,122 @@ def calculate_withdrawal(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def simulate_withdrawal(request):
+    """
+    本地模拟提取方案（无需调用安盛API，毫秒级返回）
+    基于已存储的预测数据向量化计算多个方案，供前端滑块实时预览；
+    最终结果请用 calculate_withdrawal 调用安盛API确认
+
+    请求体（三选一的数据来源）:
+        product_id: InsuranceProduct ID（使用其标准退保价值表）
+        document_id: PlanDocument ID（table1为基本计划，table2用于校准）
+        projection: md*.json 格式的投影数据
+        projection_file: 上传的 md*.json 文件（multipart，此时 scenarios 为JSON字符串）
+
+        premium: 每期保费（可选，仅 product_id 时按产品年缴金额等比例缩放）
+        scenarios: 提取方案列表，例如
+            [{"amount": 10000, "start_year": 5, "end_year": 138, "growth_rate": 0}]
+            或 [{"amounts": {"5": 10000, "6": 12000}}]
+    """
+    from .models import InsuranceProduct, PlanDocument
+    from .withdrawal_simulator import (
+        WithdrawalSimulator, result_to_columns, MAX_SCENARIOS, MD_BASE_COLUMNS, MD_WITHDRAWAL_COLUMNS
+    )
+    from .projection_parser import parse_projections_file
+
+    try:
+        scenarios = request.data.get('scenarios')
+        if isinstance(scenarios, str):
+            try:
+                scenarios = json.loads(scenarios)
+            except json.JSONDecodeError:
+                scenarios = None
+        if not scenarios:
+            # 兼容 calculate_withdrawal 的单方案参数
+            scenarios = [{
+                'amount': request.data.get('withdrawal_amount', 10000),
+                'start_year': request.data.get('start_year', 5),
+                'end_year': request.data.get('end_year', 138),
+            }]
+        if not isinstance(scenarios, list) or len(scenarios) > MAX_SCENARIOS:
+            return Response({
+                'status': 'error',
+                'message': f'scenarios 必须是列表，且最多 {MAX_SCENARIOS} 个方案'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        premium_scale = 1.0
+        product_id = request.data.get('product_id')
+        document_id = request.data.get('document_id')
+        projection = request.data.get('projection')
+        projection_file = request.FILES.get('projection_file')
+
+        if product_id:
+            try:
+                product = InsuranceProduct.objects.get(id=product_id, is_active=True)
+            except InsuranceProduct.DoesNotExist:
+                return Response({
+                    'status': 'error',
+                    'message': f'产品 {product_id} 不存在'
+                }, status=status.HTTP_404_NOT_FOUND)
+            simulator = WithdrawalSimulator.from_product(product)
+            premium = request.data.get('premium')
+            if premium and product.annual_premium:
+                premium_scale = float(premium) / float(product.annual_premium)
+        elif document_id:
+            try:
+                doc = PlanDocument.objects.only('id', 'table1', 'table2').get(id=document_id, user=request.user)
+            except PlanDocument.DoesNotExist:
+                return Response({
+                    'status': 'error',
+                    'message': f'文档 {document_id} 不存在'
+                }, status=status.HTTP_404_NOT_FOUND)
+            simulator = WithdrawalSimulator.from_plan_document(doc)
+        elif projection:
+            simulator = WithdrawalSimulator.from_md_projection(projection)
+        elif projection_file:
+            projections = parse_projections_file(
+                projection_file,
+                options=[[], ['Withdrawal']],
+                columns=set(MD_BASE_COLUMNS.values()) | set(MD_WITHDRAWAL_COLUMNS.values())
+            )
+            simulator = WithdrawalSimulator.from_projection_set(projections)
+        else:
+            return Response({
+                'status': 'error',
+                'message': '请提供 product_id、document_id、projection 或 projection_file'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        schedules = simulator.build_schedules(scenarios)
+        result = simulator.simulate(schedules, premium_scale=premium_scale)
+
+        return Response({
+            'status': 'success',
+            'source': 'local_simulation',
+            'calibrated': simulator.calibration is not None,
+            'policy_year': [int(y) for y in simulator.policy_year],
+            'scenarios': result_to_columns(result),
+            'message': '本地模拟结果仅供参考，请以保险公司计算结果为准'
+        })
+
+    except (ValueError, TypeError, KeyError) as e:
+        return Response({
+            'status': 'error',
+            'message': f'参数或数据错误: {str(e)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    except Exception as e:
+        print(f"本地模拟失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
+
+        return Response({
+            'status': 'error',
+            'message': f'服务器错误: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def analyze_axa_benefit(request):
@@ -447,12 +578,12 @@ def analyze_axa_benefit(request):
         print(f"保费: {premium}, 提取金额: {withdrawal_amount}")
         print(f"请求头: {headers}")
 
-        response = requests.post(
+        response = insurer_request(
+            'POST',
             axa_api_url,
+            insurer='axa',
             json=payload,
-            headers=headers,
-            timeout=30,
-            verify=True  # 验证SSL证书
+            headers=headers
         )
 
         print(f"安盛API响应状态: {response.status_code}")
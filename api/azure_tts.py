@@ -0,0 +1,319 @@
+"""
+Azure 语音合成
+长文本按句子切分为若干段，由进程内的 SpeechSynthesizer 池并发合成，
+MP3 音频按顺序拼接，各段的字幕时间按前面各段的音频时长平移；单段失败时重试该段，不影响其他段。
+流式合成时第一段通过 PullAudioOutputStream 边合成边输出，后面各段同时预先合成
+"""
+import os
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+import azure.cognitiveservices.speech as speechsdk
+from dotenv import load_dotenv
+from .tts_text import split_text
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Azure配置
+AZURE_SPEECH_KEY = os.getenv('AZURE_SPEECH_KEY')
+AZURE_SPEECH_REGION = os.getenv('AZURE_SPEECH_REGION')
+
+# 固定码率 MP3（24kHz 48kbps，每帧 144 字节 / 24 毫秒，没有填充位），
+# 各段直接拼接即可播放，音频时长可由字节数精确算出
+OUTPUT_FORMAT = speechsdk.SpeechSynthesisOutputFormat.Audio24Khz48KBitRateMonoMp3
+MP3_BYTES_PER_MS = 48000 / 8 / 1000
+
+# 每段最多字符数（不超过该长度的文本不切分）
+CHUNK_MAX_CHARS = 500
+
+# 单个请求最多同时合成的段数
+MAX_PARALLEL_CHUNKS = 4
+
+# 每段最多尝试次数
+MAX_CHUNK_ATTEMPTS = 2
+
+# 流式合成每次从音频流读取的字节数（约 0.5 秒音频）
+STREAM_READ_SIZE = 3000
+
+class SynthesisError(Exception):
+    """Azure 合成失败（取消或返回错误）"""
+
+
+def get_max_concurrency():
+    """进程内同时进行的 Azure 合成数（合成器池大小）"""
+    return getattr(settings, 'AZURE_TTS_MAX_CONCURRENCY', 8)
+
+
+def _ssml_prefix(voice_id, rate, pitch):
+    return (
+        "<speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xml:lang='zh-CN'>"
+        f"<voice name='{voice_id}'><prosody rate='{rate}' pitch='{pitch}'>"
+    )
+
+
+SSML_SUFFIX = "</prosody></voice></speak>"
+
+
+class _PooledSynthesizer:
+    """池中的合成器：输出到内存，词边界事件写入当前段的列表"""
+
+    def __init__(self):
+        speech_config = speechsdk.SpeechConfig(subscription=AZURE_SPEECH_KEY, region=AZURE_SPEECH_REGION)
+        speech_config.set_speech_synthesis_output_format(OUTPUT_FORMAT)
+        self.synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+        self.boundaries = []
+        self.synthesizer.synthesis_word_boundary.connect(self._on_word_boundary)
+
+    def _on_word_boundary(self, evt):
+        self.boundaries.append(evt)
+
+    def speak(self, ssml):
+        self.boundaries = []
+        return self.synthesizer.speak_ssml_async(ssml).get()
+
+
+class _SynthesizerPool:
+    """
+    合成器池：空闲的合成器放回复用（保留与 Azure 的连接），
+    信号量限制同时使用的合成器数，即进程内的 Azure 并发数
+    """
+
+    def __init__(self, size):
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = queue.LifoQueue()
+
+    def acquire(self):
+        self.slots.acquire()
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return _PooledSynthesizer()
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, synthesizer):
+        self.idle.put(synthesizer)
+        self.slots.release()
+
+    def discard(self):
+        """合成出错的合成器不再放回（下次重新创建）"""
+        self.slots.release()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _SynthesizerPool(get_max_concurrency())
+        return _pool
+
+
+def _synthesize_chunk(chunk_offset, chunk_text, voice_id, rate, pitch):
+    """
+    合成一段文本
+
+    Returns:
+        tuple: (MP3 字节, 字幕列表)，字幕时间相对本段开头，text_offset 已换算为在全文中的位置
+    """
+    prefix = _ssml_prefix(voice_id, rate, pitch)
+    ssml = f"{prefix}{chunk_text}{SSML_SUFFIX}"
+    pool = _get_pool()
+    error_msg = '语音合成失败'
+
+    for attempt in range(1, MAX_CHUNK_ATTEMPTS + 1):
+        synthesizer = pool.acquire()
+        try:
+            result = synthesizer.speak(ssml)
+            boundaries = synthesizer.boundaries
+        except Exception as e:
+            pool.discard()
+            error_msg = f"语音合成失败: {str(e)}"
+            logger.warning(f"⚠️ 第{attempt}次合成失败（偏移 {chunk_offset}）: {error_msg}")
+            continue
+
+        if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
+            pool.release(synthesizer)
+            subtitle_data = [{
+                'text': evt.text,
+                'audio_offset': evt.audio_offset / 10000,  # 转换为毫秒
+                'duration': evt.duration.total_seconds() * 1000 if evt.duration else 0,
+                'word_length': evt.word_length,
+                'text_offset': chunk_offset + evt.text_offset - len(prefix) if evt.text_offset >= len(prefix) else evt.text_offset,
+                'boundary_type': evt.boundary_type.name
+            } for evt in boundaries]
+            return result.audio_data, subtitle_data
+
+        pool.discard()
+        error_msg = '语音合成失败'
+        if result.reason == speechsdk.ResultReason.Canceled:
+            cancellation = result.cancellation_details
+            error_msg = f"语音合成失败: {cancellation.reason}"
+            if cancellation.reason == speechsdk.CancellationReason.Error:
+                error_msg += f" - {cancellation.error_details}"
+        logger.warning(f"⚠️ 第{attempt}次合成失败（偏移 {chunk_offset}）: {error_msg}")
+
+    raise SynthesisError(error_msg)
+
+
+def _stream_chunk(chunk_offset, chunk_text, voice_id, rate, pitch, on_audio, on_cues):
+    """
+    边合成边输出一段文本（单独创建输出到 PullAudioOutputStream 的合成器，不重试）
+
+    Returns:
+        tuple: (MP3 字节, 字幕列表)
+    """
+    prefix = _ssml_prefix(voice_id, rate, pitch)
+    speech_config = speechsdk.SpeechConfig(subscription=AZURE_SPEECH_KEY, region=AZURE_SPEECH_REGION)
+    speech_config.set_speech_synthesis_output_format(OUTPUT_FORMAT)
+    pull_stream = speechsdk.audio.PullAudioOutputStream()
+    synthesizer = speechsdk.SpeechSynthesizer(
+        speech_config=speech_config,
+        audio_config=speechsdk.audio.AudioOutputConfig(stream=pull_stream)
+    )
+
+    subtitle_data = []
+
+    def word_boundary_cb(evt):
+        item = {
+            'text': evt.text,
+            'audio_offset': evt.audio_offset / 10000,  # 转换为毫秒
+            'duration': evt.duration.total_seconds() * 1000 if evt.duration else 0,
+            'word_length': evt.word_length,
+            'text_offset': chunk_offset + evt.text_offset - len(prefix) if evt.text_offset >= len(prefix) else evt.text_offset,
+            'boundary_type': evt.boundary_type.name
+        }
+        subtitle_data.append(item)
+        on_cues([item])
+
+    synthesizer.synthesis_word_boundary.connect(word_boundary_cb)
+    future = synthesizer.speak_ssml_async(f"{prefix}{chunk_text}{SSML_SUFFIX}")
+
+    # read 在有数据前阻塞，合成结束后返回 0
+    audio_parts = []
+    buffer = bytes(STREAM_READ_SIZE)
+    while True:
+        size = pull_stream.read(buffer)
+        if not size:
+            break
+        audio_parts.append(buffer[:size])
+        on_audio(buffer[:size])
+
+    result = future.get()
+    if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
+        error_msg = '语音合成失败'
+        if result.reason == speechsdk.ResultReason.Canceled:
+            cancellation = result.cancellation_details
+            error_msg = f"语音合成失败: {cancellation.reason}"
+            if cancellation.reason == speechsdk.CancellationReason.Error:
+                error_msg += f" - {cancellation.error_details}"
+        raise SynthesisError(error_msg)
+    return b''.join(audio_parts), subtitle_data
+
+
+def stream_text(text, voice_id, rate, pitch, on_audio, on_cues):
+    """
+    流式合成：第一段边合成边通过 on_audio / on_cues 输出，后面各段同时预先合成，按顺序输出
+
+    Args:
+        on_audio: 回调，参数为 MP3 字节块
+        on_cues: 回调，参数为字幕列表（audio_offset 为在完整音频中的毫秒数）
+
+    Returns:
+        tuple: (完整 MP3 字节, 完整字幕列表)
+
+    Raises:
+        SynthesisError: 合成失败
+    """
+    chunks = split_text(text, CHUNK_MAX_CHARS)
+    executor = None
+    futures = []
+    if len(chunks) > 1:
+        executor = ThreadPoolExecutor(
+            max_workers=min(len(chunks) - 1, MAX_PARALLEL_CHUNKS),
+            thread_name_prefix='azure-tts'
+        )
+    try:
+        futures = [
+            executor.submit(_synthesize_chunk, chunk_offset, chunk_text, voice_id, rate, pitch)
+            for chunk_offset, chunk_text in chunks[1:]
+        ]
+
+        # 第一段单独创建合成器，也占用进程内的并发名额
+        pool = _get_pool()
+        pool.slots.acquire()
+        try:
+            first_audio, subtitle_data = _stream_chunk(*chunks[0], voice_id, rate, pitch, on_audio, on_cues)
+        finally:
+            pool.slots.release()
+
+        audio_parts = [first_audio]
+        elapsed_ms = len(first_audio) / MP3_BYTES_PER_MS
+        for future in futures:
+            audio_data, chunk_subtitles = future.result()
+            for item in chunk_subtitles:
+                item['audio_offset'] += elapsed_ms
+            on_cues(chunk_subtitles)
+            on_audio(audio_data)
+            subtitle_data.extend(chunk_subtitles)
+            audio_parts.append(audio_data)
+            elapsed_ms += len(audio_data) / MP3_BYTES_PER_MS
+    finally:
+        for future in futures:
+            future.cancel()
+        if executor:
+            executor.shutdown(wait=False)
+    return b''.join(audio_parts), subtitle_data
+
+
+def synthesize_text(text, voice_id, rate, pitch):
+    """
+    合成文本（长文本分段并发合成后拼接）
+
+    Returns:
+        tuple: (MP3 字节, 字幕列表)，字幕的 audio_offset 为在完整音频中的毫秒数
+
+    Raises:
+        SynthesisError: 某段重试后仍然失败
+    """
+    chunks = split_text(text, CHUNK_MAX_CHARS)
+    if len(chunks) == 1:
+        return _synthesize_chunk(*chunks[0], voice_id, rate, pitch)
+
+    executor = ThreadPoolExecutor(
+        max_workers=min(len(chunks), MAX_PARALLEL_CHUNKS),
+        thread_name_prefix='azure-tts'
+    )
+    futures = []
+    try:
+        futures = [
+            executor.submit(_synthesize_chunk, chunk_offset, chunk_text, voice_id, rate, pitch)
+            for chunk_offset, chunk_text in chunks
+        ]
+        results = [future.result() for future in futures]
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+    audio_parts = []
+    subtitle_data = []
+    elapsed_ms = 0
+    for audio_data, chunk_subtitles in results:
+        for item in chunk_subtitles:
+            item['audio_offset'] += elapsed_ms
+            subtitle_data.append(item)
+        audio_parts.append(audio_data)
+        elapsed_ms += len(audio_data) / MP3_BYTES_PER_MS
+    logger.info(f"🔊 长文本分 {len(chunks)} 段合成完成，共 {elapsed_ms / 1000:.1f} 秒")
+    return b''.join(audio_parts), subtitle_data
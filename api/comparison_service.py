@@ -0,0 +1,219 @@
+"""
+标准退保对比快照服务
+按缴费年期预先物化 get_companies_standard_comparison 的完整结果（含逐年排名），
+存入缓存（Redis），并通过版本号在产品/公司变更时失效
+"""
+import json
+import hashlib
+import logging
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# 缓存键
+VERSION_CACHE_KEY = 'standard_comparison:version'
+SNAPSHOT_CACHE_KEY = 'standard_comparison:snapshot:{payment_period}'
+
+# 快照缓存时长（秒）- 正常情况下由版本号失效，这里只是兜底
+SNAPSHOT_TIMEOUT = 24 * 60 * 60
+
+
+def parse_surrender_table(raw):
+    """
+    解析 InsuranceProduct.surrender_value_table
+
+    支持两种格式：
+        格式1: 列表格式 [{"policy_year": 1, ...}, ...]
+        格式2: 字典格式 {"standard": [...]}
+
+    Returns:
+        dict: {'standard': [...]}，无有效数据时返回 None
+    """
+    if not raw:
+        return None
+    try:
+        surrender_table = json.loads(raw)
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+    if isinstance(surrender_table, list) and len(surrender_table) > 0:
+        return {'standard': surrender_table}
+    if isinstance(surrender_table, dict) and isinstance(surrender_table.get('standard'), list) \
+            and len(surrender_table['standard']) > 0:
+        return surrender_table
+    return None
+
+
+def get_comparison_version():
+    """获取当前快照版本号"""
+    return cache.get(VERSION_CACHE_KEY) or 0
+
+
+def invalidate_comparison_snapshots():
+    """
+    递增快照版本号，使所有年期的快照失效
+    下一次读取时会按新版本重建
+    """
+    try:
+        version = cache.incr(VERSION_CACHE_KEY)
+    except ValueError:
+        # 版本键不存在（首次或缓存被清空）
+        if not cache.add(VERSION_CACHE_KEY, 1, timeout=None):
+            version = cache.incr(VERSION_CACHE_KEY)
+        else:
+            version = 1
+    logger.info(f"🔄 标准对比快照版本已更新: v{version}")
+    return version
+
+
+def _build_rankings(products_data):
+    """
+    计算逐年排名：按总现金价值从高到低排列产品ID
+
+    Returns:
+        dict: {"<policy_year>": [product_id, ...]}
+    """
+    totals_by_year = {}
+    for product in products_data:
+        for row in product['standard_data']['standard']:
+            if not isinstance(row, dict):
+                continue
+            year = row.get('policy_year', row.get('year'))
+            total = row.get('total')
+            if year is None or total is None:
+                continue
+            try:
+                totals_by_year.setdefault(int(year), []).append((float(total), product['product_id']))
+            except (TypeError, ValueError):
+                continue
+
+    return {
+        str(year): [product_id for _, product_id in sorted(entries, key=lambda e: (-e[0], e[1]))]
+        for year, entries in sorted(totals_by_year.items())
+    }
+
+
+def build_comparison_snapshot(payment_period, version=None):
+    """
+    构建指定缴费年期的对比快照（一次查询取出该年期全部产品）
+
+    Returns:
+        dict: {
+            'version': int,
+            'payment_period': int,
+            'etag': str,
+            'data': [...],      # 与接口返回的公司列表格式一致
+            'rankings': {...}   # 逐年排名
+        }
+    """
+    from .models import InsuranceProduct
+
+    if version is None:
+        version = get_comparison_version()
+
+    products = InsuranceProduct.objects.filter(
+        payment_period=payment_period,
+        is_active=True,
+        company__is_active=True
+    ).select_related('company').order_by('company__sort_order', 'company_id', 'sort_order', 'id')
+
+    company_list = []
+    company_index = {}
+    all_products = []
+    for product in products:
+        standard_data = parse_surrender_table(product.surrender_value_table)
+        if standard_data is None:  # 只添加有数据的产品
+            continue
+
+        product_data = {
+            'product_id': product.id,
+            'product_name': product.product_name,
+            'standard_data': standard_data
+        }
+        all_products.append(product_data)
+
+        company = product.company
+        company_data = company_index.get(company.id)
+        if company_data is None:
+            company_data = {
+                'id': company.id,
+                'code': company.code,
+                'name': company.name,
+                'name_en': company.name_en,
+                'icon': company.icon,
+                'color_gradient': company.color_gradient,
+                'bg_color': company.bg_color,
+                'flagship_product': company.flagship_product or '',
+                'has_data': True,
+                'payment_period': payment_period,
+                'products': []
+            }
+            company_index[company.id] = company_data
+            company_list.append(company_data)
+        company_data['products'].append(product_data)
+
+    for company_data in company_list:
+        if len(company_data['products']) > 1:
+            company_data['has_multiple_products'] = True
+
+    rankings = _build_rankings(all_products)
+
+    # ETag基于内容计算：内容不变时即使版本号变化，客户端仍可获得304
+    digest = hashlib.sha1(
+        json.dumps([company_list, rankings], ensure_ascii=False, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+
+    return {
+        'version': version,
+        'payment_period': payment_period,
+        'etag': f'sc{payment_period}-{digest[:20]}',
+        'data': company_list,
+        'rankings': rankings
+    }
+
+
+def get_comparison_snapshot(payment_period):
+    """
+    读取对比快照：一次缓存往返同时取版本号和快照，版本不一致时重建
+    """
+    snapshot_key = SNAPSHOT_CACHE_KEY.format(payment_period=payment_period)
+    cached = cache.get_many([VERSION_CACHE_KEY, snapshot_key])
+    version = cached.get(VERSION_CACHE_KEY) or 0
+    snapshot = cached.get(snapshot_key)
+
+    if snapshot is not None and snapshot.get('version') == version:
+        return snapshot
+
+    logger.info(f"📦 重建标准对比快照: payment_period={payment_period}, v{version}")
+    snapshot = build_comparison_snapshot(payment_period, version=version)
+    cache.set(snapshot_key, snapshot, timeout=SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def filter_snapshot(snapshot, selected_product_ids):
+    """
+    按用户选择的产品ID过滤快照（不修改缓存中的快照）
+
+    Returns:
+        tuple: (company_list, rankings)
+    """
+    if not selected_product_ids:
+        return snapshot['data'], snapshot['rankings']
+
+    selected = set(selected_product_ids)
+    company_list = []
+    for company_data in snapshot['data']:
+        products = [p for p in company_data['products'] if p['product_id'] in selected]
+        if not products:
+            continue
+        filtered = {k: v for k, v in company_data.items() if k not in ('products', 'has_multiple_products')}
+        filtered['products'] = products
+        if len(products) > 1:
+            filtered['has_multiple_products'] = True
+        company_list.append(filtered)
+
+    rankings = {
+        year: [pid for pid in product_ids if pid in selected]
+        for year, product_ids in snapshot['rankings'].items()
+    }
+    return company_list, rankings
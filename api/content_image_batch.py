@@ -0,0 +1,200 @@
+"""
+文案配图批量生成
+一次请求生成多张配图（不同风格 / 纵横比）：提交时一次性预留全部额度（一个 QuotaReservation），
+并发调用 Gemini REST API（进程内按用户和全局限制并发数），
+每张图片完成即返回一条结果，失败或未执行的图片退还额度
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from . import quota_ledger
+
+logger = logging.getLogger(__name__)
+
+# 单次批量最多生成的图片数
+MAX_BATCH_SIZE = 9
+
+
+def get_max_concurrency():
+    return getattr(settings, 'GEMINI_MAX_CONCURRENCY', 24)
+
+
+def get_max_concurrency_per_user():
+    return getattr(settings, 'GEMINI_MAX_CONCURRENCY_PER_USER', 9)
+
+
+_global_semaphore = None
+_user_semaphores = weakref.WeakValueDictionary()
+_semaphores_lock = threading.Lock()
+
+
+def _get_semaphores(user_id):
+    """获取全局信号量和用户信号量（用户信号量在该用户没有进行中的批量请求时自动回收）"""
+    global _global_semaphore
+    with _semaphores_lock:
+        if _global_semaphore is None:
+            _global_semaphore = threading.BoundedSemaphore(get_max_concurrency())
+        user_semaphore = _user_semaphores.get(user_id)
+        if user_semaphore is None:
+            user_semaphore = threading.BoundedSemaphore(get_max_concurrency_per_user())
+            _user_semaphores[user_id] = user_semaphore
+        return _global_semaphore, user_semaphore
+
+
+class _BatchReservation:
+    """
+    整批共用的额度预留：每张图片失败或取消时退还1次，
+    所有图片都有结果后结算剩余部分（最后一个完成的线程负责结算）
+    """
+
+    def __init__(self, reservation_id, count):
+        self.reservation_id = reservation_id
+        self.outstanding = count
+        self.succeeded = 0
+        self.lock = threading.Lock()
+
+    def settle(self, succeeded, count=1):
+        if not succeeded:
+            quota_ledger.release(self.reservation_id, count)
+        with self.lock:
+            self.outstanding -= count
+            if succeeded:
+                self.succeeded += count
+            finished = self.outstanding == 0
+        # 全部失败时预留已在最后一次退还中变为 released，无需结算
+        if finished and self.succeeded:
+            quota_ledger.commit(self.reservation_id)
+
+
+def _generate_one(user, item, content, api_key, api_url, host, include_ip_image, ip_image_url,
+                  ip_image_data, related_ip_image_id, global_semaphore, user_semaphore, batch_reservation):
+    """生成单张配图并记录结果（在工作线程中调用），失败时退还1次额度"""
+    from .ip_image_views import generate_content_image_with_rest_api
+    from .models import GeminiUsage
+    from .utils.image_storage import save_to_media_library
+
+    started = time.monotonic()
+    result = {
+        'image_index': item['image_index'],
+        'aspect_ratio': item['aspect_ratio'],
+        'success': False,
+        'image_url': None,
+        'prompt': None,
+        'media_id': None,
+        'error_message': '',
+    }
+    try:
+        # 先占用户配额再占全局配额，避免单个用户排队时占住全局名额
+        with user_semaphore, global_semaphore:
+            generated_image_path, used_prompt = generate_content_image_with_rest_api(
+                content,
+                item['image_index'],
+                api_key,
+                api_url,
+                user.username,
+                include_ip_image,
+                ip_image_url,
+                item['aspect_ratio'],
+                ip_image_data=ip_image_data
+            )
+        if not generated_image_path:
+            raise Exception('未返回图片数据')
+
+        image_url = f"https://{host}/media/ip_images/{os.path.basename(generated_image_path)}"
+        GeminiUsage.objects.create(
+            user=user,
+            generation_type='content_image',
+            prompt=used_prompt[:500],
+            success=True
+        )
+        media = save_to_media_library(
+            user=user,
+            media_type='content_image',
+            original_url=image_url,
+            prompt=content[:500],
+            related_ip_image_id=related_ip_image_id
+        )
+        result.update({
+            'success': True,
+            'image_url': image_url,
+            'prompt': used_prompt,
+            'media_id': media.id if media else None,
+        })
+    except Exception as e:
+        logger.error(f"❌ 批量配图第{item['image_index']}张生成失败: {str(e)}")
+        result['error_message'] = f'生成失败: {str(e)}'
+        try:
+            GeminiUsage.objects.create(
+                user=user,
+                generation_type='content_image',
+                prompt=content[:500],
+                success=False,
+                error_message=str(e)[:500]
+            )
+        except Exception as db_error:
+            logger.error(f"❌ 批量配图失败记录写入失败: {str(db_error)}")
+    finally:
+        try:
+            batch_reservation.settle(result['success'])
+        finally:
+            # 工作线程结束后不会被 Django 请求周期回收，主动关闭数据库连接
+            connection.close()
+    result['elapsed_ms'] = int((time.monotonic() - started) * 1000)
+    return result
+
+
+def _generate_indexed(index, *args):
+    result = _generate_one(*args)
+    result['index'] = index
+    return result
+
+
+async def run_content_image_batch(user, items, reservation_id, content, api_key, api_url, host,
+                                  include_ip_image=False, ip_image_url='', ip_image_data=None,
+                                  related_ip_image_id=None):
+    """
+    并发生成一组配图，按完成顺序逐个产出结果（异步生成器，供 ASGI 下的流式响应直接消费）
+
+    Args:
+        items: [{'image_index': 1, 'aspect_ratio': '9:16'}, ...]
+        reservation_id: 调用前为整批预留的 QuotaReservation（每张图片1次）
+
+    生成器被提前关闭（客户端断开）时取消尚未开始的图片并退还其额度，
+    已开始的图片继续完成并保存到素材库
+
+    Yields:
+        dict: {index, image_index, aspect_ratio, success, image_url, prompt, media_id, error_message, elapsed_ms}
+    """
+    if not items:
+        return
+
+    batch_reservation = _BatchReservation(reservation_id, len(items))
+    global_semaphore, user_semaphore = _get_semaphores(user.id)
+    executor = ThreadPoolExecutor(
+        max_workers=min(len(items), get_max_concurrency_per_user()),
+        thread_name_prefix='content-image-batch'
+    )
+    futures = []
+    try:
+        for index, item in enumerate(items):
+            futures.append(executor.submit(
+                _generate_indexed, index, user, item, content, api_key, api_url, host, include_ip_image,
+                ip_image_url, ip_image_data, related_ip_image_id, global_semaphore, user_semaphore,
+                batch_reservation
+            ))
+        # 事件循环通过 asyncio.wrap_future 等待结果，不占用线程
+        for next_result in asyncio.as_completed([asyncio.wrap_future(future) for future in futures]):
+            yield await next_result
+    finally:
+        cancelled = sum(1 for future in futures if future.cancel())
+        executor.shutdown(wait=False)
+        if cancelled:
+            await sync_to_async(batch_reservation.settle)(False, cancelled)
+            logger.info(f"↩️ 批量配图已取消 {cancelled} 张，退还额度")
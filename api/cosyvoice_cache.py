@@ -0,0 +1,211 @@
+"""
+CosyVoice 个人语音合成缓存
+整段结果按 (模型, voice_id, 文本, 语速, 音调) 的哈希保存为 media/tts/tts_<哈希>.mp3，相同请求直接返回；
+并发的相同请求只合成一次（进程内合并 + 跨进程 Redis 锁）。
+多句文本按句合成，每句的音频也按哈希单独缓存：修改其中一句时只重新合成这一句，其余句子复用后按顺序拼接
+"""
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from . import tts_cache
+from .tts_text import split_sentences
+
+logger = logging.getLogger(__name__)
+
+ENGINE = 'cosyvoice'
+SEGMENT_ENGINE = 'cosyvoice-segment'
+
+# 单句最多字符数（超过时按逗号等切分）
+SEGMENT_MAX_CHARS = 200
+
+LOCK_KEY = 'cosyvoice_synthesis:lock:{key}'
+
+# 跨进程锁的最长持有时间（秒），应大于整段合成的最长耗时
+LOCK_TIMEOUT = 300
+# 等待其他进程结果时的轮询间隔（秒）
+POLL_INTERVAL = 0.2
+
+# 缓存状态
+CACHE_HIT = 'HIT'
+CACHE_MISS = 'MISS'
+CACHE_COALESCED = 'COALESCED'  # 等待了另一个相同的进行中请求
+
+
+def get_max_concurrency():
+    """单个请求同时合成的句子数"""
+    return getattr(settings, 'COSYVOICE_MAX_CONCURRENCY', 4)
+
+
+def synthesis_key(model, voice_id, text, rate, pitch):
+    return tts_cache.cache_key(ENGINE, model=model, voice=voice_id, text=text, rate=rate, pitch=pitch)
+
+
+def _segment_key(model, voice_id, text, rate, pitch):
+    return tts_cache.cache_key(SEGMENT_ENGINE, model=model, voice=voice_id, text=text, rate=rate, pitch=pitch)
+
+
+def lookup(key):
+    """已缓存时返回音频文件名（并更新修改时间），否则返回 None"""
+    filenames = tts_cache.lookup(key, ('mp3',))
+    return filenames['mp3'] if filenames else None
+
+
+def store_audio(key, audio_data):
+    """保存音频（先写唯一的临时文件再替换，并发保存同一条目互不干扰），返回文件名"""
+    filenames = tts_cache.entry_filenames(key, ('mp3',))
+    tts_cache.write_file(filenames['mp3'], audio_data)
+    tts_cache.record_usage(filenames)
+    return filenames['mp3']
+
+
+def _read_audio(filename):
+    with open(os.path.join(tts_cache.get_tts_dir(), filename), 'rb') as f:
+        return f.read()
+
+
+def _synthesize_segment(synthesize, model, voice_id, text, rate, pitch):
+    """
+    合成一句（已缓存时直接读取）
+
+    Returns:
+        tuple: (MP3 字节, 是否复用)
+    """
+    key = _segment_key(model, voice_id, text, rate, pitch)
+    filename = lookup(key)
+    if filename:
+        try:
+            return _read_audio(filename), True
+        except FileNotFoundError:
+            pass
+    audio_data = synthesize(text)
+    if not audio_data:
+        raise Exception("语音合成返回空数据")
+    store_audio(key, audio_data)
+    return audio_data, False
+
+
+def _synthesize_by_segments(synthesize, model, voice_id, text, rate, pitch):
+    """
+    按句合成并拼接（只有一句时直接合成整段）
+
+    Returns:
+        tuple: (MP3 字节, 句子总数, 复用的句子数)
+    """
+    segments = [segment for segment in split_sentences(text, SEGMENT_MAX_CHARS) if segment.strip()]
+    if len(segments) <= 1:
+        audio_data = synthesize(text)
+        if not audio_data:
+            raise Exception("语音合成返回空数据")
+        return audio_data, 1, 0
+
+    with ThreadPoolExecutor(
+        max_workers=min(len(segments), get_max_concurrency()),
+        thread_name_prefix='cosyvoice'
+    ) as executor:
+        futures = [
+            executor.submit(_synthesize_segment, synthesize, model, voice_id, segment.strip(), rate, pitch)
+            for segment in segments
+        ]
+        try:
+            results = [future.result() for future in futures]
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+    reused = sum(1 for _, hit in results if hit)
+    # MP3 由独立的帧组成，各句音频按顺序直接拼接
+    return b''.join(audio_data for audio_data, _ in results), len(segments), reused
+
+
+class _Flight:
+    """进程内进行中的合成"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _wait_for_remote(key, lock_key, deadline):
+    """等待其他进程保存结果；锁释放但没有结果（对方失败）时返回 None"""
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        filename = lookup(key)
+        if filename:
+            return filename
+        if cache.get(lock_key) is None:
+            return lookup(key)
+    return None
+
+
+def _synthesize_and_store(key, synthesize, model, voice_id, text, rate, pitch):
+    """跨进程单飞：拿到锁的进程合成并保存，其余进程等待结果"""
+    lock_key = LOCK_KEY.format(key=key)
+    acquired = cache.add(lock_key, 1, timeout=LOCK_TIMEOUT)
+    if not acquired:
+        filename = _wait_for_remote(key, lock_key, time.monotonic() + LOCK_TIMEOUT)
+        if filename:
+            return filename, CACHE_COALESCED
+        # 对方失败：自己合成
+
+    try:
+        audio_data, total, reused = _synthesize_by_segments(synthesize, model, voice_id, text, rate, pitch)
+        filename = store_audio(key, audio_data)
+        logger.info(f"💾 个人语音合成已缓存: {filename}, 共 {total} 句，复用 {reused} 句")
+        return filename, CACHE_MISS
+    finally:
+        if acquired:
+            cache.delete(lock_key)
+
+
+def cached_synthesis(synthesize, model, voice_id, text, rate='0%', pitch='0%'):
+    """
+    带缓存和单飞的个人语音合成
+
+    Args:
+        synthesize: 函数，参数为一段文本，返回 MP3 字节（调用 CosyVoice）
+        model, voice_id, text, rate, pitch: 缓存键组成部分
+
+    Returns:
+        tuple: (音频文件名, 缓存状态)
+    """
+    key = synthesis_key(model, voice_id, text, rate, pitch)
+    filename = lookup(key)
+    if filename:
+        return filename, CACHE_HIT
+
+    # 进程内单飞：同一进程的并发相同请求等待第一个完成
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        flight.event.wait(timeout=LOCK_TIMEOUT)
+        if flight.result is not None:
+            return flight.result[0], CACHE_COALESCED
+        if flight.error is not None:
+            raise flight.error
+        # 等待超时：自己合成
+
+    try:
+        flight.result = _synthesize_and_store(key, synthesize, model, voice_id, text, rate, pitch)
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        if leader:
+            flight.event.set()
+            with _flights_lock:
+                _flights.pop(key, None)
@@ -0,0 +1,214 @@
+"""
+利益演示网格批量请求
+对同一个 InsuranceCompanyRequest 模板按参数网格（如 年龄 × 保费 × 缴费年期）展开，
+通过编译后的请求配置（CompiledRequestConfig）构建请求、send_insurer_request 并发发送，
+按主机限制并发数，结果完成一个返回一个（异步生成器），并规范化为 {"standard": [...]} 退保价值表
+"""
+import time
+import asyncio
+import logging
+import itertools
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+import requests
+from .insurer_request_service import send_insurer_request, parse_response_body
+from .projection_parser import parse_projections_data
+
+logger = logging.getLogger(__name__)
+
+# 网格中单个字段范围展开的最大取值数（防止 step 过小）
+MAX_VALUES_PER_FIELD = 200
+
+
+def get_max_concurrency_per_host():
+    return getattr(settings, 'INSURER_MAX_CONCURRENCY_PER_HOST', 4)
+
+
+def get_max_grid_points():
+    return getattr(settings, 'ILLUSTRATION_SWEEP_MAX_POINTS', 500)
+
+
+def _expand_values(field, spec):
+    """
+    展开单个字段的取值
+
+    支持：
+        列表: [10000, 20000]
+        范围: {"start": 0, "stop": 60, "step": 5}（包含 stop）
+        单值: 30
+    """
+    if isinstance(spec, list):
+        if not spec:
+            raise ValueError(f'参数 {field} 的取值列表为空')
+        return spec
+    if isinstance(spec, dict):
+        try:
+            start = spec['start']
+            stop = spec['stop']
+            step = spec.get('step', 1)
+        except KeyError:
+            raise ValueError(f'参数 {field} 的范围需要包含 start 和 stop')
+        if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (start, stop, step)):
+            raise ValueError(f'参数 {field} 的范围必须为数字')
+        if step <= 0 or stop < start:
+            raise ValueError(f'参数 {field} 的范围无效')
+        count = int((stop - start) // step) + 1
+        if count > MAX_VALUES_PER_FIELD:
+            raise ValueError(f'参数 {field} 的取值过多（{count}），最多 {MAX_VALUES_PER_FIELD} 个')
+        values = [start + i * step for i in range(count)]
+        if all(isinstance(v, int) for v in (start, step)):
+            return values
+        return [round(v, 6) for v in values]
+    return [spec]
+
+
+def expand_grid(parameters, max_points=None):
+    """
+    将参数网格展开为参数组合列表（笛卡尔积，字段顺序保持不变）
+
+    Returns:
+        list[dict]: [{"age": 0, "premium": 10000}, ...]
+
+    Raises:
+        ValueError: 参数格式无效或组合数超过上限
+    """
+    if not isinstance(parameters, dict) or not parameters:
+        raise ValueError('parameters 必须为非空对象')
+    if max_points is None:
+        max_points = get_max_grid_points()
+
+    fields = list(parameters.keys())
+    value_lists = [_expand_values(field, parameters[field]) for field in fields]
+
+    total = 1
+    for values in value_lists:
+        total *= len(values)
+    if total > max_points:
+        raise ValueError(f'参数组合数 {total} 超过上限 {max_points}')
+
+    return [dict(zip(fields, combo)) for combo in itertools.product(*value_lists)]
+
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+
+def get_host_semaphore(url):
+    """
+    获取目标主机的并发信号量（进程内共享，多个网格请求同时运行时也不会超过上限）
+    """
+    host = urlsplit(url).netloc.lower()
+    with _host_semaphores_lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(get_max_concurrency_per_host())
+            _host_semaphores[host] = semaphore
+        return semaphore
+
+
+def normalize_illustration(body):
+    """
+    将保险公司返回的利益演示规范化为 {"standard": [{policy_year, guaranteed, non_guaranteed, total, premiums_paid}]}
+
+    支持：
+        md*.json 格式（projections 中 policyOptions 为空的基本计划投影）
+        已是 {"standard": [...]} 或行列表的格式
+    无法识别时返回 None
+    """
+    if isinstance(body, dict) and isinstance(body.get('projections'), list):
+        try:
+            return parse_projections_data(body, options=[[]]).to_rows('standard')
+        except ValueError:
+            return None
+
+    if isinstance(body, dict) and isinstance(body.get('standard'), list):
+        return {'standard': body['standard']}
+    if isinstance(body, list) and body and all(isinstance(r, dict) for r in body):
+        if any('policy_year' in r or 'year' in r for r in body):
+            return {'standard': body}
+    return None
+
+
+def execute_illustration(prepared, params, timeout):
+    """发送单个利益演示请求并规范化结果（在工作线程中调用，按主机限制并发）"""
+    started = time.monotonic()
+    result = {
+        'params': params,
+        'success': False,
+        'status_code': None,
+        'normalized': None,
+        'error_message': '',
+    }
+    try:
+        with get_host_semaphore(prepared['url']):
+            response = send_insurer_request(prepared, timeout=timeout)
+        result['status_code'] = response.status_code
+        body = parse_response_body(response)
+        if response.ok:
+            normalized = normalize_illustration(body)
+            result['success'] = True
+            # 无法识别格式时保留原始响应，便于排查
+            result['normalized'] = normalized if normalized is not None else {'raw': body}
+        else:
+            result['error_message'] = (body if isinstance(body, str) else str(body))[:1000]
+    except requests.exceptions.Timeout:
+        result['error_message'] = '请求超时'
+    except requests.exceptions.RequestException as e:
+        result['error_message'] = f'网络请求失败: {str(e)}'
+    except ValueError as e:
+        result['error_message'] = str(e)
+    except Exception as e:
+        # 单个网格点的意外错误只记为失败结果，不中断整个网格
+        logger.error(f"❌ 利益演示请求失败 {params}: {str(e)}")
+        result['error_message'] = f'请求失败: {str(e)}'
+    result['elapsed_ms'] = int((time.monotonic() - started) * 1000)
+    return result
+
+
+def _execute_point(index, prepared, params, timeout):
+    result = execute_illustration(prepared, params, timeout)
+    result['index'] = index
+    return result
+
+
+async def run_sweep(compiled, points, base_form_data=None, custom_headers=None,
+                    custom_bearer_token='', timeout=None):
+    """
+    并发执行网格请求，按完成顺序逐个产出结果（异步生成器，供 ASGI 下的流式响应直接消费）
+
+    Args:
+        compiled: CompiledRequestConfig
+
+    请求在调用方线程中构建（预编译模板渲染），线程池只负责发送，
+    事件循环通过 asyncio.wrap_future 等待结果，不占用线程；
+    生成器被提前关闭（客户端断开）时取消尚未开始的请求
+
+    Yields:
+        dict: {index, params, success, status_code, normalized, error_message, elapsed_ms}
+    """
+    base_form_data = base_form_data or {}
+    prepared_points = []
+    for params in points:
+        form_data = {**base_form_data, **params}
+        prepared_points.append(compiled.build(
+            form_data=form_data,
+            custom_headers=custom_headers,
+            custom_bearer_token=custom_bearer_token
+        ))
+
+    if not prepared_points:
+        return
+
+    max_workers = min(len(prepared_points), get_max_concurrency_per_host())
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='illustration-sweep')
+    try:
+        futures = [
+            asyncio.wrap_future(executor.submit(_execute_point, index, prepared, params, timeout))
+            for index, (prepared, params) in enumerate(zip(prepared_points, points))
+        ]
+        for next_result in asyncio.as_completed(futures):
+            yield await next_result
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,321 @@
+"""
+图片生成异步任务
+IP形象 / 文案配图生成请求在提交时预留额度（QuotaReservation）并创建 ImageGenerationJob，
+由 Celery worker 调用 Gemini 生成并保存到素材库，Web 进程立即返回 job_id；
+客户端通过任务状态接口轮询结果（任务状态同时写入 Redis，轮询不查数据库）
+"""
+import os
+import time
+import uuid
+import logging
+import mimetypes
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from . import quota_ledger
+
+logger = logging.getLogger(__name__)
+
+JOB_CACHE_KEY = 'image_job:{job_id}'
+JOB_CACHE_TIMEOUT = 24 * 60 * 60
+
+# 轮询等待任务完成时的检查间隔（秒）
+WAIT_POLL_INTERVAL = 0.5
+
+# 上传照片的临时目录（相对 media 目录）
+UPLOAD_SUBDIR = os.path.join('ip_images', 'uploads')
+
+FINISHED_STATUSES = ('succeeded', 'failed')
+
+# 旧客户端在接口内等待的上限（秒）：等待期间占用一个 worker 线程，超过后返回 202 由客户端轮询
+MAX_SYNC_WAIT_TIMEOUT = 5
+
+
+def get_sync_wait_timeout():
+    """未使用 async 参数的旧客户端在接口内等待任务完成的最长时间（秒，不超过 MAX_SYNC_WAIT_TIMEOUT）"""
+    return min(getattr(settings, 'IMAGE_JOB_SYNC_WAIT_TIMEOUT', MAX_SYNC_WAIT_TIMEOUT), MAX_SYNC_WAIT_TIMEOUT)
+
+
+def _media_root():
+    return os.path.join(settings.BASE_DIR, 'media')
+
+
+def job_snapshot(job):
+    """任务状态（写入缓存、返回给客户端）"""
+    return {
+        'job_id': job.id,
+        'user_id': job.user_id,
+        'generation_type': job.generation_type,
+        'status': job.status,
+        'result': job.result or None,
+        'error_message': job.error_message,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def _publish(job):
+    cache.set(JOB_CACHE_KEY.format(job_id=job.id), job_snapshot(job), timeout=JOB_CACHE_TIMEOUT)
+
+
+def _save_upload(image_file):
+    """保存上传的照片供 worker 读取，返回相对 media 目录的路径"""
+    extension = mimetypes.guess_extension(image_file.content_type) or '.jpg'
+    relative_path = os.path.join(UPLOAD_SUBDIR, f"job_{uuid.uuid4().hex}{extension}")
+    absolute_path = os.path.join(_media_root(), relative_path)
+    os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
+    with open(absolute_path, 'wb') as f:
+        for chunk in image_file.chunks():
+            f.write(chunk)
+    return relative_path
+
+
+def _remove_upload(relative_path):
+    if not relative_path:
+        return
+    try:
+        os.remove(os.path.join(_media_root(), relative_path))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"⚠️ 删除上传照片失败: {relative_path}, {str(e)}")
+
+
+def submit_image_job(user, generation_type, params, image_file=None):
+    """
+    预留额度并提交图片生成任务
+
+    Args:
+        user: 当前用户
+        generation_type: 'ip_image' 或 'content_image'
+        params: 生成参数（必须包含 host，用于生成图片访问URL）
+        image_file: IP形象生成时上传的照片
+
+    Returns:
+        ImageGenerationJob 或 None（额度不足）
+    """
+    from .models import ImageGenerationJob
+    from .tasks import run_image_generation_job_task
+
+    reservation = quota_ledger.reserve(user.id, 1, source=f'image_job:{generation_type}')
+    if reservation is None:
+        return None
+
+    input_image_path = ''
+    try:
+        if image_file is not None:
+            input_image_path = _save_upload(image_file)
+        task_id = str(uuid.uuid4())
+        job = ImageGenerationJob.objects.create(
+            user=user,
+            generation_type=generation_type,
+            params=params,
+            input_image_path=input_image_path,
+            quota_reservation=reservation,
+            celery_task_id=task_id,
+        )
+    except Exception:
+        quota_ledger.release(reservation.id)
+        _remove_upload(input_image_path)
+        raise
+
+    _publish(job)
+    transaction.on_commit(lambda: run_image_generation_job_task.apply_async(args=[job.id], task_id=task_id))
+    logger.info(f"📥 图片生成任务已提交: job={job.id}, user={user.username}, type={generation_type}")
+    return job
+
+
+def get_job_snapshot(job_id, user):
+    """读取任务状态（优先读缓存），不属于该用户时返回 None"""
+    from .models import ImageGenerationJob
+
+    snapshot = cache.get(JOB_CACHE_KEY.format(job_id=job_id))
+    if snapshot is None:
+        job = ImageGenerationJob.objects.filter(id=job_id).first()
+        if job is None:
+            return None
+        snapshot = job_snapshot(job)
+        _publish(job)
+    if snapshot['user_id'] != user.id:
+        return None
+    return snapshot
+
+
+def wait_for_job(job_id, user, timeout):
+    """短暂等待任务完成（供旧的同步客户端使用，见 get_sync_wait_timeout），超时返回当前状态"""
+    deadline = time.monotonic() + timeout
+    snapshot = get_job_snapshot(job_id, user)
+    while snapshot is not None and snapshot['status'] not in FINISHED_STATUSES and time.monotonic() < deadline:
+        time.sleep(WAIT_POLL_INTERVAL)
+        snapshot = get_job_snapshot(job_id, user)
+    return snapshot
+
+
+def _finish(job, status, result, error_message=''):
+    job.status = status
+    job.result = result
+    job.error_message = error_message
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error_message', 'finished_at'])
+    _publish(job)
+
+
+def _settle_reservation(job, succeeded):
+    """结算预留额度：成功时结算，失败时退还（预留状态条件更新保证只处理一次）"""
+    if job.quota_reservation_id is None:
+        return
+    if succeeded:
+        quota_ledger.commit(job.quota_reservation_id)
+    else:
+        quota_ledger.release(job.quota_reservation_id)
+
+
+def _generate_ip_image(job):
+    from .ip_image_views import generate_with_gemini_rest_api
+
+    params = job.params
+    with open(os.path.join(_media_root(), job.input_image_path), 'rb') as f:
+        image_data = f.read()
+    generated_image_path = generate_with_gemini_rest_api(
+        image_data,
+        params['mime_type'],
+        params['prompt'],
+        params['aspect_ratio'],
+        os.getenv('IP_IMAGE_API_KEY'),
+        params['api_url'],
+        job.user.username
+    )
+    if not generated_image_path:
+        raise Exception('未返回图片数据')
+
+    image_url = f"https://{params['host']}/media/ip_images/{os.path.basename(generated_image_path)}"
+    return image_url, f"{params['prompt']} (纵横比: {params['aspect_ratio']})", None
+
+
+def _generate_content_image(job):
+    from .ip_image_views import generate_content_image_with_rest_api
+    from .models import IPImage
+
+    params = job.params
+    generated_image_path, used_prompt = generate_content_image_with_rest_api(
+        params['content'],
+        params['image_index'],
+        os.getenv('IP_IMAGE_API_KEY'),
+        params['api_url'],
+        job.user.username,
+        params['include_ip_image'],
+        params['ip_image_url'],
+        params['aspect_ratio']
+    )
+    if not generated_image_path:
+        raise Exception('未返回图片数据')
+
+    image_url = f"https://{params['host']}/media/ip_images/{os.path.basename(generated_image_path)}"
+    related_ip_image_id = None
+    if params['include_ip_image']:
+        related_ip_image_id = IPImage.objects.filter(user_id=job.user_id).values_list('id', flat=True).first()
+    return image_url, used_prompt, related_ip_image_id
+
+
+def run_image_generation_job(job_id):
+    """
+    执行图片生成任务（在 Celery worker 中调用）
+
+    只有 pending 状态且额度预留有效的任务会被执行（重复投递时直接跳过）；
+    生成失败时记录 GeminiUsage 失败记录并退还预留额度
+    """
+    from .models import ImageGenerationJob, GeminiUsage, UserQuota
+    from .utils.image_storage import save_to_media_library
+
+    # 预留已过期（额度已退还）的任务不再执行，由 fail_expired_jobs 标记为失败
+    claimed = ImageGenerationJob.objects.filter(
+        id=job_id, status='pending', quota_reservation__status='held'
+    ).update(status='running', started_at=timezone.now())
+    if not claimed:
+        logger.warning(f"⚠️ 图片生成任务 {job_id} 不是排队状态或额度预留已失效，跳过")
+        return None
+
+    job = ImageGenerationJob.objects.select_related('user').get(id=job_id)
+    _publish(job)
+    params = job.params
+    is_ip_image = job.generation_type == 'ip_image'
+    usage_prompt = f"{params['prompt']} (纵横比: {params['aspect_ratio']})" if is_ip_image else params['content'][:500]
+
+    try:
+        if is_ip_image:
+            image_url, used_prompt, related_ip_image_id = _generate_ip_image(job)
+        else:
+            image_url, used_prompt, related_ip_image_id = _generate_content_image(job)
+    except Exception as e:
+        logger.error(f"❌ 图片生成任务 {job_id} 失败: {str(e)}")
+        GeminiUsage.objects.create(
+            user_id=job.user_id,
+            generation_type=job.generation_type,
+            prompt=usage_prompt,
+            success=False,
+            error_message=str(e)[:500]
+        )
+        _settle_reservation(job, succeeded=False)
+        _finish(job, 'failed', {'status': 'error', 'message': f'生成失败: {str(e)}'}, str(e))
+        return job
+    finally:
+        _remove_upload(job.input_image_path)
+
+    _settle_reservation(job, succeeded=True)
+    GeminiUsage.objects.create(
+        user_id=job.user_id,
+        generation_type=job.generation_type,
+        prompt=usage_prompt if is_ip_image else used_prompt[:500],
+        success=True
+    )
+    save_to_media_library(
+        user=job.user,
+        media_type=job.generation_type,
+        original_url=image_url,
+        prompt=usage_prompt,
+        related_ip_image_id=related_ip_image_id
+    )
+
+    remaining_quota = UserQuota.objects.filter(user_id=job.user_id).values_list('available_quota', flat=True).first()
+    if is_ip_image:
+        result = {
+            'status': 'success',
+            'image_url': image_url,
+            'message': 'IP形象生成成功',
+            'method': 'gemini_rest_api_v2',
+            'aspect_ratio': params['aspect_ratio'],
+            'remaining_quota': remaining_quota,
+        }
+    else:
+        result = {
+            'status': 'success',
+            'image_url': image_url,
+            'prompt': used_prompt,
+            'message': '配图生成成功',
+            'remaining_quota': remaining_quota,
+        }
+    _finish(job, 'succeeded', result)
+    logger.info(f"✅ 图片生成任务 {job_id} 完成: {image_url}")
+    return job
+
+
+def fail_expired_jobs():
+    """
+    预留已过期（额度已退还）但仍未完成的任务标记为失败（worker 丢失任务时）
+
+    Returns:
+        int: 标记为失败的任务数
+    """
+    from .models import ImageGenerationJob
+
+    jobs = list(ImageGenerationJob.objects.filter(
+        status__in=('pending', 'running'),
+        quota_reservation__status='expired'
+    ))
+    for job in jobs:
+        _remove_upload(job.input_image_path)
+        _finish(job, 'failed', {'status': 'error', 'message': '生成超时，额度已退还'}, '任务超时')
+    if jobs:
+        logger.warning(f"⏰ {len(jobs)} 个图片生成任务超时，已标记为失败")
+    return len(jobs)
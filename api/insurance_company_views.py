@@ -2,11 +2,25 @@
 保险公司和请求配置的API视图
 """
 import json
+import hashlib
+import requests
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
-from .models import InsuranceCompany, InsuranceCompanyRequest
+from .models import InsuranceCompany, InsuranceCompanyRequest, IllustrationSweep, IllustrationSweepResult
+from .comparison_service import get_comparison_snapshot, filter_snapshot
+from .product_value_store import get_product_value_store, METRICS as PRODUCT_VALUE_METRICS
+from .insurer_request_service import (
+    get_compiled_request_config, parse_headers_text, send_insurer_request, parse_response_body
+)
+from .illustration_sweep import expand_grid, run_sweep
+from .insurer_http import get_insurer_metrics
+from .insurer_response_cache import cached_insurer_call, cache_status_headers
 
 
 @api_view(['GET'])
@@ -54,12 +68,13 @@ def get_companies_standard_comparison(request):
     ⚠️ 重要变更：返回公司级别数据，包含产品列表
     前端点击公司后弹出产品选择对话框，支持多选产品进行对比
 
+    数据来自按年期预先物化的对比快照（见 comparison_service），
+    产品/公司变更时快照版本号递增失效；响应带 ETag，内容未变时返回 304
+
     查询参数:
         payment_period: 缴费年限（可选，默认5年）例如：1, 2, 5
         selected_product_ids: 用户选择的产品ID列表，逗号分隔（可选）
     """
-    from .models import InsuranceProduct
-
     try:
         # 获取缴费年限参数，默认为5年
         payment_period = request.GET.get('payment_period', '5')
@@ -77,89 +92,116 @@ def get_companies_standard_comparison(request):
             except ValueError:
                 selected_product_ids = []
 
-        companies = InsuranceCompany.objects.filter(is_active=True).order_by('sort_order')
+        snapshot = get_comparison_snapshot(payment_period)
 
-        company_list = []
-        for company in companies:
-            # 从 insurance_products 表查询该公司对应年期的所有产品
-            products_query = InsuranceProduct.objects.filter(
-                company=company,
-                payment_period=payment_period,
-                is_active=True
-            )
+        etag = snapshot['etag']
+        if selected_product_ids:
+            selection_key = ','.join(str(pid) for pid in sorted(set(selected_product_ids)))
+            etag = f"{etag}-{hashlib.sha1(selection_key.encode('utf-8')).hexdigest()[:8]}"
+        etag = quote_etag(etag)
 
-            # 如果用户指定了产品ID，则只返回这些产品
-            if selected_product_ids:
-                products_query = products_query.filter(id__in=selected_product_ids)
-
-            products = products_query.order_by('sort_order', 'id')
-
-            # 解析所有产品数据
-            products_data = []
-            for product in products:
-                standard_data = None
-                has_data = False
-
-                if product.surrender_value_table:
-                    try:
-                        # surrender_value_table 是 TextField，存储 JSON 字符串
-                        surrender_table = json.loads(product.surrender_value_table)
-
-                        # 检查是否有有效的数据（支持两种格式）
-                        if surrender_table:
-                            # 格式1: 列表格式 [{"year": 1, ...}, ...]
-                            if isinstance(surrender_table, list) and len(surrender_table) > 0:
-                                standard_data = {
-                                    'standard': surrender_table
-                                }
-                                has_data = True
-                            # 格式2: 字典格式 {"standard": [...]}
-                            elif isinstance(surrender_table, dict) and 'standard' in surrender_table:
-                                if isinstance(surrender_table['standard'], list) and len(surrender_table['standard']) > 0:
-                                    standard_data = surrender_table
-                                    has_data = True
-                    except json.JSONDecodeError:
-                        standard_data = None
-
-                if has_data:  # 只添加有数据的产品
-                    products_data.append({
-                        'product_id': product.id,
-                        'product_name': product.product_name,
-                        'standard_data': standard_data
-                    })
-
-            # 判断公司是否有数据
-            has_data = len(products_data) > 0
-
-            # 构建公司数据
-            # 只返回有数据的公司（没有产品的公司不显示）
-            if not has_data:
-                continue
-
-            company_data = {
-                'id': company.id,
-                'code': company.code,
-                'name': company.name,
-                'name_en': company.name_en,
-                'icon': company.icon,
-                'color_gradient': company.color_gradient,
-                'bg_color': company.bg_color,
-                'flagship_product': company.flagship_product or '',
-                'has_data': has_data,
-                'payment_period': payment_period,
-                'products': products_data  # 产品列表
-            }
+        # 客户端缓存仍然有效
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+
+        company_list, rankings = filter_snapshot(snapshot, selected_product_ids)
+
+        response = Response({
+            'status': 'success',
+            'payment_period': payment_period,  # 告诉前端当前是哪个年期的数据
+            'data': company_list,
+            'rankings': rankings  # 逐年排名（按总现金价值从高到低的产品ID）
+        })
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'  # 允许缓存，但每次需用ETag校验
+        return response
+
+    except Exception as e:
+        return Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def query_product_values(request):
+    """
+    按结果筛选产品（列式存储，毫秒级）
+    例如："5年缴产品中，第20年总价值超过已缴保费2倍的产品"
 
-            # 标记是否有多个产品
-            if len(products_data) > 1:
-                company_data['has_multiple_products'] = True
+    查询参数:
+        year: 保单年度（与 age/issue_age 二选一）
+        age: 目标年龄，配合 issue_age 使用，保单年度 = age - issue_age
+        issue_age: 投保年龄（默认0岁）
+        metric: total(默认) / guaranteed / non_guaranteed
+        payment_period: 缴费年期（可选）
+        company_codes: 公司代码，逗号分隔（可选）
+        min_value: 该年度价值下限（可选）
+        min_multiple: 该年度价值 / 累计已缴保费 下限（可选），例如 2
+        top_k: 只返回前K个（可选，须大于0）
+        order: desc(默认) / asc
+    """
+    try:
+        params = request.GET
+        try:
+            if params.get('year'):
+                year = int(params['year'])
+            elif params.get('age'):
+                year = int(params['age']) - int(params.get('issue_age', 0))
+            else:
+                return Response({
+                    'status': 'error',
+                    'message': '请提供 year 或 age 参数'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            payment_period = int(params['payment_period']) if params.get('payment_period') else None
+            min_value = float(params['min_value']) if params.get('min_value') else None
+            min_multiple = float(params['min_multiple']) if params.get('min_multiple') else None
+            top_k = int(params['top_k']) if params.get('top_k') else None
+        except ValueError:
+            return Response({
+                'status': 'error',
+                'message': '参数格式错误'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if top_k is not None and top_k < 1:
+            return Response({
+                'status': 'error',
+                'message': 'top_k 必须大于0'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        metric = params.get('metric', 'total')
+        if metric not in PRODUCT_VALUE_METRICS:
+            return Response({
+                'status': 'error',
+                'message': f'不支持的指标: {metric}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        company_codes = [c.strip() for c in params.get('company_codes', '').split(',') if c.strip()]
 
-            company_list.append(company_data)
+        store = get_product_value_store()
+        results = store.query(
+            year,
+            metric=metric,
+            payment_period=payment_period,
+            company_codes=company_codes,
+            min_value=min_value,
+            min_multiple=min_multiple,
+            top_k=top_k,
+            ascending=params.get('order') == 'asc'
+        )
 
         return Response({
             'status': 'success',
-            'payment_period': payment_period,  # 告诉前端当前是哪个年期的数据
-            'data': company_list
+            'year': year,
+            'metric': metric,
+            'total_products': len(store),
+            'count': len(results),
+            'data': results
         })
 
     except Exception as e:
@@ -309,70 +351,7 @@ def get_company_request_by_name(request, company_code, request_name):
             }, status=status.HTTP_404_NOT_FOUND)
 
         # 解析headers字段（支持JSON格式和键值对格式）
-        headers = req.headers
-        print(f"📋 [后端] headers原始值类型: {type(headers)}")
-        print(f"📋 [后端] headers原始值: {headers[:200] if isinstance(headers, str) else headers}")
-
-        if isinstance(headers, str):
-            headers = headers.strip()
-            if headers:
-                # 尝试解析为JSON
-                try:
-                    headers = json.loads(headers)
-                    print(f"✅ [后端] JSON解析成功: {headers}")
-                except json.JSONDecodeError:
-                    # 如果不是JSON，尝试解析为键值对格式
-                    # 支持三种格式：
-                    # 格式1: Key: Value (冒号分隔，HTTP header标准格式)
-                    # 格式2: key value (空格分隔)
-                    # 格式3: key\nvalue (换行分隔)
-                    print(f"⚠️ [后端] 不是JSON格式，尝试解析为键值对格式")
-                    try:
-                        lines = [line.strip() for line in headers.split('\n') if line.strip()]
-                        headers_dict = {}
-                        i = 0
-
-                        while i < len(lines):
-                            line = lines[i]
-                            # 优先检查冒号分隔（格式1: Key: Value）
-                            if ':' in line:
-                                parts = line.split(':', 1)  # 按冒号分隔，最多分隔1次
-                                if len(parts) == 2:
-                                    key = parts[0].strip()
-                                    value = parts[1].strip()
-                                    headers_dict[key] = value
-                                elif len(parts) == 1:
-                                    headers_dict[parts[0].strip()] = ''
-                                i += 1
-                            # 检查这行是否包含空格（格式2: key value）
-                            elif ' ' in line or '\t' in line:
-                                parts = line.split(None, 1)  # 按空白字符分隔，最多分隔1次
-                                if len(parts) == 2:
-                                    key, value = parts
-                                    headers_dict[key] = value
-                                elif len(parts) == 1:
-                                    headers_dict[parts[0]] = ''
-                                i += 1
-                            else:
-                                # 格式3: 当前行是key，下一行是value
-                                if i + 1 < len(lines):
-                                    key = line
-                                    value = lines[i + 1]
-                                    headers_dict[key] = value
-                                    i += 2
-                                else:
-                                    # 最后一行，只有key没有value
-                                    headers_dict[line] = ''
-                                    i += 1
-
-                        headers = headers_dict
-                        print(f"✅ [后端] 键值对解析成功: {headers}")
-                    except Exception as e:
-                        print(f"❌ [后端] 键值对解析失败: {e}")
-                        headers = {}
-            else:
-                headers = {}
-
+        headers = parse_headers_text(req.headers)
         print(f"📋 [后端] 最终返回的headers: {headers}")
 
         # 处理field_descriptions，确保bearer_token不是必填
@@ -434,28 +413,20 @@ def execute_api_request(request, company_code, request_name):
         form_data: 用户填写的表单数据 (JSON对象)
         custom_headers: 用户自定义的请求头 (可选)
         custom_bearer_token: 用户自定义的Bearer Token (可选)
-    """
-    import requests
-    import json
-    from copy import deepcopy
+        no_cache: 为 true 时跳过响应缓存，强制请求保险公司API (可选)
 
+    响应头:
+        X-Cache: HIT / MISS / COALESCED / BYPASS（未配置缓存时长）
+    """
     try:
-        # 1. 查找保险公司
+        # 1-2. 查找保险公司和请求配置（编译后的配置按 updated_at 缓存）
         try:
-            company = InsuranceCompany.objects.get(code=company_code, is_active=True)
+            compiled = get_compiled_request_config(company_code, request_name)
         except InsuranceCompany.DoesNotExist:
             return Response({
                 'status': 'error',
                 'message': f'保险公司 {company_code} 不存在'
             }, status=status.HTTP_404_NOT_FOUND)
-
-        # 2. 查找请求配置
-        try:
-            req_config = InsuranceCompanyRequest.objects.get(
-                company=company,
-                request_name=request_name,
-                is_active=True
-            )
         except InsuranceCompanyRequest.DoesNotExist:
             return Response({
                 'status': 'error',
@@ -468,148 +439,48 @@ def execute_api_request(request, company_code, request_name):
         custom_bearer_token = request.data.get('custom_bearer_token', '')
         custom_request_body = request.data.get('request_body', None)  # 用户编辑后的request body
 
-        # 4. 构建请求体
-        if custom_request_body is not None:
-            # 如果前端传来了编辑后的request body，直接使用
-            request_body = custom_request_body
-        else:
-            # 否则使用模板并替换占位符
-            request_body = deepcopy(req_config.request_template)
-
-            # 递归替换占位符 {{field_name}} 和直接字段值
-            def replace_placeholders(obj, form_data):
-                if isinstance(obj, str):
-                    # 替换 {{变量名}} 格式的占位符
-                    import re
-                    def replacer(match):
-                        field_name = match.group(1)
-                        if field_name in form_data:
-                            value = form_data[field_name]
-                            # 如果原值是数字字符串，返回数字
-                            if isinstance(value, str) and value.isdigit():
-                                return value
-                            return str(value)
-                        return match.group(0)  # 保持占位符不变
-                    return re.sub(r'\{\{(\w+)\}\}', replacer, obj)
-                elif isinstance(obj, dict):
-                    result = {}
-                    for key, value in obj.items():
-                        # 如果key在form_data中，直接替换值
-                        if key in form_data:
-                            result[key] = form_data[key]
-                        else:
-                            # 否则递归处理
-                            result[key] = replace_placeholders(value, form_data)
-                    return result
-                elif isinstance(obj, list):
-                    return [replace_placeholders(item, form_data) for item in obj]
-                else:
-                    return obj
-
-            request_body = replace_placeholders(request_body, form_data)
-
-        # 5. 构建请求头（处理字符串格式的headers，支持JSON和键值对格式）
-        if req_config.headers:
-            if isinstance(req_config.headers, str):
-                headers_str = req_config.headers.strip()
-                try:
-                    # 尝试解析为JSON
-                    headers = deepcopy(json.loads(headers_str))
-                except json.JSONDecodeError:
-                    # 如果不是JSON，尝试解析为键值对格式
-                    # 支持三种格式：
-                    # 格式1: Key: Value (冒号分隔，HTTP header标准格式)
-                    # 格式2: key value (空格分隔)
-                    # 格式3: key\nvalue (换行分隔)
-                    try:
-                        lines = [line.strip() for line in headers_str.split('\n') if line.strip()]
-                        headers = {}
-                        i = 0
-
-                        while i < len(lines):
-                            line = lines[i]
-                            # 优先检查冒号分隔（格式1: Key: Value）
-                            if ':' in line:
-                                parts = line.split(':', 1)
-                                if len(parts) == 2:
-                                    key = parts[0].strip()
-                                    value = parts[1].strip()
-                                    headers[key] = value
-                                elif len(parts) == 1:
-                                    headers[parts[0].strip()] = ''
-                                i += 1
-                            # 检查这行是否包含空格（格式2: key value）
-                            elif ' ' in line or '\t' in line:
-                                parts = line.split(None, 1)
-                                if len(parts) == 2:
-                                    key, value = parts
-                                    headers[key] = value
-                                elif len(parts) == 1:
-                                    headers[parts[0]] = ''
-                                i += 1
-                            else:
-                                # 格式3: 当前行是key，下一行是value
-                                if i + 1 < len(lines):
-                                    key = line
-                                    value = lines[i + 1]
-                                    headers[key] = value
-                                    i += 2
-                                else:
-                                    headers[line] = ''
-                                    i += 1
-                    except:
-                        headers = {}
-            else:
-                headers = deepcopy(req_config.headers)
-        else:
-            headers = {}
-
-        # 合并自定义请求头
-        if custom_headers:
-            headers.update(custom_headers)
-
-        # 6. 处理Authorization
-        # 优先级：用户输入 > insurance_company_requests.authorization > insurance_companies.bearer_token
-        authorization = custom_bearer_token or req_config.authorization or company.bearer_token
-        if authorization:
-            # 清理authorization（去除前后空格和换行符）
-            authorization = authorization.strip()
-            # 如果不是以"Bearer "开头，添加前缀
-            if not authorization.startswith('Bearer '):
-                authorization = f'Bearer {authorization}'
-            headers['Authorization'] = authorization
-
-        # 7. 处理Cookie
-        if company.cookie:
-            headers['Cookie'] = company.cookie.strip()
-
-        # 8. 发送HTTP请求
-        url = req_config.request_url
-        method = req_config.request_method.upper()
-
+        # 4. 构建请求（请求体、请求头、Authorization、Cookie）
+        prepared = compiled.build(
+            form_data=form_data,
+            custom_headers=custom_headers,
+            custom_bearer_token=custom_bearer_token,
+            custom_request_body=custom_request_body
+        )
+        url = prepared['url']
+        method = prepared['method']
+        headers = prepared['headers']
+        request_body = prepared['body']
+
+        # 5. 发送HTTP请求
         print(f"[API执行] {method} {url}")
         print(f"[Headers] {json.dumps(headers, indent=2, ensure_ascii=False)}")
         print(f"[Body] {json.dumps(request_body, indent=2, ensure_ascii=False)}")
 
-        if method == 'POST':
-            response = requests.post(url, json=request_body, headers=headers, timeout=120, verify=True)
-        elif method == 'GET':
-            response = requests.get(url, params=request_body, headers=headers, timeout=120, verify=True)
-        elif method == 'PUT':
-            response = requests.put(url, json=request_body, headers=headers, timeout=120, verify=True)
-        elif method == 'DELETE':
-            response = requests.delete(url, json=request_body, headers=headers, timeout=120, verify=True)
-        else:
+        if method not in ('GET', 'POST', 'PUT', 'DELETE'):
             return Response({
                 'status': 'error',
                 'message': f'不支持的HTTP方法: {method}'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        print(f"[响应状态] {response.status_code}")
-        print(f"[响应内容] {response.text[:500]}")
+        def fetch():
+            response = send_insurer_request(prepared)
+            print(f"[响应状态] {response.status_code}")
+            print(f"[响应内容] {response.text[:500]}")
+            return {
+                'status_code': response.status_code,
+                'headers': dict(response.headers),
+                'body': parse_response_body(response)
+            }
+
+        # 相同请求体的成功响应按配置的时长缓存，并发的相同请求只发送一次
+        result, cache_status = cached_insurer_call(
+            compiled.company_code, compiled.request_name, request_body,
+            compiled.cache_ttl, fetch,
+            bypass=bool(request.data.get('no_cache'))
+        )
 
-        # 9. 返回响应
-        return Response({
+        # 6. 返回响应
+        response = Response({
             'status': 'success',
             'request_info': {
                 'url': url,
@@ -618,11 +489,15 @@ def execute_api_request(request, company_code, request_name):
                 'body': request_body
             },
             'response_info': {
-                'status_code': response.status_code,
-                'headers': dict(response.headers),
-                'body': response.json() if response.headers.get('Content-Type', '').startswith('application/json') else response.text
-            }
+                'status_code': result['status_code'],
+                'headers': result['headers'],
+                'body': result['body']
+            },
+            'cache_status': cache_status
         })
+        for key, value in cache_status_headers(result, cache_status).items():
+            response[key] = value
+        return response
 
     except requests.exceptions.Timeout:
         return Response({
@@ -643,3 +518,198 @@ def execute_api_request(request, company_code, request_name):
             'status': 'error',
             'message': f'服务器错误: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+SWEEP_RESULT_BATCH_SIZE = 20
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def sweep_api_request(request, company_code, request_name):
+    """
+    网格批量执行API请求 - 按参数网格并发请求保险公司API，结果逐条流式返回
+
+    参数:
+        company_code: 保险公司代码 (如 'axa')
+        request_name: 请求名称 (如 '利益表计算')
+
+    请求体:
+        parameters: 参数网格，例如 {"age": {"start": 0, "stop": 60, "step": 5}, "premium": [10000, 50000]}
+        form_data: 所有组合共用的表单数据 (可选)
+        custom_headers: 用户自定义的请求头 (可选)
+        custom_bearer_token: 用户自定义的Bearer Token (可选)
+        stream_format: 'ndjson'（默认）或 'sse'
+
+    响应:
+        每行/每个事件一个结果：{"type": "result", "index", "params", "success", "status_code", "normalized", ...}
+        开始时 {"type": "start", "sweep_id", "total"}，结束时 {"type": "done", "sweep_id", "completed", "failed"}
+        结果同时保存到 IllustrationSweepResult，可通过 illustration-sweeps/<id>/ 读取
+    """
+    try:
+        compiled = get_compiled_request_config(company_code, request_name)
+    except InsuranceCompany.DoesNotExist:
+        return Response({
+            'status': 'error',
+            'message': f'保险公司 {company_code} 不存在'
+        }, status=status.HTTP_404_NOT_FOUND)
+    except InsuranceCompanyRequest.DoesNotExist:
+        return Response({
+            'status': 'error',
+            'message': f'请求配置 {request_name} 不存在'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    if compiled.method not in ('GET', 'POST', 'PUT', 'DELETE'):
+        return Response({
+            'status': 'error',
+            'message': f'不支持的HTTP方法: {compiled.method}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    parameters = request.data.get('parameters')
+    base_form_data = request.data.get('form_data') or {}
+    custom_headers = request.data.get('custom_headers') or {}
+    custom_bearer_token = request.data.get('custom_bearer_token', '')
+    stream_format = request.data.get('stream_format', 'ndjson')
+
+    try:
+        points = expand_grid(parameters)
+    except ValueError as e:
+        return Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    sweep = IllustrationSweep.objects.create(
+        user=request.user,
+        request_config_id=compiled.request_id,
+        parameters=parameters,
+        base_form_data=base_form_data,
+        total_points=len(points)
+    )
+
+    if stream_format == 'sse':
+        def encode(event_type, data):
+            return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        content_type = 'text/event-stream'
+    else:
+        def encode(event_type, data):
+            return json.dumps({'type': event_type, **data}, ensure_ascii=False) + '\n'
+        content_type = 'application/x-ndjson'
+
+    async def event_stream():
+        pending = []
+        completed = 0
+        failed = 0
+        final_status = 'failed'
+
+        async def flush():
+            if pending:
+                batch = list(pending)
+                pending.clear()
+                await sync_to_async(IllustrationSweepResult.objects.bulk_create)(batch)
+
+        yield encode('start', {'sweep_id': sweep.id, 'total': len(points)})
+        try:
+            async for result in run_sweep(compiled, points,
+                                          base_form_data=base_form_data,
+                                          custom_headers=custom_headers,
+                                          custom_bearer_token=custom_bearer_token):
+                if result['success']:
+                    completed += 1
+                else:
+                    failed += 1
+                pending.append(IllustrationSweepResult(
+                    sweep=sweep,
+                    params=result['params'],
+                    success=result['success'],
+                    status_code=result['status_code'],
+                    normalized=result['normalized'] or {},
+                    error_message=result['error_message'],
+                    elapsed_ms=result['elapsed_ms']
+                ))
+                if len(pending) >= SWEEP_RESULT_BATCH_SIZE:
+                    await flush()
+                yield encode('result', result)
+            final_status = 'completed'
+        except Exception as e:
+            yield encode('error', {'sweep_id': sweep.id, 'message': f'服务器错误: {str(e)}'})
+        finally:
+            # 客户端断开（生成器被取消、关闭）时也保存已完成的结果
+            await flush()
+            await sync_to_async(IllustrationSweep.objects.filter(id=sweep.id).update)(
+                completed_points=completed,
+                failed_points=failed,
+                status=final_status,
+                finished_at=timezone.now()
+            )
+
+        yield encode('done', {'sweep_id': sweep.id, 'completed': completed, 'failed': failed})
+
+    # 异步生成器：ASGI 下每个结果完成即发送（同步生成器会被整个读完后才发送），客户端断开时停止网格请求
+    response = StreamingHttpResponse(event_stream(), content_type=content_type)
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_illustration_sweep(request, sweep_id):
+    """
+    获取网格批量请求及其已保存的规范化结果
+
+    查询参数:
+        only_success: 为 true 时只返回成功的结果
+    """
+    try:
+        sweep = IllustrationSweep.objects.select_related('request_config__company').get(
+            id=sweep_id, user=request.user
+        )
+    except IllustrationSweep.DoesNotExist:
+        return Response({
+            'status': 'error',
+            'message': '批量请求不存在'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    results = sweep.results.all()
+    if request.query_params.get('only_success') == 'true':
+        results = results.filter(success=True)
+
+    return Response({
+        'status': 'success',
+        'data': {
+            'id': sweep.id,
+            'company_code': sweep.request_config.company.code,
+            'request_name': sweep.request_config.request_name,
+            'parameters': sweep.parameters,
+            'base_form_data': sweep.base_form_data,
+            'total_points': sweep.total_points,
+            'completed_points': sweep.completed_points,
+            'failed_points': sweep.failed_points,
+            'status': sweep.status,
+            'created_at': sweep.created_at.isoformat(),
+            'finished_at': sweep.finished_at.isoformat() if sweep.finished_at else None,
+            'results': [
+                {
+                    'params': r.params,
+                    'success': r.success,
+                    'status_code': r.status_code,
+                    'normalized': r.normalized,
+                    'error_message': r.error_message,
+                    'elapsed_ms': r.elapsed_ms,
+                }
+                for r in results
+            ]
+        }
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_insurer_http_metrics(request):
+    """
+    保险公司API连接池统计（当前 worker 进程）：请求数、错误率、延迟分布、连接复用率
+    """
+    return Response({
+        'status': 'success',
+        'data': get_insurer_metrics()
+    })
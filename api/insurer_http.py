@@ -0,0 +1,212 @@
+"""
+保险公司API的HTTP连接池
+按目标主机复用 requests.Session（keep-alive），避免每次请求重新进行 DNS / TCP / TLS 握手，
+幂等方法自动重试，按主机配置超时，并按保险公司统计连接复用、延迟分布和错误率
+"""
+import time
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+from django.conf import settings
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 默认超时（秒）：(连接超时, 读取超时)
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 120
+
+# 延迟直方图的桶上限（毫秒），最后一个桶为 +Inf
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# 幂等方法：读取失败或 502/503/504 时自动重试（连接建立失败对所有方法都会重试，因为请求尚未发出）
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+
+def _build_retry():
+    return Retry(
+        total=getattr(settings, 'INSURER_HTTP_MAX_RETRIES', 2),
+        connect=getattr(settings, 'INSURER_HTTP_MAX_RETRIES', 2),
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=IDEMPOTENT_METHODS,
+        raise_on_status=False,
+    )
+
+
+def _build_session():
+    """创建带连接池和重试策略的 Session"""
+    pool_size = getattr(settings, 'INSURER_HTTP_POOL_SIZE', 10)
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=pool_size,
+        max_retries=_build_retry(),
+        pool_block=False,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # Session 在不同用户之间共享，不能保存响应中的 Set-Cookie
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_insurer_session(url):
+    """获取目标主机的共享 Session（进程内单例）"""
+    host = urlsplit(url).netloc.lower()
+    session = _sessions.get(host)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = _build_session()
+            _sessions[host] = session
+        return session
+
+
+def get_host_timeout(url):
+    """
+    获取目标主机的超时配置
+
+    settings.INSURER_HTTP_TIMEOUTS = {'az-api.axa.com.hk': (5, 30)}
+    """
+    host = urlsplit(url).netloc.lower()
+    timeouts = getattr(settings, 'INSURER_HTTP_TIMEOUTS', {})
+    return timeouts.get(host, (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT))
+
+
+class _InsurerMetrics:
+    """单个保险公司的请求统计"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0           # 网络错误/超时（无响应）
+        self.timeouts = 0
+        self.status_counts = {}   # {'2xx': n, '4xx': n, '5xx': n}
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum_ms = 0.0
+
+    def observe(self, elapsed_ms, status_code=None, error=None):
+        self.requests += 1
+        self.latency_sum_ms += elapsed_ms
+        for i, upper in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= upper:
+                self.latency_buckets[i] += 1
+                break
+        else:
+            self.latency_buckets[-1] += 1
+
+        if error is not None:
+            self.errors += 1
+            if isinstance(error, requests.exceptions.Timeout):
+                self.timeouts += 1
+        else:
+            status_class = f'{status_code // 100}xx'
+            self.status_counts[status_class] = self.status_counts.get(status_class, 0) + 1
+
+    def to_dict(self):
+        failed = self.errors + self.status_counts.get('5xx', 0)
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'status': dict(self.status_counts),
+            'error_rate': round(failed / self.requests, 4) if self.requests else 0.0,
+            'latency_avg_ms': round(self.latency_sum_ms / self.requests, 1) if self.requests else None,
+            'latency_histogram_ms': {
+                **{str(upper): count for upper, count in zip(LATENCY_BUCKETS_MS, self.latency_buckets)},
+                '+Inf': self.latency_buckets[-1],
+            },
+        }
+
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def _record(insurer, elapsed_ms, status_code=None, error=None):
+    with _metrics_lock:
+        metrics = _metrics.get(insurer)
+        if metrics is None:
+            metrics = _metrics[insurer] = _InsurerMetrics()
+        metrics.observe(elapsed_ms, status_code=status_code, error=error)
+
+
+def insurer_request(method, url, insurer=None, timeout=None, **kwargs):
+    """
+    通过共享连接池发送请求
+
+    Args:
+        method: HTTP方法
+        url: 完整URL
+        insurer: 统计标签（保险公司代码），默认使用主机名
+        timeout: 超时（秒或 (连接, 读取) 元组），默认按主机配置
+        **kwargs: 传给 Session.request 的参数（json、params、headers 等）
+
+    Raises:
+        requests.exceptions.RequestException: 网络错误（重试后仍失败）
+    """
+    if timeout is None:
+        timeout = get_host_timeout(url)
+    kwargs.setdefault('verify', True)
+    session = get_insurer_session(url)
+    label = insurer or urlsplit(url).netloc.lower()
+
+    started = time.monotonic()
+    try:
+        response = session.request(method, url, timeout=timeout, **kwargs)
+    except requests.exceptions.RequestException as e:
+        _record(label, (time.monotonic() - started) * 1000, error=e)
+        raise
+    _record(label, (time.monotonic() - started) * 1000, status_code=response.status_code)
+    return response
+
+
+def get_connection_stats():
+    """
+    各主机连接池的连接复用情况
+
+    Returns:
+        dict: {host: {'connections_opened', 'requests', 'reused', 'reuse_rate'}}
+    """
+    stats = {}
+    with _sessions_lock:
+        sessions = list(_sessions.items())
+    for host, session in sessions:
+        opened = 0
+        sent = 0
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                opened += pool.num_connections
+                sent += pool.num_requests
+        stats[host] = {
+            'connections_opened': opened,
+            'requests': sent,
+            'reused': max(sent - opened, 0),
+            'reuse_rate': round((sent - opened) / sent, 4) if sent else 0.0,
+        }
+    return stats
+
+
+def get_insurer_metrics():
+    """
+    当前进程的保险公司API请求统计（各 worker 进程分别统计）
+
+    Returns:
+        dict: {'insurers': {insurer: {...}}, 'connections': {host: {...}}}
+    """
+    with _metrics_lock:
+        insurers = {insurer: metrics.to_dict() for insurer, metrics in _metrics.items()}
+    return {
+        'insurers': insurers,
+        'connections': get_connection_stats(),
+    }
@@ -0,0 +1,323 @@
+"""
+保险公司API请求构建与发送
+从 execute_api_request 中抽取的公共逻辑：解析请求头、替换模板占位符、处理认证并发送请求，
+供单次执行和批量网格请求共用
+
+请求配置会编译为不可变的 CompiledRequestConfig（请求头预解析、模板占位符预编译、认证预处理），
+按编译所用字段的摘要（数据库中计算的 MD5）缓存在进程内，Admin 保存后通过信号失效；
+直接改库（SQL 脚本、QuerySet.update 刷新令牌）不会更新 updated_at，但会改变摘要，各进程下次请求时重新编译
+"""
+import re
+import json
+import logging
+import threading
+from copy import deepcopy
+from types import MappingProxyType
+from .insurer_http import insurer_request
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_PATTERN = re.compile(r'\{\{(\w+)\}\}')
+
+
+def parse_headers_text(headers):
+    """
+    解析headers字段（支持JSON格式和键值对格式）
+
+    支持三种键值对格式：
+        格式1: Key: Value (冒号分隔，HTTP header标准格式)
+        格式2: key value (空格分隔)
+        格式3: key\\nvalue (换行分隔)
+
+    Returns:
+        dict: 解析后的请求头，无法解析时返回空字典
+    """
+    if not headers:
+        return {}
+    if not isinstance(headers, str):
+        return deepcopy(headers)
+
+    headers_str = headers.strip()
+    if not headers_str:
+        return {}
+
+    # 尝试解析为JSON
+    try:
+        parsed = json.loads(headers_str)
+        return parsed if isinstance(parsed, dict) else {}
+    except json.JSONDecodeError:
+        pass
+
+    try:
+        lines = [line.strip() for line in headers_str.split('\n') if line.strip()]
+        headers_dict = {}
+        i = 0
+
+        while i < len(lines):
+            line = lines[i]
+            # 优先检查冒号分隔（格式1: Key: Value）
+            if ':' in line:
+                key, value = line.split(':', 1)  # 按冒号分隔，最多分隔1次
+                headers_dict[key.strip()] = value.strip()
+                i += 1
+            # 检查这行是否包含空格（格式2: key value）
+            elif ' ' in line or '\t' in line:
+                parts = line.split(None, 1)  # 按空白字符分隔，最多分隔1次
+                if len(parts) == 2:
+                    key, value = parts
+                    headers_dict[key] = value
+                elif len(parts) == 1:
+                    headers_dict[parts[0]] = ''
+                i += 1
+            else:
+                # 格式3: 当前行是key，下一行是value
+                if i + 1 < len(lines):
+                    headers_dict[line] = lines[i + 1]
+                    i += 2
+                else:
+                    # 最后一行，只有key没有value
+                    headers_dict[line] = ''
+                    i += 1
+
+        return headers_dict
+    except Exception:
+        return {}
+
+
+def _normalize_authorization(authorization):
+    """去除前后空白，缺少 "Bearer " 前缀时补上"""
+    if not authorization:
+        return ''
+    authorization = authorization.strip()
+    if not authorization.startswith('Bearer '):
+        authorization = f'Bearer {authorization}'
+    return authorization
+
+
+def compile_template(obj):
+    """
+    将请求模板预编译为渲染函数 render(form_data)，递归替换占位符 {{field_name}} 和直接字段值
+
+    - 字符串中的 {{变量名}} 替换为 form_data 中对应的值（不存在则保持不变）
+    - 不含占位符的字符串、数字等直接返回原值
+    - 含占位符的字符串预先拆分为 [字面量, 字段名, 字面量, ...]，渲染时只做拼接
+    - 字典中 key 在 form_data 中时，直接用 form_data 的值替换整个值
+    """
+    if isinstance(obj, str):
+        parts = PLACEHOLDER_PATTERN.split(obj)
+        if len(parts) == 1:
+            return lambda form_data: obj
+        # split 结果中奇数位是字段名
+        literals = parts[0::2]
+        fields = parts[1::2]
+
+        def render_str(form_data):
+            out = [literals[0]]
+            for field, literal in zip(fields, literals[1:]):
+                out.append(str(form_data[field]) if field in form_data else '{{' + field + '}}')
+                out.append(literal)
+            return ''.join(out)
+        return render_str
+
+    if isinstance(obj, dict):
+        items = tuple((key, compile_template(value)) for key, value in obj.items())
+
+        def render_dict(form_data):
+            return {
+                key: form_data[key] if key in form_data else render(form_data)
+                for key, render in items
+            }
+        return render_dict
+
+    if isinstance(obj, list):
+        renders = tuple(compile_template(item) for item in obj)
+        return lambda form_data: [render(form_data) for render in renders]
+
+    return lambda form_data: obj
+
+
+class CompiledRequestConfig:
+    """
+    编译后的请求配置（不可变）
+
+    属性:
+        request_id, company_id, company_code, request_name, url, method
+        headers: 预解析的请求头（只读映射，构建请求时复制）
+        authorization: 预处理的 Authorization（请求配置优先，其次保险公司 bearer_token）
+        cookie: 预处理的 Cookie
+        cache_ttl: 响应缓存时长（秒），0表示不缓存
+        stamp: 编译所用各字段的摘要（get_compiled_request_config 传入），用于判断缓存是否过期
+    """
+
+    __slots__ = ('request_id', 'company_id', 'company_code', 'request_name', 'url', 'method',
+                 'headers', 'authorization', 'cookie', 'cache_ttl', 'stamp', '_render')
+
+    def __init__(self, company, req_config, stamp=None):
+        set_attr = object.__setattr__
+        set_attr(self, 'request_id', req_config.id)
+        set_attr(self, 'company_id', company.id)
+        set_attr(self, 'company_code', company.code)
+        set_attr(self, 'request_name', req_config.request_name)
+        set_attr(self, 'url', req_config.request_url)
+        set_attr(self, 'method', req_config.request_method.upper())
+        set_attr(self, 'headers', MappingProxyType(parse_headers_text(req_config.headers)))
+        set_attr(self, 'authorization', _normalize_authorization(req_config.authorization or company.bearer_token))
+        set_attr(self, 'cookie', company.cookie.strip() if company.cookie else '')
+        set_attr(self, 'cache_ttl', req_config.response_cache_ttl or 0)
+        set_attr(self, 'stamp', stamp)
+        set_attr(self, '_render', compile_template(req_config.request_template))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CompiledRequestConfig 不可修改')
+
+    def render_body(self, form_data=None):
+        """用表单数据渲染请求体模板（每次返回新对象）"""
+        return self._render(form_data or {})
+
+    def build(self, form_data=None, custom_headers=None, custom_bearer_token='', custom_request_body=None):
+        """
+        构建请求
+
+        Returns:
+            dict: {'url': str, 'method': str, 'headers': dict, 'body': dict, 'insurer': str}
+        """
+        if custom_request_body is not None:
+            # 如果前端传来了编辑后的request body，直接使用
+            request_body = custom_request_body
+        else:
+            request_body = self._render(form_data or {})
+
+        headers = dict(self.headers)
+        if custom_headers:
+            headers.update(custom_headers)
+
+        # Authorization 优先级：用户输入 > 请求配置 > 保险公司
+        authorization = _normalize_authorization(custom_bearer_token) if custom_bearer_token else self.authorization
+        if authorization:
+            headers['Authorization'] = authorization
+
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+
+        return {
+            'url': self.url,
+            'method': self.method,
+            'headers': headers,
+            'body': request_body,
+            'insurer': self.company_code,
+        }
+
+
+def build_insurer_request(company, req_config, form_data=None, custom_headers=None,
+                          custom_bearer_token='', custom_request_body=None):
+    """
+    构建保险公司API请求（未缓存的一次性编译，已有编译配置时请直接调用 CompiledRequestConfig.build）
+
+    Returns:
+        dict: {'url': str, 'method': str, 'headers': dict, 'body': dict, 'insurer': str}
+    """
+    return CompiledRequestConfig(company, req_config).build(
+        form_data=form_data,
+        custom_headers=custom_headers,
+        custom_bearer_token=custom_bearer_token,
+        custom_request_body=custom_request_body
+    )
+
+
+_compiled_configs = {}
+_compiled_configs_lock = threading.Lock()
+
+# 参与编译的字段（请求配置和所属保险公司），摘要变化即需要重新编译
+COMPILED_SOURCE_FIELDS = (
+    'request_url', 'request_method', 'request_template', 'headers', 'authorization',
+    'response_cache_ttl', 'company__code', 'company__bearer_token', 'company__cookie',
+)
+
+
+def _config_digests():
+    """在数据库中计算各编译字段的 MD5（每个字段只传回 32 字节，不加载完整的模板和请求头）"""
+    from django.db.models import TextField, Value
+    from django.db.models.functions import Cast, Coalesce, MD5
+
+    return {
+        f'digest_{index}': MD5(Coalesce(Cast(field, output_field=TextField()), Value(''), output_field=TextField()))
+        for index, field in enumerate(COMPILED_SOURCE_FIELDS)
+    }
+
+
+def get_compiled_request_config(company_code, request_name):
+    """
+    获取编译后的请求配置
+
+    每次只查询一次 (id, 各字段摘要) 判断缓存是否过期，过期或未缓存时才加载完整行并重新编译
+
+    Raises:
+        InsuranceCompany.DoesNotExist: 保险公司不存在或未启用
+        InsuranceCompanyRequest.DoesNotExist: 请求配置不存在或未启用
+    """
+    from .models import InsuranceCompany, InsuranceCompanyRequest
+
+    digest_fields = _config_digests()
+    row = InsuranceCompanyRequest.objects.filter(
+        company__code=company_code,
+        company__is_active=True,
+        request_name=request_name,
+        is_active=True
+    ).annotate(**digest_fields).values_list('id', *digest_fields).first()
+
+    if row is None:
+        if not InsuranceCompany.objects.filter(code=company_code, is_active=True).exists():
+            raise InsuranceCompany.DoesNotExist(f'保险公司 {company_code} 不存在')
+        raise InsuranceCompanyRequest.DoesNotExist(f'请求配置 {request_name} 不存在')
+
+    request_id, digests = row[0], row[1:]
+    key = (company_code, request_name)
+    compiled = _compiled_configs.get(key)
+    if compiled is not None and compiled.request_id == request_id and compiled.stamp == digests:
+        return compiled
+
+    # 摘要与配置在同一查询中读取，保证两者一致
+    req_config = InsuranceCompanyRequest.objects.select_related('company').annotate(**digest_fields).get(id=request_id)
+    stamp = tuple(getattr(req_config, name) for name in digest_fields)
+    compiled = CompiledRequestConfig(req_config.company, req_config, stamp=stamp)
+    with _compiled_configs_lock:
+        _compiled_configs[key] = compiled
+    logger.info(f"🧩 已编译请求配置: {company_code}/{request_name}")
+    return compiled
+
+
+def invalidate_compiled_request_configs(company_id=None, request_id=None):
+    """清除进程内的编译缓存（按公司或请求配置，都不传时全部清除）"""
+    with _compiled_configs_lock:
+        if company_id is None and request_id is None:
+            _compiled_configs.clear()
+            return
+        for key, compiled in list(_compiled_configs.items()):
+            if compiled.company_id == company_id or compiled.request_id == request_id:
+                del _compiled_configs[key]
+
+
+def send_insurer_request(prepared, timeout=None):
+    """
+    通过共享连接池发送已构建的请求（超时默认按主机配置）
+
+    Raises:
+        ValueError: 不支持的HTTP方法
+        requests.exceptions.RequestException: 网络错误
+    """
+    method = prepared['method']
+    insurer = prepared.get('insurer')
+    if method == 'GET':
+        return insurer_request('GET', prepared['url'], insurer=insurer, timeout=timeout,
+                               params=prepared['body'], headers=prepared['headers'])
+    if method in ('POST', 'PUT', 'DELETE'):
+        return insurer_request(method, prepared['url'], insurer=insurer, timeout=timeout,
+                               json=prepared['body'], headers=prepared['headers'])
+    raise ValueError(f'不支持的HTTP方法: {method}')
+
+
+def parse_response_body(response):
+    """JSON响应解析为对象，否则返回文本"""
+    if response.headers.get('Content-Type', '').startswith('application/json'):
+        return response.json()
+    return response.text
@@ -0,0 +1,161 @@
+"""
+保险公司API响应缓存
+利益演示等确定性请求按 (保险公司, 请求名称, 规范化请求体) 缓存到 Redis，
+并发的相同请求只发送一次（进程内线程合并 + 跨进程 Redis 锁），
+只缓存 2xx 响应，认证失败（401/403）和服务器错误永不缓存
+"""
+import json
+import time
+import hashlib
+import logging
+import threading
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_KEY = 'insurer_response:{digest}'
+RESPONSE_LOCK_KEY = 'insurer_response:lock:{digest}'
+
+# 缓存状态（写入响应头 X-Cache）
+CACHE_HIT = 'HIT'
+CACHE_MISS = 'MISS'
+CACHE_COALESCED = 'COALESCED'  # 等待了另一个相同的进行中请求
+CACHE_BYPASS = 'BYPASS'
+
+# 跨进程锁的最长持有时间（秒），应大于保险公司API的读取超时
+LOCK_TIMEOUT = 150
+# 等待其他进程结果时的轮询间隔（秒）
+POLL_INTERVAL = 0.1
+
+
+def get_default_cache_ttl():
+    """未关联 InsuranceCompanyRequest 的固定请求（如安盛提取计算）使用的缓存时长"""
+    return getattr(settings, 'INSURER_RESPONSE_CACHE_DEFAULT_TTL', 3600)
+
+
+def make_cache_digest(company_code, request_name, body):
+    """规范化请求体（键排序、紧凑格式）后计算摘要"""
+    canonical = json.dumps(
+        [company_code, request_name, body],
+        sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def is_cacheable(result):
+    """只缓存 2xx 响应"""
+    return 200 <= result['status_code'] < 300
+
+
+class _Flight:
+    """进程内进行中的请求"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _wait_for_remote(cache_key, lock_key, deadline):
+    """等待其他进程写入缓存；锁释放但无缓存（对方失败或不可缓存）时返回 None"""
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        cached = cache.get_many([cache_key, lock_key])
+        if cache_key in cached:
+            return cached[cache_key]
+        if lock_key not in cached:
+            return None
+    return None
+
+
+def _fetch_and_store(digest, ttl, fetch):
+    """跨进程单飞：拿到锁的进程发送请求并写缓存，其余进程等待结果"""
+    cache_key = RESPONSE_CACHE_KEY.format(digest=digest)
+    lock_key = RESPONSE_LOCK_KEY.format(digest=digest)
+
+    acquired = cache.add(lock_key, 1, timeout=LOCK_TIMEOUT)
+    if not acquired:
+        cached = _wait_for_remote(cache_key, lock_key, time.monotonic() + LOCK_TIMEOUT)
+        if cached is not None:
+            return cached, CACHE_COALESCED
+        # 对方失败或结果不可缓存：自己发送（不再等待）
+
+    try:
+        result = fetch()
+        if is_cacheable(result):
+            result = {**result, 'cached_at': time.time()}
+            cache.set(cache_key, result, timeout=ttl)
+            logger.info(f"💾 保险公司API响应已缓存: {digest[:12]}, ttl={ttl}s")
+        return result, CACHE_MISS
+    finally:
+        if acquired:
+            cache.delete(lock_key)
+
+
+def cached_insurer_call(company_code, request_name, body, ttl, fetch, bypass=False):
+    """
+    带缓存和单飞的保险公司API调用
+
+    Args:
+        company_code, request_name, body: 缓存键组成部分（body 为最终发送的请求体）
+        ttl: 缓存时长（秒），<= 0 时不缓存
+        fetch: 无参函数，发送请求并返回 {'status_code': int, 'headers': dict, 'body': ...}
+        bypass: 为 True 时跳过读缓存（仍会写入新结果）
+
+    Returns:
+        tuple: (result, cache_status)，result 可能包含 cached_at（写入缓存的时间戳）
+    """
+    if not ttl or ttl <= 0:
+        return fetch(), CACHE_BYPASS
+
+    digest = make_cache_digest(company_code, request_name, body)
+    cache_key = RESPONSE_CACHE_KEY.format(digest=digest)
+
+    if not bypass:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached, CACHE_HIT
+
+    # 进程内单飞：同一进程的并发相同请求等待第一个完成
+    with _flights_lock:
+        flight = _flights.get(digest)
+        leader = flight is None
+        if leader:
+            flight = _flights[digest] = _Flight()
+
+    if not leader:
+        flight.event.wait()
+        if flight.error is None and is_cacheable(flight.result[0]):
+            return flight.result[0], CACHE_COALESCED
+        # 第一个请求失败或结果不可缓存（如认证失败，可能与本请求的 token 有关）：自己发送
+        return fetch(), CACHE_MISS
+
+    try:
+        flight.result = _fetch_and_store(digest, ttl, fetch)
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(digest, None)
+        flight.event.set()
+
+
+def cache_status_headers(result, cache_status):
+    """
+    生成缓存状态响应头
+
+    X-Cache: HIT / MISS / COALESCED / BYPASS
+    Age: 命中缓存时，缓存结果的秒数
+    """
+    headers = {'X-Cache': cache_status}
+    cached_at = result.get('cached_at')
+    if cache_status == CACHE_HIT and cached_at:
+        headers['Age'] = str(max(int(time.time() - cached_at), 0))
+    return headers
@@ -1,4 +1,5 @@
 import os
+import json
 import logging
 import base64
 import mimetypes
@@ -9,11 +10,19 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
+from django.http import StreamingHttpResponse
+from asgiref.sync import sync_to_async
 from pathlib import Path
 import uuid
 from google import genai
 from google.genai import types
-from .models import IPImage, GeminiUsage, UserQuota
+from .models import IPImage, GeminiUsage, UserQuota, ImageGenerationJob
+from .image_generation_jobs import (
+    submit_image_job, get_job_snapshot, wait_for_job, job_snapshot, get_sync_wait_timeout
+)
+from .quota_ledger import reserve as reserve_quota
+from .content_image_batch import run_content_image_batch, MAX_BATCH_SIZE
+from .usage_rollups import get_usage_counts
 from django.db.models import Count, Q
 from datetime import datetime, timedelta
 from django.utils import timezone
@@ -672,33 +681,30 @@ def get_gemini_usage_stats(request):
         period = request.query_params.get('period', 'all')
         generation_type = request.query_params.get('type', 'all')
 
-        # 基础查询：当前用户的所有记录
-        queryset = GeminiUsage.objects.filter(user=request.user)
-
-        # 根据时间周期过滤
+        # 根据时间周期确定起始时间（None 表示全部）
+        start_date = None
         if period == 'today':
             start_date = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            queryset = queryset.filter(created_at__gte=start_date)
         elif period == 'week':
             start_date = timezone.now() - timedelta(days=7)
-            queryset = queryset.filter(created_at__gte=start_date)
         elif period == 'month':
             start_date = timezone.now() - timedelta(days=30)
-            queryset = queryset.filter(created_at__gte=start_date)
 
-        # 根据生成类型过滤
+        # 统计数据：从汇总表一次查询（与历史记录数无关）
+        counts = get_usage_counts(request.user, start_date, generation_type)
+        total_count = counts['total_count']
+        success_count = counts['success_count']
+        failed_count = total_count - success_count
+        ip_image_count = counts['ip_image_count']
+        content_image_count = counts['content_image_count']
+
+        # 最近的调用记录查询明细（使用 user + created_at 索引）
+        queryset = GeminiUsage.objects.filter(user=request.user)
+        if start_date is not None:
+            queryset = queryset.filter(created_at__gte=start_date)
         if generation_type != 'all':
             queryset = queryset.filter(generation_type=generation_type)
 
-        # 统计数据
-        total_count = queryset.count()
-        success_count = queryset.filter(success=True).count()
-        failed_count = queryset.filter(success=False).count()
-
-        # 按类型统计
-        ip_image_count = queryset.filter(generation_type='ip_image').count()
-        content_image_count = queryset.filter(generation_type='content_image').count()
-
         # 获取最近的调用记录（最多10条）
         recent_usage = queryset.order_by('-created_at')[:10].values(
             'id',
@@ -746,9 +752,46 @@ SUPPORTED_ASPECT_RATIOS = [
 ]
 
 
-def _handle_content_image_generation(request, quota):
+def _is_async_request(request):
+    return str(request.data.get('async', 'false')).lower() == 'true'
+
+
+def _job_response(request, job):
+    """
+    返回任务提交结果
+
+    async=true 时立即返回 202 和 job_id，客户端轮询 status_url（ip-image/jobs/<job_id>）；
+    否则（旧客户端）在接口内最多等待几秒（IMAGE_JOB_SYNC_WAIT_TIMEOUT，上限 5 秒），
+    期间完成时返回与同步接口相同的结果，未完成时同样返回 202
+    """
+    if not _is_async_request(request):
+        snapshot = wait_for_job(job.id, request.user, get_sync_wait_timeout())
+        if snapshot and snapshot['status'] == 'succeeded':
+            return Response(snapshot['result'])
+        if snapshot and snapshot['status'] == 'failed':
+            return Response(snapshot['result'], status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    return Response({
+        'status': 'pending',
+        'job_id': job.id,
+        'job_status': job.status,
+        'status_url': f"/api/ip-image/jobs/{job.id}",
+        'message': '生成任务已提交'
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+def _quota_exceeded_response(user):
+    quota, created = UserQuota.objects.get_or_create(user=user)
+    return Response({
+        'status': 'error',
+        'message': '您的可用次数不足，请购买次数后再试',
+        'available_quota': quota.available_quota
+    }, status=status.HTTP_403_FORBIDDEN)
+
+
+def _handle_content_image_generation(request):
     """
-    处理文案配图生成请求的辅助函数
+    处理文案配图生成请求的辅助函数（预留额度并提交异步任务）
     """
     try:
         # 获取请求参数
@@ -783,82 +826,19 @@ def _handle_content_image_generation(request, quota):
                 'message': '暂未配置图片生成服务，请联系管理员'
             }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
-        try:
-            # 调用新的 REST API 生成函数
-            generated_image_path, used_prompt = generate_content_image_with_rest_api(
-                content,
-                image_index,
-                gemini_api_key,
-                gemini_api_url,
-                request.user.username,
-                include_ip_image,
-                ip_image_url,
-                aspect_ratio
-            )
-
-            if generated_image_path:
-                # 生成访问URL - 强制使用 https
-                image_url = f"https://{request.get_host()}/media/ip_images/{os.path.basename(generated_image_path)}"
-
-                # 扣减用户额度
-                quota.consume_quota()
-                logger.info(f"用户 {request.user.username} 消耗1次额度，剩余: {quota.available_quota}次")
-
-                # 记录使用情况
-                GeminiUsage.objects.create(
-                    user=request.user,
-                    generation_type='content_image',
-                    prompt=used_prompt[:500],
-                    success=True
-                )
-
-                # 获取关联的IP形象ID（如果有）
-                related_ip_image_id = None
-                if include_ip_image:
-                    try:
-                        from api.models import IPImage
-                        ip_image = IPImage.objects.filter(user=request.user).first()
-                        if ip_image:
-                            related_ip_image_id = ip_image.id
-                    except:
-                        pass
-
-                # 保存到素材库
-                from api.utils.image_storage import save_to_media_library
-                save_to_media_library(
-                    user=request.user,
-                    media_type='content_image',
-                    original_url=image_url,
-                    prompt=content[:500],
-                    related_ip_image_id=related_ip_image_id
-                )
-
-                return Response({
-                    'status': 'success',
-                    'image_url': image_url,
-                    'prompt': used_prompt,
-                    'message': '配图生成成功'
-                })
-            else:
-                return Response({
-                    'status': 'error',
-                    'message': '生成失败，请重试'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        job = submit_image_job(request.user, 'content_image', {
+            'content': content,
+            'image_index': image_index,
+            'include_ip_image': include_ip_image,
+            'ip_image_url': ip_image_url,
+            'aspect_ratio': aspect_ratio,
+            'api_url': gemini_api_url,
+            'host': request.get_host(),
+        })
+        if job is None:
+            return _quota_exceeded_response(request.user)
 
-        except Exception as e:
-            logger.error(f"文案配图生成错误: {str(e)}")
-            # 记录失败情况
-            GeminiUsage.objects.create(
-                user=request.user,
-                generation_type='content_image',
-                prompt=content[:500],
-                success=False,
-                error_message=str(e)[:500]
-            )
-            return Response({
-                'status': 'error',
-                'message': f'生成失败: {str(e)}'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return _job_response(request, job)
 
     except Exception as e:
         logger.error(f"处理文案配图请求错误: {str(e)}")
@@ -874,6 +854,8 @@ def generate_ip_image_v2(request):
     """
     使用 Gemini REST API 生成图片（新版本）
 
+    提交时预留1次额度并创建异步任务，由 Celery worker 生成图片，生成失败时退还额度
+
     支持两种模式:
     1. IP形象生成: 上传照片 + 提示语
     2. 文案配图生成: 文案内容
@@ -889,28 +871,24 @@ def generate_ip_image_v2(request):
     - include_ip_image: 是否包含IP形象（可选）
     - ip_image_url: IP形象URL（可选）
 
+    公共参数:
+    - async: 为 true 时立即返回 job_id（202），通过 GET /api/ip-image/jobs/<job_id> 轮询结果；
+             否则等待任务完成后返回结果（兼容旧客户端）
+
     返回:
-    - status: success/error
+    - status: success/error/pending
     - image_url: 生成的图片URL
+    - job_id: 任务ID（pending 时）
     - message: 提示信息
     """
     try:
-        # 检查用户额度
-        quota, created = UserQuota.objects.get_or_create(user=request.user)
-        if not quota.has_quota():
-            return Response({
-                'status': 'error',
-                'message': '您的可用次数不足，请购买次数后再试',
-                'available_quota': quota.available_quota
-            }, status=status.HTTP_403_FORBIDDEN)
-
         # 判断是IP形象生成还是文案配图生成
         uploaded_image = request.FILES.get('image')
         content = request.data.get('content', '')
 
         # 如果有 content 参数，则是文案配图生成
         if content:
-            return _handle_content_image_generation(request, quota)
+            return _handle_content_image_generation(request)
 
         # 否则是 IP 形象生成
         prompt = request.data.get('prompt', '')
@@ -952,10 +930,6 @@ def generate_ip_image_v2(request):
 
         logger.info(f"收到IP形象生成请求(V2): user={request.user.username}, prompt={prompt}, aspect_ratio={aspect_ratio}")
 
-        # 读取上传的图片数据
-        image_data = uploaded_image.read()
-        mime_type = uploaded_image.content_type
-
         # 获取API配置 - V2接口使用专用的IP_IMAGE_API_KEY
         gemini_api_key = os.getenv('IP_IMAGE_API_KEY')
         gemini_api_url = os.getenv('GEMINI_API_URL', 'https://api.apiyi.com/v1beta/models/gemini-3-pro-image-preview:generateContent')
@@ -966,86 +940,227 @@ def generate_ip_image_v2(request):
                 'message': '暂未配置IP形象生成服务，请联系管理员配置 IP_IMAGE_API_KEY 环境变量'
             }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
-        try:
-            generated_image_path = generate_with_gemini_rest_api(
-                image_data,
-                mime_type,
-                prompt,
-                aspect_ratio,
-                gemini_api_key,
-                gemini_api_url,
-                request.user.username
-            )
+        job = submit_image_job(request.user, 'ip_image', {
+            'prompt': prompt,
+            'aspect_ratio': aspect_ratio,
+            'mime_type': uploaded_image.content_type,
+            'api_url': gemini_api_url,
+            'host': request.get_host(),
+        }, image_file=uploaded_image)
+        if job is None:
+            return _quota_exceeded_response(request.user)
 
-            if generated_image_path:
-                # 生成访问URL - 强制使用 https
-                image_url = f"https://{request.get_host()}/media/ip_images/{os.path.basename(generated_image_path)}"
+        return _job_response(request, job)
 
-                # 扣减用户额度
-                quota.consume_quota()
-                logger.info(f"用户 {request.user.username} 消耗1次额度，剩余: {quota.available_quota}次")
+    except Exception as e:
+        logger.error(f"生成IP形象错误(V2): {str(e)}")
+        return Response({
+            'status': 'error',
+            'message': f'生成失败: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-                # 记录成功的调用统计
-                GeminiUsage.objects.create(
-                    user=request.user,
-                    generation_type='ip_image',
-                    prompt=f"{prompt} (纵横比: {aspect_ratio})",
-                    success=True
-                )
 
-                # 保存到素材库
-                from api.utils.image_storage import save_to_media_library
-                save_to_media_library(
-                    user=request.user,
-                    media_type='ip_image',
-                    original_url=image_url,
-                    prompt=f"{prompt} (纵横比: {aspect_ratio})"
-                )
+def _parse_batch_items(data):
+    """
+    解析批量配图的图片列表
 
-                logger.info(f"成功使用 Gemini REST API 生成IP形象: {image_url}")
-                return Response({
-                    'status': 'success',
-                    'image_url': image_url,
-                    'message': 'IP形象生成成功',
-                    'method': 'gemini_rest_api_v2',
-                    'aspect_ratio': aspect_ratio,
-                    'remaining_quota': quota.available_quota
-                })
-            else:
-                # 记录失败的调用统计
-                GeminiUsage.objects.create(
-                    user=request.user,
-                    generation_type='ip_image',
-                    prompt=prompt,
-                    success=False,
-                    error_message='未返回图片数据'
-                )
-                return Response({
-                    'status': 'error',
-                    'message': '生成失败，未返回图片数据'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    aspect_ratios: 每张图片的纵横比（列表或逗号分隔字符串），给出时图片数量为其长度
+    count: 图片数量（未给出 aspect_ratios 时使用，全部使用 aspect_ratio，默认9:16）
+    start_index: 第一张图片的风格索引（默认1，之后依次递增）
+    """
+    aspect_ratios = data.get('aspect_ratios')
+    if isinstance(aspect_ratios, str):
+        aspect_ratios = [r.strip() for r in aspect_ratios.split(',') if r.strip()]
+    if not aspect_ratios:
+        count = int(data.get('count', 3))
+        if count < 1 or count > MAX_BATCH_SIZE:
+            raise ValueError(f'图片数量必须在1到{MAX_BATCH_SIZE}之间')
+        aspect_ratios = [data.get('aspect_ratio', '9:16')] * count
+    if len(aspect_ratios) > MAX_BATCH_SIZE:
+        raise ValueError(f'图片数量必须在1到{MAX_BATCH_SIZE}之间')
+    for aspect_ratio in aspect_ratios:
+        if aspect_ratio not in SUPPORTED_ASPECT_RATIOS:
+            raise ValueError(f'不支持的纵横比 {aspect_ratio}。支持: {", ".join(SUPPORTED_ASPECT_RATIOS)}')
+
+    start_index = int(data.get('start_index', 1))
+    return [
+        {'image_index': start_index + i, 'aspect_ratio': aspect_ratio}
+        for i, aspect_ratio in enumerate(aspect_ratios)
+    ]
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def generate_content_image_batch(request):
+    """
+    批量生成文案配图 - 一次预留全部额度，并发生成，每张图片完成即流式返回
+
+    请求参数:
+    - content: 文案内容
+    - count: 图片数量（1-9，默认3）
+    - aspect_ratio: 纵横比（默认9:16）
+    - aspect_ratios: 每张图片的纵横比列表（可选，给出时忽略 count 和 aspect_ratio）
+    - start_index: 第一张图片的风格索引（可选，默认1）
+    - include_ip_image: 是否包含IP形象（可选）
+    - ip_image_url: IP形象URL（可选）
+    - stream_format: 'ndjson'（默认）或 'sse'
+
+    响应:
+        开始时 {"type": "start", "total", "remaining_quota"}
+        每张图片 {"type": "image", "index", "image_index", "aspect_ratio", "success", "image_url", "prompt", "media_id", ...}
+        结束时 {"type": "done", "succeeded", "failed", "remaining_quota"}
+        失败或未执行的图片退还额度
+    """
+    content = request.data.get('content', '')
+    include_ip_image = str(request.data.get('include_ip_image', 'false')).lower() == 'true'
+    ip_image_url = request.data.get('ip_image_url', '')
+    stream_format = request.data.get('stream_format', 'ndjson')
+
+    if not content.strip():
+        return Response({
+            'status': 'error',
+            'message': '请输入文案内容'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    if len(content) > 1000:
+        return Response({
+            'status': 'error',
+            'message': '文案内容不能超过1000字符'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        items = _parse_batch_items(request.data)
+    except (TypeError, ValueError) as e:
+        return Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    gemini_api_key = os.getenv('IP_IMAGE_API_KEY')
+    gemini_api_url = os.getenv('GEMINI_API_URL', 'https://api.apiyi.com/v1beta/models/gemini-3-pro-image-preview:generateContent')
+
+    if not gemini_api_key:
+        return Response({
+            'status': 'error',
+            'message': '暂未配置图片生成服务，请联系管理员'
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    # 一次性预留整批额度（不足时整批拒绝）
+    reservation = reserve_quota(request.user.id, len(items), source='content_batch')
+    if reservation is None:
+        quota, created = UserQuota.objects.get_or_create(user=request.user)
+        return Response({
+            'status': 'error',
+            'message': f'您的可用次数不足（需要{len(items)}次），请购买次数后再试',
+            'available_quota': quota.available_quota
+        }, status=status.HTTP_403_FORBIDDEN)
 
+    logger.info(f"收到批量文案配图请求: user={request.user.username}, count={len(items)}, include_ip={include_ip_image}")
+
+    # IP形象只下载一次，所有图片共用
+    ip_image_data = None
+    related_ip_image_id = None
+    if include_ip_image and ip_image_url:
+        try:
+            ip_image_data = download_ip_image(ip_image_url)
         except Exception as e:
-            # 记录失败的调用统计
-            GeminiUsage.objects.create(
-                user=request.user,
-                generation_type='ip_image',
-                prompt=prompt,
-                success=False,
-                error_message=str(e)
-            )
-            logger.error(f"Gemini REST API 生成失败: {str(e)}")
-            return Response({
-                'status': 'error',
-                'message': f'生成失败: {str(e)}'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            logger.warning(f"加载IP形象失败，将生成不包含IP形象的配图: {str(e)}")
+        related_ip_image_id = IPImage.objects.filter(user=request.user).values_list('id', flat=True).first()
+
+    if stream_format == 'sse':
+        def encode(event_type, data):
+            return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        content_type = 'text/event-stream'
+    else:
+        def encode(event_type, data):
+            return json.dumps({'type': event_type, **data}, ensure_ascii=False) + '\n'
+        content_type = 'application/x-ndjson'
+
+    @sync_to_async
+    def remaining_quota():
+        return UserQuota.objects.filter(user=request.user).values_list('available_quota', flat=True).first()
+
+    async def event_stream():
+        succeeded = 0
+        failed = 0
+        yield encode('start', {'total': len(items), 'remaining_quota': await remaining_quota()})
+        try:
+            async for result in run_content_image_batch(
+                request.user, items, reservation.id, content, gemini_api_key, gemini_api_url, request.get_host(),
+                include_ip_image=include_ip_image and ip_image_data is not None,
+                ip_image_url=ip_image_url,
+                ip_image_data=ip_image_data,
+                related_ip_image_id=related_ip_image_id
+            ):
+                if result['success']:
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield encode('image', result)
+        except Exception as e:
+            logger.error(f"批量文案配图错误: {str(e)}")
+            yield encode('error', {'message': f'服务器错误: {str(e)}'})
 
-    except Exception as e:
-        logger.error(f"生成IP形象错误(V2): {str(e)}")
+        yield encode('done', {'succeeded': succeeded, 'failed': failed, 'remaining_quota': await remaining_quota()})
+
+    # 异步生成器：ASGI 下每张图片完成即发送（同步生成器会被整个读完后才发送），
+    # 客户端断开时关闭生成器，取消尚未开始的图片并退还额度
+    response = StreamingHttpResponse(event_stream(), content_type=content_type)
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_image_generation_job(request, job_id):
+    """
+    查询图片生成任务状态
+
+    返回:
+    - data.status: pending/running/succeeded/failed
+    - data.result: 完成后的结果（与同步接口返回格式相同）
+    """
+    snapshot = get_job_snapshot(job_id, request.user)
+    if snapshot is None:
         return Response({
             'status': 'error',
-            'message': f'生成失败: {str(e)}'
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            'message': '任务不存在'
+        }, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'status': 'success',
+        'data': snapshot
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def list_image_generation_jobs(request):
+    """
+    批量查询图片生成任务状态
+
+    查询参数:
+    - ids: 逗号分隔的任务ID（最多50个）；不传时返回最近20个任务
+    """
+    ids_param = request.query_params.get('ids', '')
+    if ids_param:
+        try:
+            job_ids = [int(i) for i in ids_param.split(',') if i.strip()][:50]
+        except ValueError:
+            return Response({
+                'status': 'error',
+                'message': 'ids 参数格式错误'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        snapshots = [get_job_snapshot(job_id, request.user) for job_id in job_ids]
+        data = [snapshot for snapshot in snapshots if snapshot is not None]
+    else:
+        jobs = ImageGenerationJob.objects.filter(user=request.user).order_by('-created_at')[:20]
+        data = [job_snapshot(job) for job in jobs]
+
+    return Response({
+        'status': 'success',
+        'data': data
+    })
 
 
 def generate_with_gemini_rest_api(image_data, mime_type, prompt, aspect_ratio, api_key, api_url, username):
@@ -1160,7 +1275,15 @@ def generate_with_gemini_rest_api(image_data, mime_type, prompt, aspect_ratio, a
         raise
 
 
-def generate_content_image_with_rest_api(content, image_index, api_key, api_url, username, include_ip_image=False, ip_image_url='', aspect_ratio='9:16'):
+def download_ip_image(ip_image_url):
+    """下载用户IP形象图片，返回图片数据"""
+    logger.info(f"下载用户IP形象用于文案配图: {ip_image_url}")
+    response = requests.get(ip_image_url, timeout=10)
+    response.raise_for_status()
+    return response.content
+
+
+def generate_content_image_with_rest_api(content, image_index, api_key, api_url, username, include_ip_image=False, ip_image_url='', aspect_ratio='9:16', ip_image_data=None):
     """
     使用 Gemini REST API 根据文案生成配图
 
@@ -1173,6 +1296,7 @@ def generate_content_image_with_rest_api(content, image_index, api_key, api_url,
     - include_ip_image: 是否包含IP形象
     - ip_image_url: IP形象图片URL
     - aspect_ratio: 纵横比（默认9:16）
+    - ip_image_data: 已下载的IP形象图片数据（批量生成时只下载一次）
 
     返回:
     - (生成的图片文件路径, 使用的提示语)
@@ -1203,16 +1327,13 @@ def generate_content_image_with_rest_api(content, image_index, api_key, api_url,
         # 处理IP形象图片（如果需要包含）
         parts = [{"text": base_prompt}]
 
-        if include_ip_image and ip_image_url:
+        if include_ip_image and (ip_image_data or ip_image_url):
             try:
-                logger.info(f"下载用户IP形象用于文案配图: {ip_image_url}")
-
-                # 下载IP形象图片
-                response = requests.get(ip_image_url, timeout=10)
-                response.raise_for_status()
+                if ip_image_data is None:
+                    ip_image_data = download_ip_image(ip_image_url)
 
                 # 将IP形象编码为 base64
-                ip_image_base64 = base64.b64encode(response.content).decode('utf-8')
+                ip_image_base64 = base64.b64encode(ip_image_data).decode('utf-8')
 
                 # 添加IP形象到请求中
                 parts.append({
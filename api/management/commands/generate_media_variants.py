@@ -0,0 +1,41 @@
+"""
+为素材库图片补生成缩略图、WebP 版本和感知哈希（新素材由 Celery 任务自动生成）
+
+用法:
+    python manage.py generate_media_variants
+    python manage.py generate_media_variants --media 12 --force
+    python manage.py generate_media_variants --limit 500
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from api.models import MediaLibrary
+from api.media_variants import generate_media_variants
+
+
+class Command(BaseCommand):
+    help = '为尚未生成多尺寸版本或感知哈希的素材生成缩略图、WebP 版本和感知哈希'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--media', type=int, action='append', help='只处理指定素材ID，可重复')
+        parser.add_argument('--limit', type=int, help='最多处理的素材数')
+        parser.add_argument('--force', action='store_true', help='已生成的也重新生成')
+
+    def handle(self, *args, **options):
+        queryset = MediaLibrary.objects.exclude(local_path='').order_by('id')
+        if options['media']:
+            queryset = queryset.filter(id__in=options['media'])
+        if not options['force']:
+            queryset = queryset.filter(Q(variants_generated_at__isnull=True) | Q(phash__isnull=True))
+        media_ids = list(queryset.values_list('id', flat=True))
+        if options['limit']:
+            media_ids = media_ids[:options['limit']]
+
+        generated = failed = 0
+        for media_id in media_ids:
+            try:
+                if generate_media_variants(media_id, force=options['force']):
+                    generated += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(self.style.WARNING(f"素材 {media_id}: {str(e)}"))
+        self.stdout.write(self.style.SUCCESS(f"共 {len(media_ids)} 个素材，已生成 {generated} 个，失败 {failed} 个"))
@@ -0,0 +1,37 @@
+"""
+把素材库旧文件（user_{id}_{uuid}_{时间}.png）迁移到按内容哈希存储，相同图片合并为一个文件
+
+用法:
+    python manage.py migrate_media_storage
+    python manage.py migrate_media_storage --limit 1000
+"""
+from django.core.management.base import BaseCommand
+from api.models import MediaLibrary
+from api.utils.image_storage import adopt_legacy_media
+
+
+class Command(BaseCommand):
+    help = '把没有关联 MediaFile 的素材迁移到内容寻址存储，并重新排队生成多尺寸版本'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='最多迁移的素材数')
+
+    def handle(self, *args, **options):
+        from api.tasks import generate_media_variants_task
+
+        queryset = MediaLibrary.objects.filter(media_file__isnull=True).exclude(local_path='').order_by('id')
+        if options['limit']:
+            queryset = queryset[:options['limit']]
+
+        migrated = skipped = failed = 0
+        for media in queryset.iterator():
+            try:
+                if adopt_legacy_media(media):
+                    migrated += 1
+                    generate_media_variants_task.delay(media.id)
+                else:
+                    skipped += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(self.style.WARNING(f"素材 {media.id}: {str(e)}"))
+        self.stdout.write(self.style.SUCCESS(f"已迁移 {migrated} 个素材，跳过 {skipped} 个，失败 {failed} 个"))
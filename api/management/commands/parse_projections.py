@@ -0,0 +1,90 @@
+"""
+解析保险公司利益演示投影文件（md*.json）
+
+用法:
+    # 导出行式JSON（与 tasks/transform_*.py 的输出一致）
+    python manage.py parse_projections tasks/md3.json --preset standard -o tasks/md31.json
+    python manage.py parse_projections tasks/md4.json --preset withdrawal -o tasks/md4_withdrawal.json
+    python manage.py parse_projections tasks/md5.json --preset withdrawal_realization --scenario low
+
+    # 导出列式 npz（所有有数据的情景投影，或用 --options 选择）
+    python manage.py parse_projections tasks/md5.json --format npz -o md5.npz
+    python manage.py parse_projections tasks/md5.json --format npz --options Withdrawal,Realization --options ""
+
+    # 查看文件中的情景投影和列
+    python manage.py parse_projections tasks/md5.json --list
+"""
+import json
+import os
+from django.core.management.base import BaseCommand, CommandError
+from api.projection_parser import parse_projections_file, ROW_PRESETS, SCENARIOS
+
+
+class Command(BaseCommand):
+    help = '流式解析 md*.json 利益演示投影，导出行式JSON或列式npz'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='md*.json 文件路径')
+        parser.add_argument('-o', '--output', help='输出文件路径（默认输出到标准输出，npz 格式必须指定）')
+        parser.add_argument('--format', choices=['rows', 'npz'], default='rows', help='输出格式')
+        parser.add_argument('--preset', choices=sorted(ROW_PRESETS), default='standard', help='行式导出的字段预设')
+        parser.add_argument('--scenario', choices=SCENARIOS, default='current',
+                            help='current 为当前假设情景（无后缀列），low / high 取 Low / High 后缀列')
+        parser.add_argument('--options', action='append',
+                            help='只保留的 policyOptions 组合（逗号分隔，空字符串表示基本计划），可重复')
+        parser.add_argument('--stream', action='store_true', help='强制流式解析（默认大文件才流式解析）')
+        parser.add_argument('--list', action='store_true', help='只列出情景投影及列数')
+
+    def handle(self, *args, **options):
+        input_path = options['input']
+        if not os.path.exists(input_path):
+            raise CommandError(f'找不到文件: {input_path}')
+
+        selected = None
+        if options['options'] is not None:
+            selected = [[o.strip() for o in value.split(',') if o.strip()] for value in options['options']]
+        elif options['format'] == 'rows' and not options['list']:
+            preset = ROW_PRESETS[options['preset']]
+            selected = [preset['options']] + list(preset.get('fallback', []))
+
+        try:
+            projections = parse_projections_file(
+                input_path, options=selected, stream=True if options['stream'] else None
+            )
+        except (ValueError, KeyError) as e:
+            raise CommandError(f'解析失败: {e}')
+
+        self.stderr.write(f"产品代码: {projections.product.get('code', 'N/A')}，情景投影: {len(projections)} 个")
+
+        if options['list']:
+            for index, projection in enumerate(projections):
+                years = projection.years
+                year_range = f'{years.min()}-{years.max()}' if years.size else '-'
+                self.stdout.write(
+                    f'[{index}] policyOptions={list(projection.options)} 列数={len(projection.columns)} 年度={year_range}'
+                )
+            return
+
+        if options['format'] == 'npz':
+            if not options['output']:
+                raise CommandError('npz 格式需要用 -o 指定输出文件')
+            projections.projections = [p for p in projections if p.has_data]
+            projections.save_npz(options['output'])
+            self.stderr.write(self.style.SUCCESS(
+                f"✓ 已保存 {len(projections)} 个情景投影到: {options['output']}"
+            ))
+            return
+
+        try:
+            data = projections.to_rows(options['preset'], scenario=options['scenario'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        text = json.dumps(data, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(text)
+            record_count = len(next(iter(data.values())))
+            self.stderr.write(self.style.SUCCESS(f"✓ 共 {record_count} 条记录，已保存到: {options['output']}"))
+        else:
+            self.stdout.write(text)
@@ -0,0 +1,26 @@
+"""
+从 GeminiUsage 明细重建调用次数汇总（首次上线回填，或汇总与明细不一致时修复）
+
+用法:
+    python manage.py rebuild_usage_rollups
+    python manage.py rebuild_usage_rollups --user 12 --user 15
+    python manage.py rebuild_usage_rollups --compact
+"""
+from django.core.management.base import BaseCommand
+from api.usage_rollups import rebuild_rollups, compact_rollups
+
+
+class Command(BaseCommand):
+    help = '从Gemini调用记录重建小时/天/累计汇总（建议在低峰期运行，重建期间新写入的记录可能重复计数）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', help='只重建指定用户ID，可重复')
+        parser.add_argument('--compact', action='store_true', help='只把超过保留期的小时桶合并为天桶')
+
+    def handle(self, *args, **options):
+        if options['compact']:
+            compacted = compact_rollups()
+            self.stdout.write(self.style.SUCCESS(f"已合并 {compacted} 个小时桶"))
+            return
+        rows = rebuild_rollups(user_ids=options['user'])
+        self.stdout.write(self.style.SUCCESS(f"已重建 {rows} 行汇总"))
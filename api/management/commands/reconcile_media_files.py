@@ -0,0 +1,29 @@
+"""
+回收 media 目录中的孤儿文件（与定时任务 reconcile_media_files_task 相同逻辑）
+
+用法:
+    python manage.py reconcile_media_files --dry-run
+    python manage.py reconcile_media_files
+    python manage.py reconcile_media_files --grace 600
+"""
+import json
+from django.core.management.base import BaseCommand
+from api.media_cleanup import reconcile_media_files, DEFAULT_GRACE_SECONDS
+
+
+class Command(BaseCommand):
+    help = '修正素材文件引用数，删除 generated_images / plan_documents 中没有数据库引用的文件和过期的 TTS 文件'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='只统计不删除')
+        parser.add_argument('--grace', type=int, default=DEFAULT_GRACE_SECONDS,
+                            help=f'跳过最近修改的文件（秒），默认 {DEFAULT_GRACE_SECONDS}')
+
+    def handle(self, *args, **options):
+        summary = reconcile_media_files(dry_run=options['dry_run'], grace_seconds=options['grace'])
+        self.stdout.write(json.dumps(summary, ensure_ascii=False, indent=2))
+        removed = sum(value['removed'] for value in summary.values() if isinstance(value, dict))
+        freed = sum(value['freed_bytes'] for value in summary.values() if isinstance(value, dict))
+        self.stdout.write(self.style.SUCCESS(
+            f"{'可' if options['dry_run'] else '已'}删除 {removed} 个文件，释放 {freed / (1024 * 1024):.1f} MB"
+        ))
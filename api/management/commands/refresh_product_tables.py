@@ -0,0 +1,41 @@
+"""
+用保险公司API刷新产品退保价值表（与定时任务 refresh_product_tables_task 相同逻辑）
+
+用法:
+    python manage.py refresh_product_tables
+    python manage.py refresh_product_tables --company axa --dry-run
+    python manage.py refresh_product_tables --product 12 --product 15
+
+    # 指向本地桩服务器测试（先运行 python scripts/stub_insurer_server.py）
+    python manage.py refresh_product_tables --base-url http://127.0.0.1:8765 --dry-run
+"""
+import json
+from django.core.management.base import BaseCommand
+from api.product_refresh import refresh_product_tables
+
+
+class Command(BaseCommand):
+    help = '并发请求保险公司API，只更新退保价值表有变化的产品，并重建标准对比快照'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int, action='append', help='只刷新指定产品ID，可重复')
+        parser.add_argument('--company', action='append', help='只刷新指定保险公司代码的产品，可重复')
+        parser.add_argument('--base-url', help='把请求发往该地址（协议+主机），用于本地桩服务器测试')
+        parser.add_argument('--timeout', type=float, help='单个请求超时（秒），默认按主机配置')
+        parser.add_argument('--dry-run', action='store_true', help='只比较不写入')
+
+    def handle(self, *args, **options):
+        summary = refresh_product_tables(
+            product_ids=options['product'],
+            company_codes=options['company'],
+            dry_run=options['dry_run'],
+            base_url=options['base_url'],
+            timeout=options['timeout'],
+        )
+        for error in summary['errors']:
+            self.stderr.write(self.style.WARNING(f"产品 {error['product_id']}: {error['message']}"))
+        self.stdout.write(json.dumps(summary, ensure_ascii=False, indent=2))
+        self.stdout.write(self.style.SUCCESS(
+            f"共 {summary['total']} 个产品，{'需要' if options['dry_run'] else '已'}更新 {summary['changed']} 个，"
+            f"未变 {summary['unchanged']} 个，失败 {summary['failed']} 个"
+        ))
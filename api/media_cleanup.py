@@ -0,0 +1,215 @@
+"""
+素材批量删除与孤儿文件回收
+批量删除用一条 DELETE 语句删除素材记录，并在同一事务中写入待释放的文件引用（MediaFileRelease），
+引用的释放和文件删除交给 Celery 任务，接口不等待磁盘操作；每条释放记录执行时在同一事务中删除，任务重试不会重复释放；
+定时任务 reconcile_media_files 扫描 media 下的
+generated_images / plan_documents / tts 目录，与数据库引用对比后删除孤儿文件
+"""
+import os
+import time
+import logging
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# 修改时间在该时长内的文件不处理（可能正在写入或尚未提交数据库记录）
+DEFAULT_GRACE_SECONDS = 60 * 60
+
+# generated_images/tmp 中未完成的临时文件保留时长
+TEMP_FILE_MAX_AGE = 24 * 60 * 60
+
+
+def get_tts_retention_days():
+    """TTS 输出文件（没有数据库记录）的保留天数"""
+    return getattr(settings, 'MEDIA_TTS_RETENTION_DAYS', 7)
+
+
+def _media_root():
+    return os.path.join(settings.BASE_DIR, 'media')
+
+
+def bulk_delete_media(user, media_ids):
+    """
+    批量删除用户的素材：一次查询取出文件信息，一条 DELETE 删除记录并写入待释放的引用，
+    事务提交后由 Celery 任务释放文件引用、删除文件
+
+    Returns:
+        int: 删除的素材数
+    """
+    from .models import MediaLibrary
+    from .media_similarity import invalidate_user_index
+    from .tasks import remove_media_files_task
+    from .utils.image_storage import queue_media_file_releases
+
+    rows = list(MediaLibrary.objects.filter(user=user, id__in=media_ids).values_list(
+        'id', 'media_file_id', 'local_path', 'thumbnail_path', 'variants'
+    ))
+    if not rows:
+        return 0
+
+    ids = [row[0] for row in rows]
+    media_file_counts = Counter(row[1] for row in rows if row[1])
+    # 旧数据（没有 media_file）的原图和多尺寸版本直接删除
+    legacy_paths = []
+    for _, media_file_id, local_path, thumbnail_path, variants in rows:
+        if media_file_id:
+            continue
+        legacy_paths.extend(path for path in [local_path, thumbnail_path, *(variants or {}).values()] if path)
+
+    # 不经过 ORM 逐行删除（避免逐行触发 post_delete 信号），文件引用由下面的任务统一释放
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            ids_placeholder = ', '.join(['%s'] * len(ids))
+            cursor.execute(
+                f"DELETE FROM {MediaLibrary._meta.db_table} WHERE user_id = %s AND id IN ({ids_placeholder})",
+                [user.id, *ids]
+            )
+            deleted_count = cursor.rowcount
+        batch = queue_media_file_releases(media_file_counts) if media_file_counts else None
+        transaction.on_commit(lambda: remove_media_files_task.delay(batch, legacy_paths))
+        transaction.on_commit(lambda: invalidate_user_index(user.id))
+
+    logger.info(f"🗑️ 用户 {user.username} 批量删除 {deleted_count} 个素材，文件已排队删除")
+    return deleted_count
+
+
+def remove_media_files(batch, legacy_paths):
+    """
+    释放内容文件引用并删除旧数据文件（在 Celery worker 中调用，可重复执行）
+
+    Args:
+        batch: 待释放引用的批次号（没有内容文件时为 None）
+        legacy_paths: 相对 media 目录的文件路径
+
+    Returns:
+        dict: {'released_files', 'removed_paths'}
+    """
+    from .utils.image_storage import apply_media_file_releases
+
+    released = apply_media_file_releases(batch=batch) if batch else 0
+
+    removed = 0
+    media_root = _media_root()
+    for relative_path in legacy_paths:
+        try:
+            os.remove(os.path.join(media_root, relative_path))
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"⚠️ 删除文件失败: {relative_path}, {str(e)}")
+    return {'released_files': released, 'removed_paths': removed}
+
+
+def repair_media_file_refs(dry_run=False, grace_seconds=DEFAULT_GRACE_SECONDS):
+    """
+    按实际引用的素材数修正 MediaFile.ref_count（进程中断、保存素材失败等导致的偏差），
+    没有素材引用的文件记录删除；最近被引用过的文件可能正在保存素材，跳过。
+    先执行超过宽限时间仍未执行的待释放记录（任务重试耗尽或丢失），
+    还有待释放记录的文件不修正（素材已删除但引用尚未释放，修正后任务会再减一次）
+
+    Returns:
+        dict: {'fixed', 'deleted', 'stale_releases'}
+    """
+    from .models import MediaFile, MediaFileRelease
+    from .utils.image_storage import apply_media_file_releases, release_media_file
+
+    cutoff = timezone.now() - timedelta(seconds=grace_seconds)
+    stale_releases = MediaFileRelease.objects.filter(created_at__lt=cutoff).count()
+    if stale_releases and not dry_run:
+        apply_media_file_releases(older_than=cutoff)
+
+    fixed = deleted = 0
+    rows = MediaFile.objects.filter(updated_at__lt=cutoff).exclude(
+        id__in=MediaFileRelease.objects.values('media_file_id')
+    ).annotate(actual=Count('media_items')).values_list('id', 'ref_count', 'actual')
+    for media_file_id, ref_count, actual in rows.iterator():
+        if ref_count == actual:
+            continue
+        if actual == 0:
+            deleted += 1
+            if not dry_run:
+                release_media_file(media_file_id, count=ref_count or 1)
+            continue
+        fixed += 1
+        if not dry_run:
+            MediaFile.objects.filter(id=media_file_id).update(ref_count=actual)
+    return {'fixed': fixed, 'deleted': deleted, 'stale_releases': stale_releases}
+
+
+def _referenced_media_paths():
+    """数据库中引用的 generated_images / plan_documents 文件（相对 media 目录）"""
+    from .models import MediaLibrary, MediaFile, PlanDocument
+
+    referenced = set()
+    for local_path, thumbnail_path, variants in MediaLibrary.objects.values_list(
+            'local_path', 'thumbnail_path', 'variants').iterator():
+        referenced.update(path for path in [local_path, thumbnail_path, *(variants or {}).values()] if path)
+    referenced.update(MediaFile.objects.values_list('path', flat=True).iterator())
+    referenced.update(path for path in PlanDocument.objects.values_list('file_path', flat=True).iterator() if path)
+    return {os.path.normpath(path) for path in referenced}
+
+
+def _iter_files(directory):
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            yield os.path.join(root, filename)
+
+
+def reconcile_media_files(dry_run=False, grace_seconds=DEFAULT_GRACE_SECONDS):
+    """
+    回收孤儿文件（由 celery beat 每天调用）
+
+    - generated_images、plan_documents：没有数据库记录引用的文件
+    - generated_images/tmp：超过1天的未完成临时文件
+    - tts：超过保留天数的合成结果（没有数据库记录）
+
+    Returns:
+        dict: 各目录删除的文件数和释放的字节数
+    """
+    media_root = _media_root()
+    now = time.time()
+    refs = repair_media_file_refs(dry_run=dry_run, grace_seconds=grace_seconds)
+    referenced = _referenced_media_paths()
+
+    summary = {'refs_fixed': refs['fixed'], 'refs_deleted': refs['deleted'],
+               'stale_releases': refs['stale_releases'], 'dry_run': dry_run}
+    temp_dir = os.path.join(media_root, 'generated_images', 'tmp')
+    tts_max_age = get_tts_retention_days() * 24 * 60 * 60
+
+    for subdir in ('generated_images', 'plan_documents', 'tts'):
+        removed = freed = 0
+        for absolute_path in _iter_files(os.path.join(media_root, subdir)):
+            try:
+                stat = os.stat(absolute_path)
+            except FileNotFoundError:
+                continue
+            age = now - stat.st_mtime
+            relative_path = os.path.relpath(absolute_path, media_root)
+
+            if subdir == 'tts':
+                orphan = age > tts_max_age
+            elif absolute_path.startswith(temp_dir + os.sep):
+                orphan = age > TEMP_FILE_MAX_AGE
+            else:
+                orphan = age > grace_seconds and relative_path not in referenced
+            if not orphan:
+                continue
+
+            if not dry_run:
+                try:
+                    os.remove(absolute_path)
+                except OSError as e:
+                    logger.warning(f"⚠️ 删除孤儿文件失败: {relative_path}, {str(e)}")
+                    continue
+            removed += 1
+            freed += stat.st_size
+        summary[subdir] = {'removed': removed, 'freed_bytes': freed}
+
+    logger.info(f"🧹 孤儿文件回收{'（试运行）' if dry_run else ''}: {summary}")
+    return summary
@@ -2,24 +2,48 @@
 素材库管理视图
 提供用户素材库的查询、删除、上传等功能
 """
+import base64
 import logging
-import os
-import uuid
-from datetime import datetime
-from PIL import Image
-from io import BytesIO
-from django.conf import settings
+from datetime import datetime, timedelta, timezone as dt_timezone
 from rest_framework.decorators import api_view, permission_classes, parser_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
-from django.db.models import Q
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
 from .models import MediaLibrary
-from .utils.image_storage import delete_media_file
+from .utils.image_storage import delete_media_files, store_image_chunks, release_media_file
+from .media_variants import build_media_urls
+from .media_cleanup import bulk_delete_media
+from .media_similarity import (
+    find_similar, find_duplicate_groups, pick_duplicates_to_remove,
+    DEFAULT_MAX_DISTANCE, DEFAULT_DEDUP_DISTANCE, MAX_DISTANCE_LIMIT
+)
 
 logger = logging.getLogger(__name__)
 
+# 分页游标的时间基准（用整数微秒编码 created_at，避免浮点误差）
+CURSOR_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _encode_cursor(media):
+    """游标：最后一条记录的 (created_at 微秒时间戳, id)"""
+    microseconds = (media.created_at - CURSOR_EPOCH) // timedelta(microseconds=1)
+    raw = f"{microseconds}:{media.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    """解析游标，格式错误时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, media_id = raw.split(':')
+        created_at = CURSOR_EPOCH + timedelta(microseconds=int(timestamp))
+        return created_at, int(media_id)
+    except Exception:
+        raise ValueError('无效的分页游标')
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -30,18 +54,20 @@ def get_media_library(request):
     查询参数:
     - media_type: 筛选素材类型 ('ip_image' 或 'content_image')
     - is_favorite: 筛选收藏状态 (true/false)
-    - page: 页码（默认1）
-    - page_size: 每页数量（默认20）
+    - cursor: 分页游标（上一页返回的 next_cursor，第一页传空字符串），按 (created_at, id) 定位，翻页深度不影响速度
+    - page: 页码（默认1，未传 cursor 时使用，兼容旧客户端）
+    - page_size: 每页数量（默认20，最大100）
     """
     try:
         # 获取查询参数
         media_type = request.GET.get('media_type', '')
         is_favorite = request.GET.get('is_favorite', '')
+        cursor = request.GET.get('cursor')
         page = int(request.GET.get('page', 1))
-        page_size = int(request.GET.get('page_size', 20))
+        page_size = min(max(int(request.GET.get('page_size', 20)), 1), 100)
 
-        # 构建查询
-        queryset = MediaLibrary.objects.filter(user=request.user)
+        # 构建查询（排序与 (user, media_type, created_at) / (user, created_at) 索引一致）
+        queryset = MediaLibrary.objects.filter(user=request.user).order_by('-created_at', '-id')
 
         # 按类型筛选
         if media_type in ['ip_image', 'content_image']:
@@ -51,28 +77,59 @@ def get_media_library(request):
         if is_favorite.lower() == 'true':
             queryset = queryset.filter(is_favorite=True)
 
-        # 获取总数
-        total_count = queryset.count()
-
-        # 分页
-        start = (page - 1) * page_size
-        end = start + page_size
-        media_list = queryset[start:end]
+        if cursor is not None:
+            # 游标分页：从上一页最后一条之后开始，多取一条判断是否还有下一页
+            if cursor:
+                try:
+                    cursor_created_at, cursor_id = _decode_cursor(cursor)
+                except ValueError as e:
+                    return Response({
+                        'status': 'error',
+                        'message': str(e)
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                queryset = queryset.filter(
+                    Q(created_at__lt=cursor_created_at) |
+                    Q(created_at=cursor_created_at, id__lt=cursor_id)
+                )
+            media_list = list(queryset[:page_size + 1])
+            has_more = len(media_list) > page_size
+            media_list = media_list[:page_size]
+            pagination = {
+                'page_size': page_size,
+                'has_more': has_more,
+                'next_cursor': _encode_cursor(media_list[-1]) if has_more else None,
+            }
+        else:
+            # 获取总数
+            total_count = queryset.count()
+
+            # 分页
+            start = (page - 1) * page_size
+            end = start + page_size
+            media_list = list(queryset[start:end])
+            pagination = {
+                'total': total_count,
+                'page': page,
+                'page_size': page_size,
+                'total_pages': (total_count + page_size - 1) // page_size,
+                'has_more': end < total_count,
+                'next_cursor': _encode_cursor(media_list[-1]) if media_list and end < total_count else None,
+            }
 
         # 序列化数据
         data = []
+        host = request.get_host()
         for media in media_list:
-            # 构建访问URL
-            if media.local_path:
-                media_url = f"https://{request.get_host()}/media/{media.local_path}"
-            else:
-                media_url = media.original_url
+            # 构建访问URL（网格使用缩略图，大图按 srcset 选择合适宽度）
+            urls = build_media_urls(media, host)
 
             data.append({
                 'id': media.id,
                 'media_type': media.media_type,
                 'media_type_display': media.get_media_type_display(),
-                'url': media_url,
+                'url': urls['url'],
+                'thumbnail_url': urls['thumbnail_url'],
+                'srcset': urls['srcset'],
                 'original_url': media.original_url,
                 'prompt': media.prompt,
                 'width': media.width,
@@ -87,10 +144,7 @@ def get_media_library(request):
             'status': 'success',
             'data': {
                 'items': data,
-                'total': total_count,
-                'page': page,
-                'page_size': page_size,
-                'total_pages': (total_count + page_size - 1) // page_size
+                **pagination
             }
         })
 
@@ -112,10 +166,7 @@ def get_media_detail(request, media_id):
         media = MediaLibrary.objects.get(id=media_id, user=request.user)
 
         # 构建访问URL
-        if media.local_path:
-            media_url = f"https://{request.get_host()}/media/{media.local_path}"
-        else:
-            media_url = media.original_url
+        urls = build_media_urls(media, request.get_host())
 
         return Response({
             'status': 'success',
@@ -123,7 +174,9 @@ def get_media_detail(request, media_id):
                 'id': media.id,
                 'media_type': media.media_type,
                 'media_type_display': media.get_media_type_display(),
-                'url': media_url,
+                'url': urls['url'],
+                'thumbnail_url': urls['thumbnail_url'],
+                'srcset': urls['srcset'],
                 'original_url': media.original_url,
                 'prompt': media.prompt,
                 'width': media.width,
@@ -158,7 +211,7 @@ def toggle_favorite(request, media_id):
     try:
         media = MediaLibrary.objects.get(id=media_id, user=request.user)
         media.is_favorite = not media.is_favorite
-        media.save()
+        media.save(update_fields=['is_favorite', 'updated_at'])
 
         return Response({
             'status': 'success',
@@ -188,9 +241,8 @@ def delete_media(request, media_id):
     try:
         media = MediaLibrary.objects.get(id=media_id, user=request.user)
 
-        # 删除本地文件
-        if media.local_path:
-            delete_media_file(media.local_path)
+        # 删除本地文件（共用的文件在没有其他素材引用时才删除）
+        delete_media_files(media)
 
         # 删除数据库记录
         media.delete()
@@ -233,21 +285,8 @@ def batch_delete_media(request):
                 'message': '请提供有效的素材ID列表'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # 查询要删除的素材
-        media_list = MediaLibrary.objects.filter(
-            id__in=media_ids,
-            user=request.user
-        )
-
-        deleted_count = 0
-        for media in media_list:
-            # 删除本地文件
-            if media.local_path:
-                delete_media_file(media.local_path)
-            deleted_count += 1
-
-        # 批量删除数据库记录
-        media_list.delete()
+        # 一条语句删除记录，文件由后台任务删除
+        deleted_count = bulk_delete_media(request.user, media_ids)
 
         return Response({
             'status': 'success',
@@ -262,6 +301,171 @@ def batch_delete_media(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _parse_max_distance(value, default):
+    try:
+        return min(max(int(value), 0), MAX_DISTANCE_LIMIT)
+    except (TypeError, ValueError):
+        return default
+
+
+def _serialize_brief(media, host):
+    urls = build_media_urls(media, host)
+    return {
+        'id': media.id,
+        'media_type': media.media_type,
+        'url': urls['url'],
+        'thumbnail_url': urls['thumbnail_url'],
+        'width': media.width,
+        'height': media.height,
+        'file_size': media.file_size,
+        'is_favorite': media.is_favorite,
+        'created_at': media.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_similar_media(request, media_id):
+    """
+    查找与指定素材相似的素材
+
+    查询参数:
+    - max_distance: 最大汉明距离（0-20，默认10，越小越相似）
+    - limit: 返回数量（默认20，最大100）
+    """
+    try:
+        media = MediaLibrary.objects.get(id=media_id, user=request.user)
+        max_distance = _parse_max_distance(request.GET.get('max_distance'), DEFAULT_MAX_DISTANCE)
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+
+        if media.phash is None:
+            return Response({
+                'status': 'success',
+                'data': {'items': [], 'indexed': False}
+            })
+
+        matches = find_similar(request.user.id, media, max_distance=max_distance, limit=limit)
+        media_by_id = MediaLibrary.objects.filter(user=request.user, id__in=[media_id for _, media_id in matches]).in_bulk()
+        host = request.get_host()
+        items = [
+            {**_serialize_brief(media_by_id[other_id], host), 'distance': distance}
+            for distance, other_id in matches if other_id in media_by_id
+        ]
+
+        return Response({
+            'status': 'success',
+            'data': {'items': items, 'indexed': True}
+        })
+
+    except MediaLibrary.DoesNotExist:
+        return Response({
+            'status': 'error',
+            'message': '素材不存在'
+        }, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        logger.error(f"查找相似素材失败: {str(e)}")
+        return Response({
+            'status': 'error',
+            'message': f'查找相似素材失败: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_duplicate_media(request):
+    """
+    列出相似素材分组
+
+    查询参数:
+    - max_distance: 最大汉明距离（0-20，默认4）
+    """
+    try:
+        max_distance = _parse_max_distance(request.GET.get('max_distance'), DEFAULT_DEDUP_DISTANCE)
+        groups = find_duplicate_groups(request.user.id, max_distance=max_distance)
+        media_by_id = MediaLibrary.objects.filter(
+            user=request.user, id__in=[media_id for group in groups for media_id in group]
+        ).in_bulk()
+        host = request.get_host()
+
+        data = []
+        for group in groups:
+            items = [media_by_id[media_id] for media_id in group if media_id in media_by_id]
+            if len(items) < 2:
+                continue
+            removable = {item.id for item in pick_duplicates_to_remove(items, max_distance)}
+            data.append({
+                'items': [{**_serialize_brief(item, host), 'suggest_delete': item.id in removable} for item in items],
+                'reclaimable_size': sum(item.file_size or 0 for item in items if item.id in removable),
+            })
+
+        return Response({
+            'status': 'success',
+            'data': {
+                'groups': data,
+                'group_count': len(data),
+                'max_distance': max_distance,
+            }
+        })
+
+    except Exception as e:
+        logger.error(f"查找重复素材失败: {str(e)}")
+        return Response({
+            'status': 'error',
+            'message': f'查找重复素材失败: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def dedup_media(request):
+    """
+    删除相似素材，每组保留收藏的素材（没有收藏时保留分辨率最高的一张）
+
+    请求体:
+    {
+        "max_distance": 4,     // 可选，默认4
+        "dry_run": false       // 可选，true 时只返回将删除的素材
+    }
+    """
+    try:
+        max_distance = _parse_max_distance(request.data.get('max_distance'), DEFAULT_DEDUP_DISTANCE)
+        dry_run = str(request.data.get('dry_run', 'false')).lower() == 'true'
+
+        groups = find_duplicate_groups(request.user.id, max_distance=max_distance)
+        media_by_id = MediaLibrary.objects.filter(
+            user=request.user, id__in=[media_id for group in groups for media_id in group]
+        ).in_bulk()
+        to_remove = []
+        for group in groups:
+            items = [media_by_id[media_id] for media_id in group if media_id in media_by_id]
+            if len(items) > 1:
+                to_remove.extend(pick_duplicates_to_remove(items, max_distance))
+
+        remove_ids = [item.id for item in to_remove]
+        reclaimed_size = sum(item.file_size or 0 for item in to_remove)
+        if not dry_run and remove_ids:
+            bulk_delete_media(request.user, remove_ids)
+            logger.info(f"🧹 用户 {request.user.username} 删除了 {len(remove_ids)} 个相似素材")
+
+        return Response({
+            'status': 'success',
+            'message': f"{'将' if dry_run else '已'}删除 {len(remove_ids)} 个相似素材",
+            'data': {
+                'deleted_ids': remove_ids,
+                'deleted_count': len(remove_ids),
+                'reclaimed_size': reclaimed_size,
+                'dry_run': dry_run,
+            }
+        })
+
+    except Exception as e:
+        logger.error(f"删除相似素材失败: {str(e)}")
+        return Response({
+            'status': 'error',
+            'message': f'删除失败: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_media_stats(request):
@@ -269,31 +473,19 @@ def get_media_stats(request):
     获取用户素材库统计信息
     """
     try:
-        # 总数统计
-        total_count = MediaLibrary.objects.filter(user=request.user).count()
-
-        # 按类型统计
-        ip_image_count = MediaLibrary.objects.filter(
-            user=request.user,
-            media_type='ip_image'
-        ).count()
-
-        content_image_count = MediaLibrary.objects.filter(
-            user=request.user,
-            media_type='content_image'
-        ).count()
-
-        # 收藏数量
-        favorite_count = MediaLibrary.objects.filter(
-            user=request.user,
-            is_favorite=True
-        ).count()
-
-        # 总存储大小
-        from django.db.models import Sum
-        total_size = MediaLibrary.objects.filter(
-            user=request.user
-        ).aggregate(Sum('file_size'))['file_size__sum'] or 0
+        # 一次条件聚合查询得到全部统计
+        stats = MediaLibrary.objects.filter(user=request.user).aggregate(
+            total_count=Count('id'),
+            ip_image_count=Count('id', filter=Q(media_type='ip_image')),
+            content_image_count=Count('id', filter=Q(media_type='content_image')),
+            favorite_count=Count('id', filter=Q(is_favorite=True)),
+            total_size=Coalesce(Sum('file_size'), 0),
+        )
+        total_count = stats['total_count']
+        ip_image_count = stats['ip_image_count']
+        content_image_count = stats['content_image_count']
+        favorite_count = stats['favorite_count']
+        total_size = stats['total_size']
 
         return Response({
             'status': 'success',
@@ -359,52 +551,38 @@ def upload_media(request):
         if media_type not in ['ip_image', 'content_image']:
             media_type = 'content_image'
 
-        # 读取图片数据
-        image_data = uploaded_image.read()
-
-        # 使用PIL获取图像尺寸
-        image = Image.open(BytesIO(image_data))
-        width, height = image.size
-
-        # 生成文件名和路径
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        unique_id = str(uuid.uuid4())[:8]
-        file_ext = uploaded_image.name.split('.')[-1].lower()
-        filename = f"user_{request.user.id}_{unique_id}_{timestamp}.{file_ext}"
-
-        # 确定子目录
-        subdir = 'ip_images' if media_type == 'ip_image' else 'content_images'
-
-        # 相对路径 (用于数据库)
-        relative_path = os.path.join('generated_images', subdir, filename)
-
-        # 绝对路径 (用于文件系统)
-        media_root = os.path.join(settings.BASE_DIR, 'media')
-        absolute_path = os.path.join(media_root, 'generated_images', subdir, filename)
-
-        # 确保目录存在
-        os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
-
-        # 保存文件
-        with open(absolute_path, 'wb') as f:
-            f.write(image_data)
+        # 分块保存到内容寻址存储（只读取文件头获取尺寸，相同图片只存一份）
+        try:
+            media_file = store_image_chunks(uploaded_image.chunks())
+        except ValueError as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        relative_path = media_file.path
+        width, height = media_file.width, media_file.height
 
         # 创建素材库记录
-        media = MediaLibrary.objects.create(
-            user=request.user,
-            media_type=media_type,
-            original_url='',  # 用户上传的图片没有原始URL
-            local_path=relative_path,
-            prompt=prompt,
-            width=width,
-            height=height,
-            file_size=uploaded_image.size
-        )
-
-        # 生成访问URL
+        try:
+            media = MediaLibrary.objects.create(
+                user=request.user,
+                media_type=media_type,
+                original_url='',  # 用户上传的图片没有原始URL
+                local_path=relative_path,
+                media_file=media_file,
+                prompt=prompt,
+                width=width,
+                height=height,
+                file_size=media_file.file_size
+            )
+        except Exception:
+            release_media_file(media_file.id)
+            raise
+
+        # 生成访问URL（缩略图和 WebP 版本由后台任务生成，列表接口中返回）
         media_url = f"https://{request.get_host()}/media/{relative_path}"
 
-        logger.info(f"用户 {request.user.username} 上传素材成功: {filename}")
+        logger.info(f"用户 {request.user.username} 上传素材成功: {relative_path}")
 
         return Response({
             'status': 'success',
@@ -412,11 +590,13 @@ def upload_media(request):
             'data': {
                 'id': media.id,
                 'url': media_url,
+                'thumbnail_url': media_url,
+                'srcset': '',
                 'media_type': media.media_type,
                 'media_type_display': media.get_media_type_display(),
                 'width': width,
                 'height': height,
-                'file_size': uploaded_image.size,
+                'file_size': media_file.file_size,
                 'created_at': media.created_at.strftime('%Y-%m-%d %H:%M:%S')
             }
         })
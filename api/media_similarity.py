@@ -0,0 +1,225 @@
+"""
+素材库相似图片检索
+每张素材在生成多尺寸版本时计算 64 位 dHash（MediaLibrary.phash），
+按用户在进程内构建 BK 树做汉明距离检索（只访问距离可能满足条件的分支）；
+用户的素材哈希变化时递增缓存中的版本号，各进程下次查询时重建该用户的树
+"""
+import logging
+import threading
+from collections import OrderedDict
+from django.core.cache import cache
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+HASH_MASK = (1 << 64) - 1
+
+# 默认相似阈值（64位 dHash 的汉明距离，<=10 视为相似，<=4 基本是同一张图）
+DEFAULT_MAX_DISTANCE = 10
+DEFAULT_DEDUP_DISTANCE = 4
+MAX_DISTANCE_LIMIT = 20
+
+VERSION_CACHE_KEY = 'media_phash_version:{user_id}'
+
+# 每个进程最多缓存的用户树数量
+MAX_CACHED_TREES = 200
+
+
+def compute_dhash(image):
+    """
+    计算 64 位 dHash：缩放为 9x8 灰度图，比较每行相邻像素
+
+    Returns:
+        int: 无符号 64 位整数
+    """
+    pixels = list(image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (1 if pixels[offset + col] > pixels[offset + col + 1] else 0)
+    return value
+
+
+def to_db_value(value):
+    """无符号 64 位 -> 有符号（BigIntegerField）"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def from_db_value(value):
+    return value & HASH_MASK
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    汉明距离 BK 树：节点 [hash, [media_id, ...], {distance: child}]
+    哈希相同的素材挂在同一节点
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, media_id):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [media_id], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(media_id)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [media_id], {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """返回 [(distance, media_id), ...]，按距离升序"""
+        results = []
+        if self.root is None:
+            return results
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                results.extend((distance, media_id) for media_id in node[1])
+            low, high = distance - max_distance, distance + max_distance
+            for child_distance, child in node[2].items():
+                if low <= child_distance <= high:
+                    stack.append(child)
+        results.sort()
+        return results
+
+
+_trees = OrderedDict()
+_trees_lock = threading.Lock()
+
+
+def get_index_version(user_id):
+    return cache.get(VERSION_CACHE_KEY.format(user_id=user_id)) or 0
+
+
+def invalidate_user_index(user_id):
+    """用户的素材哈希有变化（新增、删除）时递增版本号"""
+    key = VERSION_CACHE_KEY.format(user_id=user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_user_tree(user_id):
+    """获取用户的 BK 树（版本未变时复用进程内缓存）"""
+    from .models import MediaLibrary
+
+    version = get_index_version(user_id)
+    with _trees_lock:
+        cached = _trees.get(user_id)
+        if cached is not None and cached[0] == version:
+            _trees.move_to_end(user_id)
+            return cached[1]
+
+    tree = BKTree()
+    rows = MediaLibrary.objects.filter(user_id=user_id, phash__isnull=False).values_list('id', 'phash')
+    for media_id, phash in rows.iterator():
+        tree.add(from_db_value(phash), media_id)
+
+    with _trees_lock:
+        _trees[user_id] = (version, tree)
+        _trees.move_to_end(user_id)
+        while len(_trees) > MAX_CACHED_TREES:
+            _trees.popitem(last=False)
+    logger.info(f"🌳 已构建用户 {user_id} 的相似图片索引: {tree.size} 张")
+    return tree
+
+
+def find_similar(user_id, media, max_distance=DEFAULT_MAX_DISTANCE, limit=20):
+    """
+    查找与素材相似的其他素材
+
+    Returns:
+        list[(distance, media_id)]: 不含自身，按距离升序
+    """
+    if media.phash is None:
+        return []
+    tree = get_user_tree(user_id)
+    matches = [(distance, media_id) for distance, media_id in tree.search(from_db_value(media.phash), max_distance)
+               if media_id != media.id]
+    return matches[:limit]
+
+
+def find_duplicate_groups(user_id, max_distance=DEFAULT_DEDUP_DISTANCE):
+    """
+    把用户的素材按相似度分组（距离不超过阈值的素材传递合并，并查集）；
+    组内不一定两两相似，删除时由 pick_duplicates_to_remove 按直接距离判断
+
+    Returns:
+        list[list[int]]: 每组至少两个素材ID，组内按ID升序
+    """
+    from .models import MediaLibrary
+
+    tree = get_user_tree(user_id)
+    parent = {}
+
+    def find(media_id):
+        root = media_id
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while parent.get(media_id, media_id) != root:
+            parent[media_id], media_id = root, parent[media_id]
+        return root
+
+    rows = MediaLibrary.objects.filter(user_id=user_id, phash__isnull=False).values_list('id', 'phash')
+    for media_id, phash in rows.iterator():
+        for _, other_id in tree.search(from_db_value(phash), max_distance):
+            if other_id == media_id:
+                continue
+            root_a, root_b = find(media_id), find(other_id)
+            if root_a != root_b:
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    groups = {}
+    for media_id in list(parent):
+        groups.setdefault(find(media_id), set()).add(media_id)
+    for root in groups:
+        groups[root].add(root)
+    return [sorted(group) for group in groups.values() if len(group) > 1]
+
+
+def pick_duplicates_to_remove(items, max_distance=DEFAULT_DEDUP_DISTANCE):
+    """
+    一组相似素材中选择要删除的：收藏的全部保留，其余按分辨率从高到低（相同则最早）依次处理，
+    与某张保留素材的距离不超过阈值才删除，否则也保留。
+    分组是传递合并的（A~B~C 时 A 和 C 可能相差很远），删除时只按与保留素材的直接距离判断
+
+    Args:
+        items: 同一组的 MediaLibrary 对象
+        max_distance: 删除时要求的最大汉明距离
+
+    Returns:
+        list: 要删除的 MediaLibrary 对象
+    """
+    ordered = sorted(items, key=lambda item: (-(item.width or 0) * (item.height or 0), item.created_at.timestamp(), item.id))
+    kept = [from_db_value(item.phash) for item in ordered if item.is_favorite and item.phash is not None]
+    to_remove = []
+    for item in ordered:
+        # 收藏的和哈希已被清除的素材不删除
+        if item.is_favorite or item.phash is None:
+            continue
+        value = from_db_value(item.phash)
+        if any(hamming_distance(value, kept_value) <= max_distance for kept_value in kept):
+            to_remove.append(item)
+        else:
+            kept.append(value)
+    return to_remove
@@ -0,0 +1,174 @@
+"""
+素材库图片多尺寸版本
+素材保存后由 Celery 任务生成正方形缩略图和几个宽度的 WebP 版本（同时计算感知哈希），
+列表接口返回 thumbnail_url / srcset，网格页面不再下载原图
+"""
+import os
+import logging
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.utils import timezone
+from .media_similarity import compute_dhash, to_db_value, invalidate_user_index
+
+logger = logging.getLogger(__name__)
+
+# WebP 版本的宽度（只生成小于原图宽度的版本）
+VARIANT_WIDTHS = (320, 640, 1080)
+
+# 网格缩略图边长（居中裁剪为正方形，与前端 aspect-square 一致）
+THUMBNAIL_SIZE = 240
+
+WEBP_QUALITY = 80
+
+VARIANTS_SUBDIR = os.path.join('generated_images', 'variants')
+
+
+def _media_root():
+    return os.path.join(settings.BASE_DIR, 'media')
+
+
+def _variant_relative_path(local_path, suffix):
+    stem = os.path.splitext(os.path.basename(local_path))[0]
+    return os.path.join(VARIANTS_SUBDIR, f"{stem}_{suffix}.webp")
+
+
+def _save_webp(image, relative_path):
+    """先写临时文件再替换，避免读到写了一半的图片"""
+    absolute_path = os.path.join(_media_root(), relative_path)
+    os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
+    temp_path = f"{absolute_path}.tmp"
+    image.save(temp_path, 'WEBP', quality=WEBP_QUALITY, method=4)
+    os.replace(temp_path, absolute_path)
+
+
+def _prepare_source(image, target_width):
+    """统一方向和颜色模式（JPEG 按目标尺寸解码，减少内存）"""
+    image.draft('RGB', (target_width, target_width))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        has_alpha = image.mode in ('LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    return image
+
+
+def generate_variants(local_path):
+    """
+    为一张图片生成缩略图和各宽度 WebP 版本，同时计算感知哈希
+
+    Args:
+        local_path: 相对 media 目录的原图路径
+
+    Returns:
+        tuple: (thumbnail_path, {"320": path, ...}, dhash)
+    """
+    absolute_path = os.path.join(_media_root(), local_path)
+    with Image.open(absolute_path) as source:
+        image = _prepare_source(source, max(VARIANT_WIDTHS))
+        width, height = image.size
+        dhash = compute_dhash(image)
+
+        thumbnail = ImageOps.fit(image, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+        thumbnail_path = _variant_relative_path(local_path, 'thumb')
+        _save_webp(thumbnail, thumbnail_path)
+
+        variants = {}
+        for variant_width in VARIANT_WIDTHS:
+            if variant_width >= width:
+                break
+            variant_height = max(1, round(height * variant_width / width))
+            resized = image.resize((variant_width, variant_height), Image.LANCZOS)
+            variant_path = _variant_relative_path(local_path, f'w{variant_width}')
+            _save_webp(resized, variant_path)
+            variants[str(variant_width)] = variant_path
+
+    return thumbnail_path, variants, dhash
+
+
+def generate_media_variants(media_id, force=False):
+    """
+    生成素材的多尺寸版本和感知哈希，写回 thumbnail_path / variants / phash（在 Celery worker 中调用）
+
+    Returns:
+        bool: 是否生成
+    """
+    from .models import MediaLibrary
+
+    media = MediaLibrary.objects.filter(id=media_id).only(
+        'id', 'user_id', 'local_path', 'media_file', 'variants_generated_at', 'phash'
+    ).first()
+    if media is None or not media.local_path:
+        return False
+    if media.variants_generated_at and media.phash is not None and not force:
+        return False
+
+    # 相同内容的素材共用一个文件，已有素材生成过版本时直接复用
+    sibling = None
+    if media.media_file_id and not force:
+        sibling = MediaLibrary.objects.filter(
+            media_file_id=media.media_file_id, variants_generated_at__isnull=False, phash__isnull=False
+        ).exclude(id=media_id).only('thumbnail_path', 'variants', 'phash').first()
+    if sibling is not None:
+        thumbnail_path, variants, phash = sibling.thumbnail_path, sibling.variants, sibling.phash
+    else:
+        thumbnail_path, variants, dhash = generate_variants(media.local_path)
+        phash = to_db_value(dhash)
+    # 只更新版本字段，不覆盖并发修改的收藏状态等
+    MediaLibrary.objects.filter(id=media_id).update(
+        thumbnail_path=thumbnail_path,
+        variants=variants,
+        variants_generated_at=timezone.now(),
+        phash=phash
+    )
+    invalidate_user_index(media.user_id)
+    logger.info(f"🖼️ 素材 {media_id} 已生成缩略图和 {len(variants)} 个 WebP 版本")
+    return True
+
+
+def delete_variant_files(local_path):
+    """按原图路径删除缩略图和所有宽度的 WebP 版本"""
+    suffixes = ['thumb'] + [f'w{width}' for width in VARIANT_WIDTHS]
+    for suffix in suffixes:
+        try:
+            os.remove(os.path.join(_media_root(), _variant_relative_path(local_path, suffix)))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"⚠️ 删除素材版本文件失败: {local_path} {suffix}, {str(e)}")
+
+
+def delete_media_variants(media):
+    """删除素材的缩略图和 WebP 版本文件"""
+    paths = list((media.variants or {}).values())
+    if media.thumbnail_path:
+        paths.append(media.thumbnail_path)
+    for relative_path in paths:
+        try:
+            os.remove(os.path.join(_media_root(), relative_path))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"⚠️ 删除素材版本文件失败: {relative_path}, {str(e)}")
+
+
+def build_media_urls(media, host):
+    """
+    素材的访问URL
+
+    Returns:
+        dict: {url, thumbnail_url, srcset}
+        版本未生成时 thumbnail_url 为原图、srcset 为空字符串
+    """
+    if not media.local_path:
+        return {'url': media.original_url, 'thumbnail_url': media.original_url, 'srcset': ''}
+
+    base = f"https://{host}/media/"
+    url = f"{base}{media.local_path}"
+    variants = media.variants or {}
+    srcset = [f"{base}{path} {width}w" for width, path in sorted(variants.items(), key=lambda item: int(item[0]))]
+    if srcset and media.width:
+        srcset.append(f"{url} {media.width}w")
+    return {
+        'url': url,
+        'thumbnail_url': f"{base}{media.thumbnail_path}" if media.thumbnail_path else url,
+        'srcset': ', '.join(srcset),
+    }
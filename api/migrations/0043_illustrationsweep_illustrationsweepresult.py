@@ -0,0 +1,58 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0042_userproductsettings'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IllustrationSweep',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parameters', models.JSONField(default=dict, help_text='每个字段的取值列表或范围，例如：{"premium": [10000, 20000], "age": {"start": 0, "stop": 60, "step": 5}}', verbose_name='网格参数')),
+                ('base_form_data', models.JSONField(blank=True, default=dict, verbose_name='公共表单数据')),
+                ('total_points', models.IntegerField(default=0, verbose_name='组合总数')),
+                ('completed_points', models.IntegerField(default=0, verbose_name='已完成数')),
+                ('failed_points', models.IntegerField(default=0, verbose_name='失败数')),
+                ('status', models.CharField(choices=[('running', '运行中'), ('completed', '已完成'), ('failed', '失败')], default='running', max_length=20, verbose_name='状态')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+                ('request_config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sweeps', to='api.insurancecompanyrequest', verbose_name='请求配置')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='illustration_sweeps', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '利益演示批量请求',
+                'verbose_name_plural': '利益演示批量请求',
+                'db_table': 'illustration_sweeps',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='IllustrationSweepResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('params', models.JSONField(default=dict, verbose_name='参数组合')),
+                ('success', models.BooleanField(default=False, verbose_name='是否成功')),
+                ('status_code', models.IntegerField(blank=True, null=True, verbose_name='HTTP状态码')),
+                ('normalized', models.JSONField(blank=True, default=dict, help_text='规范化后的退保价值表，例如：{"standard": [{"policy_year": 1, "guaranteed": 0, ...}]}', verbose_name='规范化结果')),
+                ('error_message', models.TextField(blank=True, verbose_name='错误信息')),
+                ('elapsed_ms', models.IntegerField(default=0, verbose_name='耗时(毫秒)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('sweep', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='api.illustrationsweep', verbose_name='批量请求')),
+            ],
+            options={
+                'verbose_name': '利益演示批量结果',
+                'verbose_name_plural': '利益演示批量结果',
+                'db_table': 'illustration_sweep_results',
+                'ordering': ['sweep', 'id'],
+            },
+        ),
+    ]
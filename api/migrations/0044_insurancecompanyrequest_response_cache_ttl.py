@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0043_illustrationsweep_illustrationsweepresult'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='insurancecompanyrequest',
+            name='response_cache_ttl',
+            field=models.IntegerField(default=0, help_text='相同请求体的成功响应缓存时长，0表示不缓存。认证失败和错误响应永不缓存', verbose_name='响应缓存时长(秒)'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0044_insurancecompanyrequest_response_cache_ttl'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='insuranceproduct',
+            name='illustration_request',
+            field=models.ForeignKey(blank=True, help_text='用于自动刷新退保发还金额表的保险公司API请求，为空则不自动刷新', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='refreshed_products', to='api.insurancecompanyrequest', verbose_name='利益演示请求'),
+        ),
+        migrations.AddField(
+            model_name='insuranceproduct',
+            name='illustration_params',
+            field=models.JSONField(blank=True, default=dict, help_text='填入请求模板的表单数据，例如：{"premium": 10000, "premTerm": 5}。模板中也可使用 {{annual_premium}}、{{payment_period}}、{{product_name}}', verbose_name='利益演示参数'),
+        ),
+        migrations.AddField(
+            model_name='insuranceproduct',
+            name='surrender_table_refreshed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='退保价值表刷新时间'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0045_insuranceproduct_illustration_request'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageGenerationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generation_type', models.CharField(choices=[('ip_image', 'IP形象生成'), ('content_image', '文案配图生成')], max_length=20, verbose_name='生成类型')),
+                ('params', models.JSONField(default=dict, help_text='提示语/文案、纵横比、图片索引等生成参数', verbose_name='请求参数')),
+                ('input_image_path', models.CharField(blank=True, help_text='IP形象生成时用户上传的照片（相对 media 目录），任务结束后删除', max_length=500, verbose_name='上传照片路径')),
+                ('status', models.CharField(choices=[('pending', '排队中'), ('running', '生成中'), ('succeeded', '成功'), ('failed', '失败')], default='pending', max_length=20, verbose_name='状态')),
+                ('quota_reserved', models.IntegerField(default=0, help_text='提交时预留、尚未结算的额度；成功后清零，失败时退还', verbose_name='预留额度')),
+                ('result', models.JSONField(blank=True, default=dict, verbose_name='生成结果')),
+                ('error_message', models.TextField(blank=True, verbose_name='错误信息')),
+                ('celery_task_id', models.CharField(blank=True, max_length=255, verbose_name='Celery任务ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_generation_jobs', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '图片生成任务',
+                'verbose_name_plural': '图片生成任务',
+                'db_table': 'image_generation_jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'created_at'], name='image_gener_user_id_4ecff5_idx'), models.Index(fields=['status', 'created_at'], name='image_gener_status_8a1f52_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-19 15:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0046_imagegenerationjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(help_text='当前仍预留的次数（部分退还后减少），结算后为实际消耗次数', verbose_name='预留次数')),
+                ('original_amount', models.IntegerField(verbose_name='初始预留次数')),
+                ('status', models.CharField(choices=[('held', '预留中'), ('committed', '已结算'), ('released', '已退还'), ('expired', '已过期')], default='held', max_length=20, verbose_name='状态')),
+                ('source', models.CharField(blank=True, max_length=100, verbose_name='来源')),
+                ('expires_at', models.DateTimeField(help_text='超过该时间仍未结算的预留会被定时任务退还', verbose_name='过期时间')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('settled_at', models.DateTimeField(blank=True, null=True, verbose_name='结算时间')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quota_reservations', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '额度预留',
+                'verbose_name_plural': '额度预留',
+                'db_table': 'quota_reservations',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='quota_reser_status_2c510b_idx'), models.Index(fields=['user', 'status'], name='quota_reser_user_id_e90efb_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='QuotaLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_type', models.CharField(choices=[('grant', '增加'), ('consume', '消耗'), ('reserve', '预留'), ('release', '退还'), ('expire', '过期退还'), ('adjust', '管理员调整')], max_length=20, verbose_name='类型')),
+                ('delta', models.IntegerField(help_text='可用次数的变化，扣减为负数', verbose_name='变化次数')),
+                ('source', models.CharField(blank=True, max_length=100, verbose_name='来源')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('reservation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='api.quotareservation', verbose_name='关联预留')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quota_ledger', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '额度流水',
+                'verbose_name_plural': '额度流水',
+                'db_table': 'quota_ledger',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'created_at'], name='quota_ledge_user_id_ddd17a_idx')],
+            },
+        ),
+        migrations.RemoveField(
+            model_name='imagegenerationjob',
+            name='quota_reserved',
+        ),
+        migrations.AddField(
+            model_name='imagegenerationjob',
+            name='quota_reservation',
+            field=models.ForeignKey(blank=True, help_text='提交时预留1次额度；成功后结算，失败时退还', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='image_jobs', to='api.quotareservation', verbose_name='额度预留'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0047_quotareservation_quotaledgerentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeminiUsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generation_type', models.CharField(choices=[('ip_image', 'IP形象生成'), ('content_image', '文案配图生成')], max_length=20, verbose_name='生成类型')),
+                ('granularity', models.CharField(choices=[('hour', '小时'), ('day', '天'), ('total', '累计')], max_length=10, verbose_name='粒度')),
+                ('bucket', models.DateTimeField(help_text='小时/天的起始时间，累计行固定为 1970-01-01', verbose_name='时间桶')),
+                ('total_count', models.IntegerField(default=0, verbose_name='调用次数')),
+                ('success_count', models.IntegerField(default=0, verbose_name='成功次数')),
+                ('last_success_at', models.DateTimeField(blank=True, null=True, verbose_name='最后成功时间')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gemini_usage_rollups', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': 'Gemini调用汇总',
+                'verbose_name_plural': 'Gemini调用汇总',
+                'db_table': 'gemini_usage_rollups',
+                'constraints': [models.UniqueConstraint(fields=('user', 'granularity', 'bucket', 'generation_type'), name='uniq_gemini_usage_rollup_bucket')],
+            },
+        ),
+    ]
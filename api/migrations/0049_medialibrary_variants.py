@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0048_geminiusagerollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medialibrary',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, verbose_name='多尺寸版本'),
+        ),
+        migrations.AddField(
+            model_name='medialibrary',
+            name='variants_generated_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='多尺寸版本生成时间'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0049_medialibrary_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('path', models.CharField(max_length=500, verbose_name='存储路径')),
+                ('file_size', models.IntegerField(verbose_name='文件大小(字节)')),
+                ('width', models.IntegerField(blank=True, null=True, verbose_name='图片宽度')),
+                ('height', models.IntegerField(blank=True, null=True, verbose_name='图片高度')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='引用数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+            ],
+            options={
+                'verbose_name': '素材文件',
+                'verbose_name_plural': '素材文件',
+                'db_table': 'media_files',
+            },
+        ),
+        migrations.AddField(
+            model_name='medialibrary',
+            name='media_file',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='media_items', to='api.mediafile', verbose_name='素材文件'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0050_mediafile_medialibrary_media_file'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medialibrary',
+            index=models.Index(fields=['user', 'created_at'], name='media_libra_user_id_2daa16_idx'),
+        ),
+    ]
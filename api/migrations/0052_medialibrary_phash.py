@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0051_medialibrary_user_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medialibrary',
+            name='phash',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='感知哈希'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:30
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0052_medialibrary_phash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediafile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='最后引用时间'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-19 21:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0053_mediafile_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonalVoice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('voice_key', models.CharField(help_text='接口中的 id（pv-xxxxxxxxxxxx），对应 media/personal_voices 下的样本目录', max_length=32, unique=True, verbose_name='语音ID')),
+                ('name', models.CharField(max_length=100, verbose_name='语音名称')),
+                ('voice_talent_name', models.CharField(blank=True, max_length=100, verbose_name='配音员姓名')),
+                ('company_name', models.CharField(blank=True, max_length=100, verbose_name='公司名称')),
+                ('voice_id', models.CharField(max_length=128, verbose_name='CosyVoice语音ID')),
+                ('voice_prefix', models.CharField(blank=True, max_length=20, verbose_name='音色前缀')),
+                ('status', models.CharField(choices=[('active', '可用'), ('disabled', '已停用')], default='active', max_length=20, verbose_name='状态')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('user', models.ForeignKey(blank=True, help_text='为空表示所有用户共用（从 voices.json 迁移的语音、未登录时创建的语音）', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='personal_voices', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '个人语音',
+                'verbose_name_plural': '个人语音',
+                'db_table': 'personal_voices',
+                'ordering': ['created_at', 'id'],
+                'indexes': [models.Index(fields=['user', 'status'], name='personal_vo_user_id_b684c9_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated migration to import personal voices from voices.json
+
+import os
+import json
+from datetime import datetime
+from django.db import migrations
+from django.utils import timezone
+
+# 原来 personal_voice_views 保存语音列表的位置
+VOICES_JSON_PATH = '/var/www/harry-insurance2/media/personal_voices/voices.json'
+
+
+def import_personal_voices(apps, schema_editor):
+    """把 voices.json 中的语音导入 PersonalVoice 表（所有用户共用，已导入的跳过）"""
+    PersonalVoice = apps.get_model('api', 'PersonalVoice')
+
+    if not os.path.exists(VOICES_JSON_PATH):
+        return
+    with open(VOICES_JSON_PATH, 'r', encoding='utf-8') as f:
+        voices = json.load(f)
+
+    imported_count = 0
+    for voice in voices:
+        if not voice.get('id') or not voice.get('voice_id'):
+            continue
+        personal_voice, created = PersonalVoice.objects.get_or_create(
+            voice_key=voice['id'],
+            defaults={
+                'name': voice.get('name') or voice['id'],
+                'voice_talent_name': voice.get('voice_talent_name', ''),
+                'company_name': voice.get('company_name', ''),
+                'voice_id': voice['voice_id'],
+                'voice_prefix': voice.get('voice_prefix', ''),
+                'status': 'active' if voice.get('status', 'active') == 'active' else 'disabled',
+            }
+        )
+        if not created:
+            continue
+        imported_count += 1
+        # created_at 是 auto_now_add，创建后再写回原来的创建时间
+        try:
+            created_at = timezone.make_aware(datetime.strptime(voice['created_at'], '%Y-%m-%d %H:%M:%S'))
+        except (KeyError, TypeError, ValueError):
+            continue
+        PersonalVoice.objects.filter(id=personal_voice.id).update(created_at=created_at)
+
+    print(f'✅ 已从 voices.json 导入 {imported_count} 个个人语音')
+
+
+def reverse_import_personal_voices(apps, schema_editor):
+    """回滚操作：不做任何处理（voices.json 保持不变）"""
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0054_personalvoice'),
+    ]
+
+    operations = [
+        migrations.RunPython(import_personal_voices, reverse_import_personal_voices),
+    ]
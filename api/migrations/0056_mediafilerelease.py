@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 22:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0055_import_personal_voices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFileRelease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch', models.CharField(db_index=True, help_text='同一次删除写入的释放记录共用一个批次，由同一个任务处理', max_length=32, verbose_name='批次')),
+                ('count', models.PositiveIntegerField(default=1, verbose_name='释放次数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('media_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_releases', to='api.mediafile', verbose_name='素材文件')),
+            ],
+            options={
+                'verbose_name': '待释放素材文件引用',
+                'verbose_name_plural': '待释放素材文件引用',
+                'db_table': 'media_file_releases',
+            },
+        ),
+    ]
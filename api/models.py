@@ -412,6 +412,155 @@ class GeminiUsage(models.Model):
         return f"{self.user.username} - {self.get_generation_type_display()} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
 
 
+class GeminiUsageRollup(models.Model):
+    """
+    Gemini调用次数汇总 - 按用户、生成类型、时间桶累计，统计接口直接读取汇总
+    hour: 按小时（近期），day: 按天（由定时任务从过期的小时桶压缩而来），total: 累计
+    """
+    GRANULARITY_CHOICES = [
+        ('hour', '小时'),
+        ('day', '天'),
+        ('total', '累计'),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='gemini_usage_rollups',
+        verbose_name='用户'
+    )
+    generation_type = models.CharField(
+        max_length=20,
+        choices=GeminiUsage.GENERATION_TYPES,
+        verbose_name='生成类型'
+    )
+    granularity = models.CharField(
+        max_length=10,
+        choices=GRANULARITY_CHOICES,
+        verbose_name='粒度'
+    )
+    bucket = models.DateTimeField(
+        verbose_name='时间桶',
+        help_text='小时/天的起始时间，累计行固定为 1970-01-01'
+    )
+    total_count = models.IntegerField(
+        default=0,
+        verbose_name='调用次数'
+    )
+    success_count = models.IntegerField(
+        default=0,
+        verbose_name='成功次数'
+    )
+    last_success_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='最后成功时间'
+    )
+
+    class Meta:
+        db_table = 'gemini_usage_rollups'
+        verbose_name = 'Gemini调用汇总'
+        verbose_name_plural = 'Gemini调用汇总'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'granularity', 'bucket', 'generation_type'],
+                name='uniq_gemini_usage_rollup_bucket'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.generation_type} - {self.granularity} {self.bucket:%Y-%m-%d %H:%M}"
+
+
+class ImageGenerationJob(models.Model):
+    """图片生成异步任务 - 提交时预留额度，由 Celery worker 调用 Gemini 生成"""
+    STATUS_CHOICES = [
+        ('pending', '排队中'),
+        ('running', '生成中'),
+        ('succeeded', '成功'),
+        ('failed', '失败'),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='image_generation_jobs',
+        verbose_name='用户'
+    )
+    generation_type = models.CharField(
+        max_length=20,
+        choices=GeminiUsage.GENERATION_TYPES,
+        verbose_name='生成类型'
+    )
+    params = models.JSONField(
+        verbose_name='请求参数',
+        default=dict,
+        help_text='提示语/文案、纵横比、图片索引等生成参数'
+    )
+    input_image_path = models.CharField(
+        max_length=500,
+        verbose_name='上传照片路径',
+        blank=True,
+        help_text='IP形象生成时用户上传的照片（相对 media 目录），任务结束后删除'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name='状态'
+    )
+    quota_reservation = models.ForeignKey(
+        'QuotaReservation',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='image_jobs',
+        verbose_name='额度预留',
+        help_text='提交时预留1次额度；成功后结算，失败时退还'
+    )
+    result = models.JSONField(
+        verbose_name='生成结果',
+        default=dict,
+        blank=True
+    )
+    error_message = models.TextField(
+        verbose_name='错误信息',
+        blank=True
+    )
+    celery_task_id = models.CharField(
+        max_length=255,
+        verbose_name='Celery任务ID',
+        blank=True
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='创建时间'
+    )
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='开始时间'
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='完成时间'
+    )
+
+    class Meta:
+        db_table = 'image_generation_jobs'
+        verbose_name = '图片生成任务'
+        verbose_name_plural = '图片生成任务'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.get_generation_type_display()} - {self.get_status_display()}"
+
+
 class UserQuota(models.Model):
     """用户额度模型 - 记录用户可用的生成次数"""
     user = models.OneToOneField(
@@ -445,25 +594,142 @@ class UserQuota(models.Model):
     def __str__(self):
         return f"{self.user.username} - 可用次数: {self.available_quota}"
 
-    def add_quota(self, amount):
-        """增加额度"""
-        self.available_quota += amount
-        self.total_purchased += amount
-        self.save()
-
-    def consume_quota(self, amount=1):
-        """消耗额度"""
-        if self.available_quota >= amount:
-            self.available_quota -= amount
-            self.save()
-            return True
-        return False
+    def add_quota(self, amount, source=''):
+        """增加额度（原子更新并记入额度流水）"""
+        from .quota_ledger import grant
+        grant(self.user_id, amount, source=source)
+        self.refresh_from_db(fields=['available_quota', 'total_purchased', 'updated_at'])
+
+    def consume_quota(self, amount=1, source=''):
+        """消耗额度（条件更新，额度不足时返回 False）"""
+        from .quota_ledger import consume
+        consumed = consume(self.user_id, amount, source=source)
+        self.refresh_from_db(fields=['available_quota', 'updated_at'])
+        return consumed
 
     def has_quota(self, amount=1):
         """检查是否有足够额度"""
         return self.available_quota >= amount
 
 
+class QuotaReservation(models.Model):
+    """额度预留 - 异步生成任务提交时扣减，完成后结算，失败或过期时退还"""
+    STATUS_CHOICES = [
+        ('held', '预留中'),
+        ('committed', '已结算'),
+        ('released', '已退还'),
+        ('expired', '已过期'),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='quota_reservations',
+        verbose_name='用户'
+    )
+    amount = models.IntegerField(
+        verbose_name='预留次数',
+        help_text='当前仍预留的次数（部分退还后减少），结算后为实际消耗次数'
+    )
+    original_amount = models.IntegerField(
+        verbose_name='初始预留次数'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='held',
+        verbose_name='状态'
+    )
+    source = models.CharField(
+        max_length=100,
+        verbose_name='来源',
+        blank=True
+    )
+    expires_at = models.DateTimeField(
+        verbose_name='过期时间',
+        help_text='超过该时间仍未结算的预留会被定时任务退还'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='创建时间'
+    )
+    settled_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='结算时间'
+    )
+
+    class Meta:
+        db_table = 'quota_reservations'
+        verbose_name = '额度预留'
+        verbose_name_plural = '额度预留'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+            models.Index(fields=['user', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.original_amount}次 - {self.get_status_display()}"
+
+
+class QuotaLedgerEntry(models.Model):
+    """额度流水 - 只追加，每条记录对应一次 available_quota 变化"""
+    ENTRY_TYPES = [
+        ('grant', '增加'),
+        ('consume', '消耗'),
+        ('reserve', '预留'),
+        ('release', '退还'),
+        ('expire', '过期退还'),
+        ('adjust', '管理员调整'),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='quota_ledger',
+        verbose_name='用户'
+    )
+    entry_type = models.CharField(
+        max_length=20,
+        choices=ENTRY_TYPES,
+        verbose_name='类型'
+    )
+    delta = models.IntegerField(
+        verbose_name='变化次数',
+        help_text='可用次数的变化，扣减为负数'
+    )
+    reservation = models.ForeignKey(
+        QuotaReservation,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ledger_entries',
+        verbose_name='关联预留'
+    )
+    source = models.CharField(
+        max_length=100,
+        verbose_name='来源',
+        blank=True
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='创建时间'
+    )
+
+    class Meta:
+        db_table = 'quota_ledger'
+        verbose_name = '额度流水'
+        verbose_name_plural = '额度流水'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.get_entry_type_display()} {self.delta:+d}"
+
+
 class MembershipPlan(models.Model):
     """会员套餐模型 - 存储套餐信息和权益"""
     plan_id = models.CharField(
@@ -578,6 +844,157 @@ class VideoProject(models.Model):
         return f"{self.title} - {self.user.username}"
 
 
+class PersonalVoice(models.Model):
+    """个人语音（CosyVoice 声音复刻）- 替代原来的 media/personal_voices/voices.json"""
+    STATUS_CHOICES = [
+        ('active', '可用'),
+        ('disabled', '已停用'),
+    ]
+
+    voice_key = models.CharField(
+        max_length=32,
+        unique=True,
+        verbose_name='语音ID',
+        help_text='接口中的 id（pv-xxxxxxxxxxxx），对应 media/personal_voices 下的样本目录'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='personal_voices',
+        verbose_name='用户',
+        help_text='为空表示所有用户共用（从 voices.json 迁移的语音、未登录时创建的语音）'
+    )
+    name = models.CharField(
+        max_length=100,
+        verbose_name='语音名称'
+    )
+    voice_talent_name = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name='配音员姓名'
+    )
+    company_name = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name='公司名称'
+    )
+    voice_id = models.CharField(
+        max_length=128,
+        verbose_name='CosyVoice语音ID'
+    )
+    voice_prefix = models.CharField(
+        max_length=20,
+        blank=True,
+        verbose_name='音色前缀'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='active',
+        verbose_name='状态'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='创建时间'
+    )
+
+    class Meta:
+        db_table = 'personal_voices'
+        verbose_name = '个人语音'
+        verbose_name_plural = '个人语音'
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['user', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.voice_key})"
+
+
+class MediaFile(models.Model):
+    """素材图片文件 - 按内容哈希存储，相同图片只保存一份，由素材记录引用计数"""
+    sha256 = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name='SHA-256'
+    )
+    path = models.CharField(
+        max_length=500,
+        verbose_name='存储路径'
+    )
+    file_size = models.IntegerField(
+        verbose_name='文件大小(字节)'
+    )
+    width = models.IntegerField(
+        null=True,
+        blank=True,
+        verbose_name='图片宽度'
+    )
+    height = models.IntegerField(
+        null=True,
+        blank=True,
+        verbose_name='图片高度'
+    )
+    ref_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='引用数'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='创建时间'
+    )
+    # 每次增加引用时更新，孤儿回收跳过最近被引用的文件
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='最后引用时间'
+    )
+
+    class Meta:
+        db_table = 'media_files'
+        verbose_name = '素材文件'
+        verbose_name_plural = '素材文件'
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count})"
+
+
+class MediaFileRelease(models.Model):
+    """
+    待释放的素材文件引用 - 与删除素材记录在同一事务中写入，
+    释放引用时在同一事务中删除，任务重试或重复执行不会重复释放
+    """
+    media_file = models.ForeignKey(
+        MediaFile,
+        on_delete=models.CASCADE,
+        related_name='pending_releases',
+        verbose_name='素材文件'
+    )
+    batch = models.CharField(
+        max_length=32,
+        db_index=True,
+        verbose_name='批次',
+        help_text='同一次删除写入的释放记录共用一个批次，由同一个任务处理'
+    )
+    count = models.PositiveIntegerField(
+        default=1,
+        verbose_name='释放次数'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='创建时间'
+    )
+
+    class Meta:
+        db_table = 'media_file_releases'
+        verbose_name = '待释放素材文件引用'
+        verbose_name_plural = '待释放素材文件引用'
+
+    def __str__(self):
+        return f"{self.media_file_id} x{self.count} ({self.batch})"
+
+
 class MediaLibrary(models.Model):
     """用户素材库模型 - 存储所有生成的图片"""
     MEDIA_TYPES = [
@@ -610,6 +1027,16 @@ class MediaLibrary(models.Model):
         blank=True
     )
 
+    # 内容寻址存储的文件（local_path 与 media_file.path 相同；旧数据为空）
+    media_file = models.ForeignKey(
+        MediaFile,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='media_items',
+        verbose_name='素材文件'
+    )
+
     # 缩略图路径（可选）
     thumbnail_path = models.CharField(
         max_length=500,
@@ -617,6 +1044,25 @@ class MediaLibrary(models.Model):
         blank=True
     )
 
+    # 不同宽度的 WebP 版本 {"320": "generated_images/variants/xxx_w320.webp", ...}（后台任务生成）
+    variants = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='多尺寸版本'
+    )
+    variants_generated_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='多尺寸版本生成时间'
+    )
+
+    # 64位感知哈希（dHash，按有符号整数存储），用于查找相似图片
+    phash = models.BigIntegerField(
+        null=True,
+        blank=True,
+        verbose_name='感知哈希'
+    )
+
     # 提示语或文案内容
     prompt = models.TextField(
         verbose_name='提示语/文案',
@@ -671,6 +1117,7 @@ class MediaLibrary(models.Model):
         indexes = [
             models.Index(fields=['user', 'media_type', 'created_at']),
             models.Index(fields=['user', 'is_favorite', 'created_at']),
+            models.Index(fields=['user', 'created_at']),
         ]
 
     def __str__(self):
@@ -800,6 +1247,27 @@ class InsuranceProduct(models.Model):
         default='',
         help_text='JSON格式存储各年度退保价值，例如：[{"year": 1, "guaranteed": 0, "non_guaranteed": 0, "total": 0}, ...]'
     )
+    illustration_request = models.ForeignKey(
+        'InsuranceCompanyRequest',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='refreshed_products',
+        verbose_name='利益演示请求',
+        help_text='用于自动刷新退保发还金额表的保险公司API请求，为空则不自动刷新'
+    )
+    illustration_params = models.JSONField(
+        verbose_name='利益演示参数',
+        default=dict,
+        blank=True,
+        help_text='填入请求模板的表单数据，例如：{"premium": 10000, "premTerm": 5}。'
+                  '模板中也可使用 {{annual_premium}}、{{payment_period}}、{{product_name}}'
+    )
+    surrender_table_refreshed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='退保价值表刷新时间'
+    )
     death_benefit_table = models.TextField(
         verbose_name='身故保险赔偿表',
         blank=True,
@@ -921,6 +1389,11 @@ class InsuranceCompanyRequest(models.Model):
         default=False,
         verbose_name='需要Bearer Token'
     )
+    response_cache_ttl = models.IntegerField(
+        default=0,
+        verbose_name='响应缓存时长(秒)',
+        help_text='相同请求体的成功响应缓存时长，0表示不缓存。认证失败和错误响应永不缓存'
+    )
     is_active = models.BooleanField(
         default=True,
         verbose_name='是否启用'
@@ -951,6 +1424,115 @@ class InsuranceCompanyRequest(models.Model):
         return f"{self.company.name} - {self.request_name}"
 
 
+class IllustrationSweep(models.Model):
+    """利益演示网格批量请求（年龄 × 保费 × 缴费年期 等参数组合）"""
+    STATUS_CHOICES = [
+        ('running', '运行中'),
+        ('completed', '已完成'),
+        ('failed', '失败'),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='illustration_sweeps',
+        verbose_name='用户'
+    )
+    request_config = models.ForeignKey(
+        InsuranceCompanyRequest,
+        on_delete=models.CASCADE,
+        related_name='sweeps',
+        verbose_name='请求配置'
+    )
+    parameters = models.JSONField(
+        verbose_name='网格参数',
+        default=dict,
+        help_text='每个字段的取值列表或范围，例如：{"premium": [10000, 20000], "age": {"start": 0, "stop": 60, "step": 5}}'
+    )
+    base_form_data = models.JSONField(
+        verbose_name='公共表单数据',
+        default=dict,
+        blank=True
+    )
+    total_points = models.IntegerField(default=0, verbose_name='组合总数')
+    completed_points = models.IntegerField(default=0, verbose_name='已完成数')
+    failed_points = models.IntegerField(default=0, verbose_name='失败数')
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='running',
+        verbose_name='状态'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='创建时间'
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='完成时间'
+    )
+
+    class Meta:
+        db_table = 'illustration_sweeps'
+        verbose_name = '利益演示批量请求'
+        verbose_name_plural = '利益演示批量请求'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.request_config} - {self.total_points}个组合"
+
+
+class IllustrationSweepResult(models.Model):
+    """利益演示网格中单个参数组合的结果（规范化后）"""
+    sweep = models.ForeignKey(
+        IllustrationSweep,
+        on_delete=models.CASCADE,
+        related_name='results',
+        verbose_name='批量请求'
+    )
+    params = models.JSONField(
+        verbose_name='参数组合',
+        default=dict
+    )
+    success = models.BooleanField(
+        default=False,
+        verbose_name='是否成功'
+    )
+    status_code = models.IntegerField(
+        null=True,
+        blank=True,
+        verbose_name='HTTP状态码'
+    )
+    normalized = models.JSONField(
+        verbose_name='规范化结果',
+        default=dict,
+        blank=True,
+        help_text='规范化后的退保价值表，例如：{"standard": [{"policy_year": 1, "guaranteed": 0, ...}]}'
+    )
+    error_message = models.TextField(
+        verbose_name='错误信息',
+        blank=True
+    )
+    elapsed_ms = models.IntegerField(
+        default=0,
+        verbose_name='耗时(毫秒)'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='创建时间'
+    )
+
+    class Meta:
+        db_table = 'illustration_sweep_results'
+        verbose_name = '利益演示批量结果'
+        verbose_name_plural = '利益演示批量结果'
+        ordering = ['sweep', 'id']
+
+    def __str__(self):
+        return f"{self.sweep_id} - {self.params}"
+
+
 class PagePermission(models.Model):
     """页面访问权限配置"""
     page_name = models.CharField(
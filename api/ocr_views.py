@@ -8,6 +8,7 @@ from .models import PlanDocument
 from .deepseek_service import analyze_insurance_table, extract_plan_data_from_text, extract_plan_summary
 from .tasks import process_document_pipeline  # 使用Celery任务替代线程
 from .permissions import IsMemberActive
+from .plan_comparison import compare_documents, TABLE_METRICS, ALIGN_MODES
 import json
 import base64
 import logging
@@ -16,6 +17,9 @@ from openai import OpenAI
 
 logger = logging.getLogger(__name__)
 
+# 多文档对比最多支持的文档数
+MAX_COMPARE_DOCUMENTS = 10
+
 
 @api_view(['POST'])
 def save_ocr_result(request):
@@ -408,6 +412,89 @@ def get_document_detail(request, document_id):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def compare_documents_view(request):
+    """
+    多份计划书对比（服务端对齐并计算差额/比率/交叉年度）
+
+    请求体:
+        document_ids: 文档ID列表（2-10个，仅限当前用户的文档）
+        table: 'table1'（基本计划退保价值表，默认）或 'table2'（无忧选退保价值表）
+        align: 'policy_year'（按保单年度，默认）或 'age'（按受保人到达年龄）
+        baseline_id: 基准文档ID（可选，默认第一个）
+        metrics: 对比字段列表（可选）
+    """
+    try:
+        document_ids = request.data.get('document_ids', [])
+        try:
+            document_ids = [int(doc_id) for doc_id in document_ids]
+        except (TypeError, ValueError):
+            return Response({
+                'status': 'error',
+                'message': 'document_ids 格式错误'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # 去重并保持顺序
+        document_ids = list(dict.fromkeys(document_ids))
+        if len(document_ids) < 2 or len(document_ids) > MAX_COMPARE_DOCUMENTS:
+            return Response({
+                'status': 'error',
+                'message': f'请选择2-{MAX_COMPARE_DOCUMENTS}份计划书进行对比'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        table = request.data.get('table', 'table1')
+        align = request.data.get('align', 'policy_year')
+        if table not in TABLE_METRICS or align not in ALIGN_MODES:
+            return Response({
+                'status': 'error',
+                'message': '不支持的 table 或 align 参数'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # 只取对比需要的字段，避免加载 content 等大字段
+        docs = PlanDocument.objects.filter(id__in=document_ids, user=request.user).only(
+            'id', 'file_name', 'insurance_company', 'insurance_product',
+            'insured_age', 'annual_premium', 'payment_years', table
+        )
+        docs_by_id = {doc.id: doc for doc in docs}
+        missing = [doc_id for doc_id in document_ids if doc_id not in docs_by_id]
+        if missing:
+            return Response({
+                'status': 'error',
+                'message': f'文档不存在或无权访问: {missing}'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        baseline_id = request.data.get('baseline_id')
+        try:
+            baseline_id = int(baseline_id) if baseline_id is not None else None
+        except (TypeError, ValueError):
+            baseline_id = None
+
+        metrics = request.data.get('metrics')
+        if not isinstance(metrics, list):
+            metrics = None
+
+        result = compare_documents(
+            [docs_by_id[doc_id] for doc_id in document_ids],
+            table=table,
+            align=align,
+            baseline_id=baseline_id,
+            metrics=metrics
+        )
+
+        return Response({
+            'status': 'success',
+            'data': result
+        })
+
+    except Exception as e:
+        logger.error(f"❌ 计划书对比失败: {e}")
+        return Response({
+            'status': 'error',
+            'message': f'对比失败: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['POST'])
 def analyze_document_table(request, document_id):
     """
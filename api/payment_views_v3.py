@@ -481,7 +481,7 @@ def payment_notify_v3(request):
                             # 次数卡：增加1000次额度
                             try:
                                 quota, created = UserQuota.objects.get_or_create(user=order.user)
-                                quota.add_quota(1000)  # 增加1000次调用额度
+                                quota.add_quota(1000, source=f'order:{out_trade_no}')  # 增加1000次调用额度
                                 logger.info(f'用户 {order.user.username} 购买次数卡，额度增加1000次，当前可用: {quota.available_quota}次')
                             except Exception as e:
                                 logger.error(f'增加用户额度失败: {str(e)}')
@@ -492,7 +492,7 @@ def payment_notify_v3(request):
 
                             try:
                                 quota, created = UserQuota.objects.get_or_create(user=order.user)
-                                quota.add_quota(100)  # 增加100次调用额度
+                                quota.add_quota(100, source=f'order:{out_trade_no}')  # 增加100次调用额度
                                 logger.info(f'用户 {order.user.username} 额度增加100次，当前可用: {quota.available_quota}次')
                             except Exception as e:
                                 logger.error(f'增加用户额度失败: {str(e)}')
@@ -500,7 +500,7 @@ def payment_notify_v3(request):
                             # 其他未知套餐类型：默认增加100次额度
                             try:
                                 quota, created = UserQuota.objects.get_or_create(user=order.user)
-                                quota.add_quota(100)
+                                quota.add_quota(100, source=f'order:{out_trade_no}')
                                 logger.info(f'用户 {order.user.username} 额度增加100次，当前可用: {quota.available_quota}次')
                             except Exception as e:
                                 logger.error(f'增加用户额度失败: {str(e)}')
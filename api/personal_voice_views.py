@@ -7,11 +7,14 @@ import time
 import uuid
 import logging
 import json
+import threading
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from dashscope.audio.tts_v2 import VoiceEnrollmentService, SpeechSynthesizer
+from dashscope.audio.tts_v2 import VoiceEnrollmentService, SpeechSynthesizer, ResultCallback
 from dotenv import load_dotenv
+from . import tts_cache, tts_streaming, personal_voices, cosyvoice_cache
+from .tts_views import build_stream_response
 
 load_dotenv()
 
@@ -27,34 +30,16 @@ os.makedirs(PERSONAL_VOICE_DATA_DIR, exist_ok=True)
 # 目标模型 - 声音复刻时使用的模型必须与语音合成时使用的模型保持一致
 TARGET_MODEL = 'cosyvoice-v3-plus'
 
-
-def get_personal_voice_list_path():
-    """获取个人语音列表文件路径"""
-    return os.path.join(PERSONAL_VOICE_DATA_DIR, 'voices.json')
-
-
-def load_personal_voice_list():
-    """加载个人语音列表"""
-    list_path = get_personal_voice_list_path()
-    if os.path.exists(list_path):
-        with open(list_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return []
-
-
-def save_personal_voice_list(voices):
-    """保存个人语音列表"""
-    list_path = get_personal_voice_list_path()
-    with open(list_path, 'w', encoding='utf-8') as f:
-        json.dump(voices, f, ensure_ascii=False, indent=2)
+# 流式合成等待完成的最长时间（秒）
+PERSONAL_STREAM_TIMEOUT = 300
 
 
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_personal_voices(request):
-    """获取用户的个人语音列表"""
+    """获取用户的个人语音列表（自己的语音和共用语音）"""
     try:
-        voices = load_personal_voice_list()
+        voices = personal_voices.list_voices(personal_voices.get_request_user(request))
         return JsonResponse({
             'status': 'success',
             'voices': voices
@@ -80,6 +65,14 @@ def create_personal_voice(request):
     - audio_url: 或者直接提供公网可访问的音频URL
     """
     try:
+        # 创建的语音属于当前用户，未登录时不能创建（否则会成为所有人可见的共用语音）
+        user = personal_voices.get_request_user(request)
+        if user is None:
+            return JsonResponse({
+                'status': 'error',
+                'message': '请先登录'
+            }, status=401)
+
         # 获取表单数据
         voice_name = request.POST.get('voice_name', '').strip()
         voice_talent_name = request.POST.get('voice_talent_name', '').strip() or '未命名'
@@ -237,20 +230,17 @@ def create_personal_voice(request):
                 'message': '音色创建超时，请稍后重试'
             }, status=500)
 
-        # 保存个人语音信息到列表
-        voices = load_personal_voice_list()
-        voice_data = {
-            'id': personal_voice_id,
-            'name': voice_name,
-            'voice_talent_name': voice_talent_name,
-            'company_name': company_name,
-            'voice_id': voice_id,  # CosyVoice的voice_id
-            'voice_prefix': voice_prefix,
-            'status': 'active',
-            'created_at': time.strftime('%Y-%m-%d %H:%M:%S')
-        }
-        voices.append(voice_data)
-        save_personal_voice_list(voices)
+        # 保存个人语音信息（只有自己可见）
+        voice = personal_voices.create_voice(
+            user,
+            voice_key=personal_voice_id,
+            name=voice_name,
+            voice_talent_name=voice_talent_name,
+            company_name=company_name,
+            voice_id=voice_id,  # CosyVoice的voice_id
+            voice_prefix=voice_prefix
+        )
+        voice_data = personal_voices.voice_to_dict(voice)
 
         logger.info(f"个人语音创建成功: {personal_voice_id}, voice_id={voice_id}")
 
@@ -268,6 +258,69 @@ def create_personal_voice(request):
         }, status=500)
 
 
+def _parse_personal_synthesis_request(request):
+    """
+    解析并校验个人语音合成参数（voice_id 须为自己的或共用的可用语音），校验通过时设置 DashScope API Key
+
+    Returns:
+        tuple: ({text, voice_id, rate, pitch}, None) 或 (None, 错误响应)
+    """
+    data = json.loads(request.body)
+    params = {
+        'text': data.get('text', '').strip(),
+        'voice_id': data.get('voice_id', '').strip(),  # 使用voice_id而不是speaker_profile_id
+        'rate': data.get('rate', '0%'),
+        'pitch': data.get('pitch', '0%'),
+    }
+
+    if not params['text'] or not params['voice_id']:
+        return None, JsonResponse({
+            'status': 'error',
+            'message': '文本和语音ID不能为空'
+        }, status=400)
+
+    if len(params['text']) > 5000:
+        return None, JsonResponse({
+            'status': 'error',
+            'message': '文本长度不能超过5000字符'
+        }, status=400)
+
+    # 只能使用自己的语音和共用语音
+    user = personal_voices.get_request_user(request)
+    if personal_voices.get_synthesis_voice(user, params['voice_id']) is None:
+        return None, JsonResponse({
+            'status': 'error',
+            'message': '语音不存在'
+        }, status=404)
+
+    # 验证DashScope配置
+    if not DASHSCOPE_API_KEY:
+        return None, JsonResponse({
+            'status': 'error',
+            'message': 'DashScope API Key配置缺失'
+        }, status=500)
+
+    # 设置API Key
+    import dashscope
+    dashscope.api_key = DASHSCOPE_API_KEY
+    return params, None
+
+
+def _synthesize_personal_text(voice_id):
+    """返回合成函数：参数为一段文本，返回 MP3 字节（每次调用新建合成器，可在多个线程中并发调用）"""
+    def synthesize(text):
+        return SpeechSynthesizer(model=TARGET_MODEL, voice=voice_id).call(text)
+    return synthesize
+
+
+def _personal_result(audio_filename, cache_status):
+    return {
+        'audio_url': f'/media/tts/{audio_filename}',
+        'filename': audio_filename,
+        'cached': cache_status != cosyvoice_cache.CACHE_MISS
+    }
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def synthesize_with_personal_voice(request):
@@ -280,66 +333,117 @@ def synthesize_with_personal_voice(request):
     - pitch: 音调 (可选)
     """
     try:
-        data = json.loads(request.body)
-        text = data.get('text', '').strip()
-        voice_id = data.get('voice_id', '').strip()  # 使用voice_id而不是speaker_profile_id
-        rate = data.get('rate', '0%')
-        pitch = data.get('pitch', '0%')
+        params, error_response = _parse_personal_synthesis_request(request)
+        if error_response:
+            return error_response
+        text, voice_id = params['text'], params['voice_id']
 
-        if not text or not voice_id:
-            return JsonResponse({
-                'status': 'error',
-                'message': '文本和语音ID不能为空'
-            }, status=400)
+        logger.info(f"使用个人语音合成: voice_id={voice_id}")
 
-        if len(text) > 5000:
-            return JsonResponse({
-                'status': 'error',
-                'message': '文本长度不能超过5000字符'
-            }, status=400)
+        # 相同参数直接返回缓存；并发的相同请求只合成一次；多句文本按句复用已合成的句子
+        audio_filename, cache_status = cosyvoice_cache.cached_synthesis(
+            _synthesize_personal_text(voice_id), TARGET_MODEL, voice_id, text,
+            rate=params['rate'], pitch=params['pitch']
+        )
 
-        # 验证DashScope配置
-        if not DASHSCOPE_API_KEY:
-            return JsonResponse({
-                'status': 'error',
-                'message': 'DashScope API Key配置缺失'
-            }, status=500)
+        logger.info(f"个人语音合成成功: {audio_filename}, cache={cache_status}")
 
-        # 设置API Key
-        import dashscope
-        dashscope.api_key = DASHSCOPE_API_KEY
+        return JsonResponse({
+            'status': 'success',
+            'message': '个人语音合成成功',
+            **_personal_result(audio_filename, cache_status)
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'status': 'error',
+            'message': '无效的JSON数据'
+        }, status=400)
+    except Exception as e:
+        logger.error(f"个人语音合成错误: {str(e)}", exc_info=True)
+        return JsonResponse({
+            'status': 'error',
+            'message': f'个人语音合成失败: {str(e)}'
+        }, status=500)
 
-        # 创建语音合成器
-        synthesizer = SpeechSynthesizer(model=TARGET_MODEL, voice=voice_id)
 
-        logger.info(f"使用个人语音合成: voice_id={voice_id}")
+class _PersonalStreamCallback(ResultCallback):
+    """DashScope 流式合成回调：收到的音频块写入合成会话"""
 
-        # 调用合成接口
-        audio_data = synthesizer.call(text)
+    def __init__(self, stream):
+        self.stream = stream
+        self.audio_parts = []
+        self.error = None
+        self.finished = threading.Event()
 
-        if not audio_data:
-            raise Exception("语音合成返回空数据")
+    def on_data(self, data: bytes) -> None:
+        self.audio_parts.append(data)
+        self.stream.add_audio(data)
 
-        # 生成唯一的文件名
-        audio_filename = f"personal_tts_{uuid.uuid4()}.mp3"
+    def on_error(self, message) -> None:
+        self.error = str(message)
+        self.finished.set()
 
-        # 保存到media目录
-        media_dir = '/var/www/harry-insurance2/media/tts'
-        os.makedirs(media_dir, exist_ok=True)
-        audio_path = os.path.join(media_dir, audio_filename)
+    def on_complete(self) -> None:
+        self.finished.set()
 
-        # 写入音频数据
-        with open(audio_path, 'wb') as f:
-            f.write(audio_data)
+    def on_close(self) -> None:
+        self.finished.set()
 
-        logger.info(f"个人语音合成成功: {audio_filename}, size={len(audio_data)} bytes")
 
-        return JsonResponse({
-            'status': 'success',
-            'message': '个人语音合成成功',
-            'audio_url': f'/media/tts/{audio_filename}',
-            'filename': audio_filename
-        })
+def _produce_personal_stream(stream, text, voice_id, rate, pitch):
+    """后台线程中流式合成，完成后按合成参数的哈希保存音频（之后相同请求直接命中缓存）"""
+    callback = _PersonalStreamCallback(stream)
+    synthesizer = SpeechSynthesizer(model=TARGET_MODEL, voice=voice_id, callback=callback)
+    synthesizer.call(text)
+    if not callback.finished.wait(timeout=PERSONAL_STREAM_TIMEOUT):
+        raise Exception("语音合成超时")
+    if callback.error:
+        raise Exception(callback.error)
+
+    audio_data = b''.join(callback.audio_parts)
+    if not audio_data:
+        raise Exception("语音合成返回空数据")
+
+    key = cosyvoice_cache.synthesis_key(TARGET_MODEL, voice_id, text, rate, pitch)
+    audio_filename = cosyvoice_cache.store_audio(key, audio_data)
+    logger.info(f"个人语音流式合成成功: {audio_filename}, size={len(audio_data)} bytes")
+    return _personal_result(audio_filename, cosyvoice_cache.CACHE_MISS)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def synthesize_with_personal_voice_stream(request):
+    """
+    使用个人语音流式合成（参数同 synthesize_with_personal_voice）
+
+    立即返回会话地址：audio_url 边合成边播放，events_url（SSE）在结束时返回保存后的音频地址
+    （CosyVoice 没有字幕时间戳，不产生 cue 事件）
+    """
+    try:
+        params, error_response = _parse_personal_synthesis_request(request)
+        if error_response:
+            return error_response
+
+        text, voice_id, rate, pitch = params['text'], params['voice_id'], params['rate'], params['pitch']
+        logger.info(f"使用个人语音流式合成: voice_id={voice_id}")
+
+        # 已缓存时直接返回已完成的会话
+        key = cosyvoice_cache.synthesis_key(TARGET_MODEL, voice_id, text, rate, pitch)
+        audio_filename = cosyvoice_cache.lookup(key)
+        if audio_filename:
+            try:
+                with open(os.path.join(tts_cache.get_tts_dir(), audio_filename), 'rb') as f:
+                    audio_data = f.read()
+            except FileNotFoundError:
+                audio_filename = None
+        if audio_filename:
+            stream = tts_streaming.create_completed_stream(
+                audio_data, [], _personal_result(audio_filename, cosyvoice_cache.CACHE_HIT)
+            )
+        else:
+            stream = tts_streaming.create_stream(_produce_personal_stream, text, voice_id, rate, pitch)
+        return build_stream_response(stream)
 
     except json.JSONDecodeError:
         return JsonResponse({
@@ -347,7 +451,7 @@ def synthesize_with_personal_voice(request):
             'message': '无效的JSON数据'
         }, status=400)
     except Exception as e:
-        logger.error(f"个人语音合成错误: {str(e)}", exc_info=True)
+        logger.error(f"个人语音流式合成错误: {str(e)}", exc_info=True)
         return JsonResponse({
             'status': 'error',
             'message': f'个人语音合成失败: {str(e)}'
@@ -359,17 +463,22 @@ def synthesize_with_personal_voice(request):
 def delete_personal_voice(request, voice_id):
     """删除个人语音"""
     try:
-        voices = load_personal_voice_list()
-        voice_to_delete = None
-        remaining_voices = []
+        user = personal_voices.get_request_user(request)
+        if user is None:
+            return JsonResponse({
+                'status': 'error',
+                'message': '请先登录'
+            }, status=401)
 
-        for voice in voices:
-            if voice['id'] == voice_id:
-                voice_to_delete = voice
-            else:
-                remaining_voices.append(voice)
+        voice_to_delete = personal_voices.get_voice(user, voice_id)
+        if voice_to_delete is not None and not personal_voices.can_delete_voice(user, voice_to_delete):
+            return JsonResponse({
+                'status': 'error',
+                'message': '共用语音只有管理员可以删除'
+            }, status=403)
 
-        if not voice_to_delete:
+        # 先删除记录（并发删除同一语音时只有一个请求继续删除远程资源和文件）
+        if voice_to_delete is None or not personal_voices.delete_voice(voice_to_delete):
             return JsonResponse({
                 'status': 'error',
                 'message': '语音不存在'
@@ -381,7 +490,7 @@ def delete_personal_voice(request, voice_id):
             dashscope.api_key = DASHSCOPE_API_KEY
 
             service = VoiceEnrollmentService()
-            cosy_voice_id = voice_to_delete.get('voice_id')
+            cosy_voice_id = voice_to_delete.voice_id
             if cosy_voice_id:
                 service.delete_voice(voice_id=cosy_voice_id)
                 logger.info(f"已从CosyVoice删除语音: {cosy_voice_id}")
@@ -394,9 +503,6 @@ def delete_personal_voice(request, voice_id):
             import shutil
             shutil.rmtree(voice_dir)
 
-        # 更新列表
-        save_personal_voice_list(remaining_voices)
-
         return JsonResponse({
             'status': 'success',
             'message': '个人语音已删除'
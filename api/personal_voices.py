@@ -0,0 +1,138 @@
+"""
+个人语音登记
+个人语音保存在 PersonalVoice 表（按用户、状态建索引），列表按用户缓存：
+用户看到自己的语音和共用语音（user 为空），两部分分别缓存，创建、删除时只清除所属部分；
+接口创建的语音都属于登录用户，共用语音只能由管理员在 Admin 中指定，也只有管理员可以删除
+"""
+import logging
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+LIST_CACHE_KEY = 'personal_voices:{owner}'
+LIST_CACHE_TIMEOUT = 60 * 60
+
+
+def get_request_user(request):
+    """
+    个人语音接口是普通 Django 视图（不经过 DRF 认证），带 JWT 时解析出用户，
+    没有或无效时返回 None（只能看到共用语音）
+    """
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except Exception:
+        return None
+    return result[0] if result else None
+
+
+def voice_to_dict(voice):
+    """接口返回格式（与原来 voices.json 中的字段相同）"""
+    return {
+        'id': voice.voice_key,
+        'name': voice.name,
+        'voice_talent_name': voice.voice_talent_name,
+        'company_name': voice.company_name,
+        'voice_id': voice.voice_id,
+        'voice_prefix': voice.voice_prefix,
+        'status': voice.status,
+        'shared': voice.user_id is None,
+        'created_at': timezone.localtime(voice.created_at).strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def _owner_key(user_id):
+    return LIST_CACHE_KEY.format(owner=user_id or 'shared')
+
+
+def _list_owner_voices(user_id):
+    """某个用户（或共用）的可用语音（缓存）"""
+    from .models import PersonalVoice
+
+    key = _owner_key(user_id)
+    voices = cache.get(key)
+    if voices is None:
+        voices = [
+            voice_to_dict(voice)
+            for voice in PersonalVoice.objects.filter(user_id=user_id, status='active')
+        ]
+        cache.set(key, voices, timeout=LIST_CACHE_TIMEOUT)
+    return voices
+
+
+def invalidate_voice_list(user_id):
+    cache.delete(_owner_key(user_id))
+
+
+def list_voices(user):
+    """用户可用的个人语音：共用语音 + 自己的语音，按创建时间排序"""
+    voices = list(_list_owner_voices(None))
+    if user is not None:
+        voices.extend(_list_owner_voices(user.id))
+        voices.sort(key=lambda voice: voice['created_at'])
+    return voices
+
+
+def create_voice(user, **fields):
+    """登记新创建的个人语音"""
+    from .models import PersonalVoice
+
+    voice = PersonalVoice.objects.create(user=user, **fields)
+    invalidate_voice_list(voice.user_id)
+    return voice
+
+
+def _owner_filter(user):
+    """用户可以使用的语音：共用语音 + 自己的语音（未登录时只有共用语音）"""
+    owner_filter = Q(user__isnull=True)
+    if user is not None:
+        owner_filter |= Q(user=user)
+    return owner_filter
+
+
+def get_voice(user, voice_key):
+    """
+    获取用户可以操作的语音（自己的或共用的）
+
+    Returns:
+        PersonalVoice 或 None
+    """
+    from .models import PersonalVoice
+
+    return PersonalVoice.objects.filter(_owner_filter(user), voice_key=voice_key).first()
+
+
+def get_synthesis_voice(user, voice_id):
+    """
+    按 CosyVoice voice_id 获取用户可以用于合成的可用语音（自己的或共用的），
+    防止用其他用户的 voice_id 合成
+
+    Returns:
+        PersonalVoice 或 None
+    """
+    from .models import PersonalVoice
+
+    return PersonalVoice.objects.filter(_owner_filter(user), voice_id=voice_id, status='active').first()
+
+
+def can_delete_voice(user, voice):
+    """自己的语音可以删除，共用语音只有管理员可以删除"""
+    if user is None:
+        return False
+    if voice.user_id is None:
+        return user.is_staff
+    return voice.user_id == user.id
+
+
+def delete_voice(voice):
+    """
+    删除语音记录，返回是否删除（并发删除同一语音时只有一个请求返回 True）；
+    列表缓存由 post_delete 信号清除（用户被删除时级联删除的语音也一样）
+    """
+    from .models import PersonalVoice
+
+    deleted, _ = PersonalVoice.objects.filter(id=voice.id).delete()
+    return bool(deleted)
@@ -0,0 +1,223 @@
+"""
+计划书多文档对比引擎
+将多份 PlanDocument 的 table1（基本计划退保价值表）或 table2（无忧选退保价值表）
+按保单年度或受保人到达年龄对齐，用 NumPy 向量化计算差额、比率和交叉年度，
+返回紧凑的列式结果
+"""
+import json
+import numpy as np
+
+# 各表可对比的字段
+TABLE_METRICS = {
+    'table1': ('guaranteed', 'total'),
+    'table2': ('withdraw', 'withdraw_total', 'total', 'total_with_withdrawn'),
+}
+
+# 旧版 deepseek_service 提取结果中的字段名（新字段缺失时使用）
+METRIC_FALLBACKS = {
+    'guaranteed': 'guaranteed_cash_value',
+}
+
+ALIGN_MODES = ('policy_year', 'age')
+
+
+def _to_float(value):
+    """转为浮点数，无法转换时返回 NaN"""
+    if value is None or value == '':
+        return np.nan
+    try:
+        return float(str(value).replace(',', ''))
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def load_table_columns(doc, table='table1'):
+    """
+    将文档的 table1/table2 JSON 解析为列式数组
+
+    Returns:
+        dict: {'policy_year': ndarray[int], '<metric>': ndarray[float], ...}，无数据时返回 None
+    """
+    raw = getattr(doc, table, '')
+    if not raw:
+        return None
+    try:
+        data = json.loads(raw) if isinstance(raw, str) else raw
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+    rows = data.get('years', []) if isinstance(data, dict) else data
+    if not isinstance(rows, list):
+        return None
+
+    base_metrics = [m for m in TABLE_METRICS[table] if m != 'total_with_withdrawn']
+    years = []
+    values = {metric: [] for metric in base_metrics}
+    for row in rows:
+        if not isinstance(row, dict):
+            continue
+        try:
+            year = int(_to_float(row.get('policy_year', row.get('year'))))
+        except (TypeError, ValueError):
+            continue
+        years.append(year)
+        for metric in base_metrics:
+            value = row.get(metric)
+            if (value is None or value == '') and metric in METRIC_FALLBACKS:
+                value = row.get(METRIC_FALLBACKS[metric])
+            values[metric].append(_to_float(value))
+
+    if not years:
+        return None
+
+    columns = {'policy_year': np.array(years, dtype=np.int64)}
+    for metric in base_metrics:
+        columns[metric] = np.array(values[metric], dtype=np.float64)
+    if table == 'table2':
+        # 累计已支付入息 + 退保价值
+        columns['total_with_withdrawn'] = np.nansum(
+            np.vstack([columns['withdraw_total'], columns['total']]), axis=0
+        )
+        columns['total_with_withdrawn'][np.isnan(columns['total'])] = np.nan
+
+    # 同一年度出现多次时保留最后一行
+    _, last_index = np.unique(columns['policy_year'][::-1], return_index=True)
+    keep = np.sort(len(years) - 1 - last_index)
+    return {name: arr[keep] for name, arr in columns.items()}
+
+
+def _crossovers(diff, axis):
+    """
+    计算相对基准的交叉点：差额符号发生变化的位置
+
+    Returns:
+        list[dict]: [{'at': 轴值, 'direction': 'above'|'below'}]
+    """
+    valid = np.flatnonzero(~np.isnan(diff))
+    if valid.size < 2:
+        return []
+    signs = np.sign(diff[valid])
+    # 差额为0时沿用前一个非零符号，避免把"持平"记为两次交叉
+    last_nonzero = np.maximum.accumulate(np.where(signs != 0, np.arange(signs.size), 0))
+    signs = signs[last_nonzero]
+    change = np.flatnonzero((signs[1:] != signs[:-1]) & (signs[:-1] != 0))
+    return [
+        {
+            'at': int(axis[valid[i + 1]]),
+            'direction': 'above' if signs[i + 1] > 0 else 'below'
+        }
+        for i in change
+    ]
+
+
+def _to_list(arr, digits=2):
+    """ndarray 转 JSON 列表，NaN 转为 None"""
+    rounded = np.round(arr, digits)
+    return [None if np.isnan(v) else float(v) for v in rounded]
+
+
+def compare_documents(documents, table='table1', align='policy_year', baseline_id=None, metrics=None):
+    """
+    对比多份计划书
+
+    Args:
+        documents: PlanDocument 列表（顺序即返回顺序）
+        table: 'table1' 或 'table2'
+        align: 'policy_year' 按保单年度对齐；'age' 按到达年龄（insured_age + 保单年度）对齐
+        baseline_id: 作为基准的文档ID，默认第一份
+        metrics: 需要对比的字段，默认该表的全部字段
+
+    Returns:
+        dict: 列式结果
+            {
+                'align': 'policy_year',
+                'axis': [1, 2, ...],
+                'baseline_id': 12,
+                'documents': [{'id', 'file_name', 'insurance_company', 'insurance_product', 'insured_age', 'has_data'}],
+                'series': {metric: {doc_id: [...]}},
+                'diff': {metric: {doc_id: [...]}},     # 相对基准的差额
+                'ratio': {metric: {doc_id: [...]}},    # 相对基准的比率
+                'crossovers': {metric: {doc_id: [...]}}
+            }
+    """
+    if table not in TABLE_METRICS:
+        raise ValueError(f'不支持的表: {table}')
+    if align not in ALIGN_MODES:
+        raise ValueError(f'不支持的对齐方式: {align}')
+    metrics = [m for m in (metrics or TABLE_METRICS[table]) if m in TABLE_METRICS[table]]
+
+    doc_ids = [doc.id for doc in documents]
+    if baseline_id is None or baseline_id not in doc_ids:
+        baseline_id = doc_ids[0]
+    base_row = doc_ids.index(baseline_id)
+
+    # 1. 解析并计算每份文档的对齐键
+    loaded = []
+    for doc in documents:
+        columns = load_table_columns(doc, table)
+        keys = None
+        if columns is not None:
+            keys = columns['policy_year']
+            if align == 'age':
+                if doc.insured_age is None:
+                    columns, keys = None, None
+                else:
+                    keys = keys + int(doc.insured_age)
+        loaded.append((columns, keys))
+
+    # 2. 对齐轴：所有文档键的并集
+    all_keys = [keys for _, keys in loaded if keys is not None]
+    axis = np.unique(np.concatenate(all_keys)) if all_keys else np.array([], dtype=np.int64)
+
+    # 3. 构建 文档 × 轴 矩阵
+    matrices = {metric: np.full((len(documents), axis.size), np.nan) for metric in metrics}
+    for row, (columns, keys) in enumerate(loaded):
+        if columns is None:
+            continue
+        positions = np.searchsorted(axis, keys)
+        for metric in metrics:
+            matrices[metric][row, positions] = columns[metric]
+
+    # 4. 向量化计算差额、比率、交叉点
+    series, diffs, ratios, crossovers = {}, {}, {}, {}
+    for metric, matrix in matrices.items():
+        base = matrix[base_row]
+        diff = matrix - base
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(base != 0, matrix / base, np.nan)
+
+        series[metric] = {str(doc_id): _to_list(matrix[i]) for i, doc_id in enumerate(doc_ids)}
+        diffs[metric] = {}
+        ratios[metric] = {}
+        crossovers[metric] = {}
+        for i, doc_id in enumerate(doc_ids):
+            if i == base_row:
+                continue
+            diffs[metric][str(doc_id)] = _to_list(diff[i])
+            ratios[metric][str(doc_id)] = _to_list(ratio[i], digits=4)
+            crossovers[metric][str(doc_id)] = _crossovers(diff[i], axis)
+
+    return {
+        'table': table,
+        'align': align,
+        'axis': [int(v) for v in axis],
+        'baseline_id': baseline_id,
+        'metrics': metrics,
+        'documents': [
+            {
+                'id': doc.id,
+                'file_name': doc.file_name,
+                'insurance_company': doc.insurance_company,
+                'insurance_product': doc.insurance_product,
+                'insured_age': doc.insured_age,
+                'annual_premium': str(doc.annual_premium) if doc.annual_premium else None,
+                'payment_years': doc.payment_years,
+                'has_data': loaded[i][0] is not None,
+            }
+            for i, doc in enumerate(documents)
+        ],
+        'series': series,
+        'diff': diffs,
+        'ratio': ratios,
+        'crossovers': crossovers,
+    }
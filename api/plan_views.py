@@ -129,14 +129,11 @@ def upload_plan_document(request):
 
             # 更新会员使用统计
             if request.user.is_authenticated:
+                from django.db.models import F
                 from .models import Membership
-                try:
-                    membership = Membership.objects.get(user=request.user)
-                    membership.documents_created += 1
-                    membership.save()
-                    print(f"📊 会员已创建计划书数: {membership.documents_created}")
-                except Membership.DoesNotExist:
-                    pass
+                # 原子递增，并发处理不会丢失计数
+                if Membership.objects.filter(user=request.user).update(documents_created=F('documents_created') + 1):
+                    print("📊 会员已创建计划书数 +1")
 
             # 保存年度价值表
             annual_values = extracted.get('annual_values', [])
@@ -0,0 +1,208 @@
+"""
+产品退保价值表自动刷新
+用每个产品配置的 InsuranceCompanyRequest 模板并发请求保险公司API，
+把响应规范化为标准退保价值表，与已存储的表比较，只批量更新有变化的产品，
+更新后使标准对比快照失效并预热
+
+本地测试可用 base_url 把所有请求指向桩服务器（见 scripts/stub_insurer_server.py）
+"""
+import json
+import logging
+from urllib.parse import urlsplit, urlunsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.utils import timezone
+from .comparison_service import parse_surrender_table, invalidate_comparison_snapshots, get_comparison_snapshot
+from .illustration_sweep import execute_illustration, get_max_concurrency_per_host
+from .insurer_request_service import CompiledRequestConfig
+
+logger = logging.getLogger(__name__)
+
+# 比较退保价值表时使用的字段
+COMPARE_FIELDS = ('guaranteed', 'non_guaranteed', 'total', 'premiums_paid')
+
+# 数值比较容差（保险公司返回的金额可能有小数舍入差异）
+VALUE_TOLERANCE = 0.5
+
+
+def _to_number(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(str(value).replace(',', ''))
+    except (TypeError, ValueError):
+        return None
+
+
+def _table_signature(rows):
+    """
+    退保价值表的比较签名：{保单年度: (保证, 非保证, 总额, 已缴保费)}
+    """
+    signature = {}
+    for row in rows or []:
+        if not isinstance(row, dict):
+            continue
+        year = _to_number(row.get('policy_year', row.get('year')))
+        if year is None:
+            continue
+        signature[int(year)] = tuple(_to_number(row.get(field)) for field in COMPARE_FIELDS)
+    return signature
+
+
+def tables_differ(stored_rows, new_rows):
+    """比较两张退保价值表（年度集合或任一数值差异超过容差即视为不同）"""
+    old = _table_signature(stored_rows)
+    new = _table_signature(new_rows)
+    if old.keys() != new.keys():
+        return True
+    for year, new_values in new.items():
+        for old_value, new_value in zip(old[year], new_values):
+            if old_value is None and new_value is None:
+                continue
+            if old_value is None or new_value is None or abs(old_value - new_value) > VALUE_TOLERANCE:
+                return True
+    return False
+
+
+def _merge_surrender_table(raw, new_rows):
+    """
+    生成新的 surrender_value_table 文本，保持原有格式：
+    原来是 {"standard": [...], ...} 时只替换 standard，其余情况存为列表
+    """
+    try:
+        existing = json.loads(raw) if raw else None
+    except (json.JSONDecodeError, TypeError):
+        existing = None
+    if isinstance(existing, dict):
+        return json.dumps({**existing, 'standard': new_rows}, ensure_ascii=False)
+    return json.dumps(new_rows, ensure_ascii=False)
+
+
+def _rebase_url(url, base_url):
+    """把请求URL的协议和主机替换为 base_url（用于指向本地桩服务器）"""
+    base = urlsplit(base_url)
+    parts = urlsplit(url)
+    return urlunsplit((base.scheme, base.netloc, base.path.rstrip('/') + parts.path, parts.query, parts.fragment))
+
+
+def build_refresh_form_data(product):
+    """产品的表单数据：通用字段 + 产品配置的 illustration_params（后者优先）"""
+    form_data = {
+        'annual_premium': int(product.annual_premium) if product.annual_premium == int(product.annual_premium)
+        else float(product.annual_premium),
+        'payment_period': product.payment_period,
+        'product_name': product.product_name,
+    }
+    form_data.update(product.illustration_params or {})
+    return form_data
+
+
+def refresh_product_tables(product_ids=None, company_codes=None, dry_run=False, base_url=None,
+                           timeout=None, warm_cache=True):
+    """
+    刷新产品退保价值表
+
+    Args:
+        product_ids: 只刷新这些产品（可选）
+        company_codes: 只刷新这些公司的产品（可选）
+        dry_run: 只比较不写入
+        base_url: 把请求发往该地址（如 http://127.0.0.1:8765），用于本地桩服务器测试
+        timeout: 单个请求超时（秒），默认按主机配置
+        warm_cache: 更新后是否预热受影响缴费年期的对比快照
+
+    Returns:
+        dict: {'total', 'changed', 'unchanged', 'failed', 'updated_ids', 'errors': [{product_id, message}]}
+    """
+    from .models import InsuranceProduct
+
+    products = InsuranceProduct.objects.filter(
+        is_active=True,
+        company__is_active=True,
+        illustration_request__isnull=False,
+        illustration_request__is_active=True,
+    ).select_related('company', 'illustration_request').order_by('id')
+    if product_ids:
+        products = products.filter(id__in=product_ids)
+    if company_codes:
+        products = products.filter(company__code__in=company_codes)
+    products = list(products)
+
+    summary = {
+        'total': len(products),
+        'changed': 0,
+        'unchanged': 0,
+        'failed': 0,
+        'updated_ids': [],
+        'errors': [],
+    }
+    if not products:
+        return summary
+
+    # 1. 构建请求（同一请求配置只编译一次）
+    compiled_by_request = {}
+    jobs = []
+    for product in products:
+        req_config = product.illustration_request
+        compiled = compiled_by_request.get(req_config.id)
+        if compiled is None:
+            compiled = compiled_by_request[req_config.id] = CompiledRequestConfig(product.company, req_config)
+        prepared = compiled.build(form_data=build_refresh_form_data(product))
+        if base_url:
+            prepared['url'] = _rebase_url(prepared['url'], base_url)
+        jobs.append((product, prepared))
+
+    # 2. 并发请求（每个主机的并发数由 execute_illustration 内的信号量限制）
+    products_by_id = {product.id: product for product in products}
+    results = {}
+    max_workers = min(len(jobs), max(get_max_concurrency_per_host(), 1) * 2)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='product-refresh') as executor:
+        futures = {
+            executor.submit(execute_illustration, prepared, {'product_id': product.id}, timeout): product.id
+            for product, prepared in jobs
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    # 3. 比较并收集需要更新的产品
+    now = timezone.now()
+    changed = []
+    for product_id, result in results.items():
+        product = products_by_id[product_id]
+        new_rows = (result.get('normalized') or {}).get('standard')
+        if not result['success'] or not new_rows:
+            summary['failed'] += 1
+            message = result['error_message'] or '响应无法解析为退保价值表'
+            summary['errors'].append({'product_id': product_id, 'message': message})
+            logger.warning(f"⚠️ 产品 {product_id} ({product.product_name}) 刷新失败: {message}")
+            continue
+
+        stored = parse_surrender_table(product.surrender_value_table)
+        if stored is not None and not tables_differ(stored['standard'], new_rows):
+            summary['unchanged'] += 1
+            continue
+
+        summary['changed'] += 1
+        summary['updated_ids'].append(product_id)
+        product.surrender_value_table = _merge_surrender_table(product.surrender_value_table, new_rows)
+        product.surrender_table_refreshed_at = now
+        product.updated_at = now
+        changed.append(product)
+
+    summary['updated_ids'].sort()
+    logger.info(
+        f"🔄 产品退保价值表刷新: 共{summary['total']}个，变化{summary['changed']}个，"
+        f"未变{summary['unchanged']}个，失败{summary['failed']}个{'（试运行）' if dry_run else ''}"
+    )
+    if dry_run or not changed:
+        return summary
+
+    # 4. 只批量更新有变化的产品（bulk_update 不触发信号，手动使缓存失效）
+    InsuranceProduct.objects.bulk_update(
+        changed, ['surrender_value_table', 'surrender_table_refreshed_at', 'updated_at'], batch_size=100
+    )
+    invalidate_comparison_snapshots()
+
+    if warm_cache:
+        for payment_period in sorted({product.payment_period for product in changed}):
+            get_comparison_snapshot(payment_period)
+
+    return summary
@@ -0,0 +1,217 @@
+"""
+产品价值列式存储
+把所有启用产品的退保价值表解析为 NumPy 矩阵（产品 × 保单年度），
+支持"第N年总价值 ≥ X"、"第N年达到已缴保费的M倍"、Top-K 和逐年排名等查询
+
+存储按进程缓存，以标准对比快照的版本号判断是否需要重建（产品变更时版本号递增）
+"""
+import logging
+import threading
+import numpy as np
+from .comparison_service import parse_surrender_table, get_comparison_version
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('total', 'guaranteed', 'non_guaranteed')
+
+
+class ProductValueStore:
+    """
+    列式产品价值存储
+
+    属性:
+        product_ids, company_ids, payment_periods, annual_premiums: 长度为 P 的一维数组
+        values[metric]: P × Y 的 float64 矩阵，第 j 列对应保单年度 j+1，缺失为 NaN
+        premiums_paid: P × Y 的累计已缴保费矩阵
+    """
+
+    def __init__(self, products, version=0):
+        self.version = version
+        self.product_names = [p['product_name'] for p in products]
+        self.company_codes = [p['company_code'] for p in products]
+        self.company_names = [p['company_name'] for p in products]
+        self.product_ids = np.array([p['product_id'] for p in products], dtype=np.int64)
+        self.company_ids = np.array([p['company_id'] for p in products], dtype=np.int64)
+        self.payment_periods = np.array([p['payment_period'] for p in products], dtype=np.int64)
+        self.annual_premiums = np.array([p['annual_premium'] for p in products], dtype=np.float64)
+
+        self.max_year = max((row[0] for p in products for row in p['rows']), default=0)
+        shape = (len(products), self.max_year)
+        self.values = {metric: np.full(shape, np.nan) for metric in METRICS}
+        premiums_paid = np.full(shape, np.nan)
+
+        for i, product in enumerate(products):
+            if not product['rows']:
+                continue
+            rows = np.array(product['rows'], dtype=np.float64)
+            cols = rows[:, 0].astype(np.int64) - 1
+            self.values['guaranteed'][i, cols] = rows[:, 1]
+            self.values['non_guaranteed'][i, cols] = rows[:, 2]
+            self.values['total'][i, cols] = rows[:, 3]
+            premiums_paid[i, cols] = rows[:, 4]
+
+        # 缺失的已缴保费按 年缴保费 × min(年度, 缴费年期) 推算
+        years = np.arange(1, self.max_year + 1, dtype=np.float64)
+        derived = self.annual_premiums[:, None] * np.minimum(years[None, :], self.payment_periods[:, None])
+        self.premiums_paid = np.where(np.isnan(premiums_paid), derived, premiums_paid)
+
+    @classmethod
+    def from_queryset(cls, queryset, version=0):
+        """从 InsuranceProduct 查询集构建（每个产品的JSON只解析一次）"""
+        products = []
+        for product in queryset.select_related('company'):
+            standard_data = parse_surrender_table(product.surrender_value_table)
+            rows = []
+            for row in (standard_data or {}).get('standard', []):
+                if not isinstance(row, dict):
+                    continue
+                try:
+                    year = int(row.get('policy_year', row.get('year')))
+                except (TypeError, ValueError):
+                    continue
+                if year < 1:
+                    continue
+                rows.append((
+                    year,
+                    _to_float(row.get('guaranteed')),
+                    _to_float(row.get('non_guaranteed')),
+                    _to_float(row.get('total')),
+                    _to_float(row.get('premiums_paid')),
+                ))
+            products.append({
+                'product_id': product.id,
+                'product_name': product.product_name,
+                'company_id': product.company_id,
+                'company_code': product.company.code,
+                'company_name': product.company.name,
+                'payment_period': product.payment_period,
+                'annual_premium': float(product.annual_premium or 0),
+                'rows': rows,
+            })
+        return cls(products, version=version)
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def query(self, year, metric='total', payment_period=None, company_codes=None,
+              min_value=None, min_multiple=None, top_k=None, ascending=False):
+        """
+        在指定保单年度上筛选、排序产品
+
+        Args:
+            year: 保单年度（从1开始）
+            metric: 'total' / 'guaranteed' / 'non_guaranteed'
+            payment_period: 缴费年期过滤（可选）
+            company_codes: 公司代码列表过滤（可选）
+            min_value: 该年度价值下限（可选）
+            min_multiple: 该年度价值 / 累计已缴保费 的下限（可选），例如 2 表示翻倍
+            top_k: 只返回前K个（可选）
+            ascending: 是否升序排列，默认按价值从高到低
+
+        Returns:
+            list[dict]: 每个产品的 product_id、名称、公司、该年度价值与倍数、排名
+        """
+        if metric not in METRICS:
+            raise ValueError(f'不支持的指标: {metric}')
+        if year < 1 or year > self.max_year or len(self) == 0:
+            return []
+
+        col = year - 1
+        value = self.values[metric][:, col]
+        paid = self.premiums_paid[:, col]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            multiple = np.where(paid > 0, value / paid, np.nan)
+
+        mask = ~np.isnan(value)
+        if payment_period is not None:
+            mask &= self.payment_periods == payment_period
+        if company_codes:
+            codes = set(company_codes)
+            mask &= np.fromiter((code in codes for code in self.company_codes), dtype=bool, count=len(self))
+        if min_value is not None:
+            mask &= value >= min_value
+        if min_multiple is not None:
+            mask &= np.nan_to_num(multiple, nan=-np.inf) >= min_multiple
+
+        idx = np.flatnonzero(mask)
+        if idx.size == 0:
+            return []
+
+        order = np.argsort(value[idx], kind='stable')
+        if not ascending:
+            order = order[::-1]
+        if top_k is not None and top_k < idx.size:
+            order = order[:top_k]
+        idx = idx[order]
+
+        return [
+            {
+                'rank': rank,
+                'product_id': int(self.product_ids[i]),
+                'product_name': self.product_names[i],
+                'company_code': self.company_codes[i],
+                'company_name': self.company_names[i],
+                'payment_period': int(self.payment_periods[i]),
+                'annual_premium': float(self.annual_premiums[i]),
+                'year': year,
+                'value': float(value[i]),
+                'premiums_paid': float(paid[i]),
+                'multiple': None if np.isnan(multiple[i]) else round(float(multiple[i]), 4),
+            }
+            for rank, i in enumerate(idx, start=1)
+        ]
+
+    def first_year_reaching(self, min_multiple, metric='total', payment_period=None):
+        """
+        每个产品首次达到"价值 ≥ 累计已缴保费 × min_multiple"的保单年度（回本/翻倍年度）
+
+        Returns:
+            dict: {product_id: year 或 None}
+        """
+        if self.max_year == 0:
+            return {int(pid): None for pid in self.product_ids}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            reached = np.nan_to_num(self.values[metric] / self.premiums_paid, nan=-np.inf) >= min_multiple
+        rows = np.arange(len(self))
+        if payment_period is not None:
+            rows = rows[self.payment_periods == payment_period]
+        first = reached.argmax(axis=1)
+        return {
+            int(self.product_ids[i]): (int(first[i]) + 1 if reached[i, first[i]] else None)
+            for i in rows
+        }
+
+
+def _to_float(value):
+    """转为浮点数，无法转换时返回 NaN"""
+    if value is None or value == '':
+        return np.nan
+    try:
+        return float(str(value).replace(',', ''))
+    except (TypeError, ValueError):
+        return np.nan
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_product_value_store():
+    """
+    获取当前进程的产品价值存储，产品数据变更（版本号变化）后自动重建
+    """
+    global _store
+    from .models import InsuranceProduct
+
+    version = get_comparison_version()
+    store = _store
+    if store is not None and store.version == version:
+        return store
+
+    with _store_lock:
+        if _store is not None and _store.version == version:
+            return _store
+        queryset = InsuranceProduct.objects.filter(is_active=True, company__is_active=True).order_by('id')
+        _store = ProductValueStore.from_queryset(queryset, version=version)
+        logger.info(f"📊 产品价值列式存储已重建: {len(_store)} 个产品 × {_store.max_year} 年, v{version}")
+        return _store
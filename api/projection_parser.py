@@ -0,0 +1,368 @@
+"""
+保险公司利益演示投影（md*.json）解析库
+大文件流式解析 projections（安装了 ijson 时逐个投影读取，不把整个文件载入内存），
+只保留选中情景（policyOptions）的列，列值直接转为 NumPy 数组；
+可导出为 npz 列式文件，或 tasks/transform_*.py 使用的行式 JSON
+
+不依赖 Django，可在管理命令、API视图和独立脚本中使用
+
+md*.json 结构：
+    {
+        "product": {...},
+        "projections": [
+            {"policyOptions": ["Withdrawal"], "columns": [{"Name": "columnYear", "Values": [{"value": 1}, ...]}, ...]},
+            ...
+        ]
+    }
+列名带 Low / High 后缀的是悲观 / 乐观情景，无后缀的是当前假设情景
+"""
+import json
+import numpy as np
+
+try:
+    import ijson
+except ImportError:  # 未安装时退回 json.load（整体载入）
+    ijson = None
+
+# 超过该大小（字节）的文件默认流式解析
+STREAM_THRESHOLD = 8 * 1024 * 1024
+
+SCENARIOS = ('current', 'low', 'high')
+SCENARIO_SUFFIX = {'current': '', 'low': 'Low', 'high': 'High'}
+
+# 行式导出预设：与 tasks/transform_json.py、transform_withdrawal.py、transform_md5_withdrawal.py 的输出一致
+# options: 精确匹配的 policyOptions（顺序无关）；fallback: 找不到时依次尝试的其他组合
+ROW_PRESETS = {
+    'standard': {
+        'options': [],
+        'key': 'standard',
+        'columns': {
+            'policy_year': 'columnYear',
+            'premiums_paid': 'colAccumulateAnnualizedPremium',
+            'guaranteed': 'colGuaranteedCashValue',
+            'non_guaranteed': 'colNonGuaranteedSurrender',
+            'total': 'colTotalSurrender',
+        },
+    },
+    'withdrawal': {
+        'options': ['Withdrawal'],
+        'key': 'withdrawal',
+        'columns': {
+            'policy_year': 'columnYear',
+            'premiums_paid': 'colAccumulateAnnualizedPremium',
+            'withdrawal_amount': 'colCurrentTotalWithdrawalAmount',
+            'accumulated_withdrawal': 'colAccumulatedTotalWithdrawalAmount',
+            'notional_amount': 'colAfterWDNotionalAmount',
+            'guaranteed': 'colGuaranteedCashValue',
+            'non_guaranteed': 'colNonGuaranteedSurrender',
+            'total_surrender': 'colTotalSurrender',
+        },
+    },
+    'withdrawal_realization': {
+        'options': ['Withdrawal', 'Realization'],
+        'fallback': [['Realization']],
+        'key': 'withdrawal_realization',
+        'columns': {
+            'policy_year': 'columnYear',
+            'premiums_paid': 'colAccumulateAnnualizedPremium',
+            'non_guaranteed_withdrawal': 'colNonGuaranteedWithdraw',
+            'accumulated_ng_withdrawal': 'colAccumulatedNonGuaranteedWithdrawal',
+            'guaranteed': 'colGuaranteedCashValue',
+            'non_guaranteed_bc': 'colNonGuaranteedSurrender',
+            'total': 'colTotalSurrender',
+        },
+    },
+}
+
+
+class Projection:
+    """
+    单个情景投影
+
+    属性:
+        options: policyOptions（元组，保持原顺序）
+        columns: {列名: float64 数组}，null 为 NaN
+    """
+
+    def __init__(self, options, columns):
+        self.options = tuple(options)
+        self.columns = columns
+
+    def __repr__(self):
+        return f'<Projection {list(self.options)} {len(self.columns)} columns>'
+
+    @property
+    def has_data(self):
+        return bool(self.columns)
+
+    @property
+    def years(self):
+        """保单年度数组（int64），无 columnYear 时返回空数组"""
+        year = self.columns.get('columnYear')
+        if year is None:
+            return np.array([], dtype=np.int64)
+        return np.nan_to_num(year).astype(np.int64)
+
+    def matches(self, options):
+        """policyOptions 是否与给定组合完全一致（顺序无关）"""
+        return set(self.options) == set(options)
+
+    def column(self, name, scenario='current'):
+        """
+        取列，scenario 为 low/high 时优先取带后缀的列，
+        没有对应后缀列（如保证现金价值）时退回无后缀的列；列不存在返回 None
+        """
+        suffix = SCENARIO_SUFFIX[scenario]
+        if suffix and name + suffix in self.columns:
+            return self.columns[name + suffix]
+        return self.columns.get(name)
+
+    def select(self, mapping, scenario='current'):
+        """按 {输出字段: 列名} 映射取出多列，缺失的列不返回"""
+        result = {}
+        for field, name in mapping.items():
+            values = self.column(name, scenario)
+            if values is not None:
+                result[field] = values
+        return result
+
+    def to_rows(self, mapping, scenario='current', missing=0):
+        """
+        导出为行式列表 [{字段: 值}, ...]，整数值输出为 int，NaN 输出为 None
+
+        Args:
+            missing: 列不存在时的填充值
+        """
+        year_count = len(self.columns.get('columnYear', ()))
+        fields = list(mapping.keys())
+        arrays = [self.column(mapping[field], scenario) for field in fields]
+        converted = [
+            _to_json_values(values) if values is not None else [missing] * year_count
+            for values in arrays
+        ]
+        return [dict(zip(fields, row)) for row in zip(*converted)] if fields else []
+
+
+class ProjectionSet:
+    """一个 md*.json 文件解析后的结果"""
+
+    def __init__(self, product, projections):
+        self.product = product or {}
+        self.projections = projections
+
+    def __iter__(self):
+        return iter(self.projections)
+
+    def __len__(self):
+        return len(self.projections)
+
+    def find(self, options, fallback=None, require_data=True):
+        """
+        按 policyOptions 精确匹配情景投影（顺序无关），fallback 为依次尝试的其他组合
+
+        Returns:
+            Projection 或 None
+        """
+        for candidate in [options] + list(fallback or []):
+            for projection in self.projections:
+                if projection.matches(candidate) and (projection.has_data or not require_data):
+                    return projection
+        return None
+
+    def containing(self, option, require_data=True):
+        """policyOptions 中包含指定选项的所有投影，例如 containing('Withdrawal')"""
+        return [
+            p for p in self.projections
+            if option in p.options and (p.has_data or not require_data)
+        ]
+
+    def to_rows(self, preset='standard', scenario='current'):
+        """
+        按预设导出行式 JSON（与 tasks/transform_*.py 的输出格式一致）
+
+        Raises:
+            ValueError: 找不到预设对应的投影
+        """
+        config = ROW_PRESETS[preset]
+        projection = self.find(config['options'], fallback=config.get('fallback'))
+        if projection is None:
+            raise ValueError(f"未找到 policyOptions 为 {config['options']} 的投影")
+        return {config['key']: projection.to_rows(config['columns'], scenario=scenario)}
+
+    def save_npz(self, path, compressed=True):
+        """
+        保存为 npz 列式文件
+
+        每个有数据的投影的每列保存为 "p{序号}.{列名}" 数组，
+        元数据（产品信息、各投影的 policyOptions 和列名）保存在 "__meta__"（JSON字符串）
+        """
+        arrays = {}
+        meta = {'product': self.product, 'projections': []}
+        for index, projection in enumerate(self.projections):
+            meta['projections'].append({
+                'index': index,
+                'options': list(projection.options),
+                'columns': list(projection.columns.keys()),
+            })
+            for name, values in projection.columns.items():
+                arrays[f'p{index}.{name}'] = values
+        arrays['__meta__'] = np.array(json.dumps(meta, ensure_ascii=False))
+        save = np.savez_compressed if compressed else np.savez
+        save(path, **arrays)
+
+    @classmethod
+    def load_npz(cls, path):
+        """读取 save_npz 保存的文件"""
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['__meta__']))
+            projections = [
+                Projection(p['options'], {name: data[f"p{p['index']}.{name}"] for name in p['columns']})
+                for p in meta['projections']
+            ]
+        return cls(meta.get('product'), projections)
+
+
+def _to_float(value):
+    if value is None or isinstance(value, bool):
+        return np.nan
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(str(value).replace(',', ''))
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _to_json_values(values):
+    """float64 数组转 JSON 值列表：整数输出 int，NaN 输出 None"""
+    integral = np.isfinite(values) & (values == np.round(values))
+    return [
+        int(v) if is_int else (None if np.isnan(v) else float(v))
+        for v, is_int in zip(values.tolist(), integral.tolist())
+    ]
+
+
+def _option_filter(options):
+    """把 options 参数规范为 集合列表 或 None（不过滤）"""
+    if options is None:
+        return None
+    return [frozenset(o) for o in options]
+
+
+def _wanted(projection_options, option_sets):
+    return option_sets is None or frozenset(projection_options) in option_sets
+
+
+def _column_to_array(values):
+    """单列 Values 转为 float64 数组（null / 缺少 value 的单元格为 NaN）"""
+    cells = [v.get('value') if isinstance(v, dict) else v for v in values or ()]
+    try:
+        # 常见情况：全是数字或 null，由 NumPy 一次性转换（None 转为 NaN）
+        return np.array(cells, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array([_to_float(v) for v in cells], dtype=np.float64)
+
+
+def _build_projection(proj_options, column_list, wanted_columns):
+    columns = {}
+    for col in column_list or ():
+        name = col.get('Name')
+        if name is None or (wanted_columns is not None and name not in wanted_columns):
+            continue
+        columns[name] = _column_to_array(col.get('Values'))
+    return Projection(proj_options, columns)
+
+
+def parse_projections_data(md_data, options=None, columns=None):
+    """
+    从已解析的 dict（如API响应）构建 ProjectionSet
+
+    Args:
+        options: 只保留这些 policyOptions 组合的投影，例如 [[], ['Withdrawal']]；None 为全部
+        columns: 只保留这些列名（含 Low/High 后缀的列需单独列出）；None 为全部
+    """
+    option_sets = _option_filter(options)
+    wanted_columns = set(columns) if columns is not None else None
+    projections = [
+        _build_projection(proj.get('policyOptions') or [], proj.get('columns'), wanted_columns)
+        for proj in md_data.get('projections', [])
+        if _wanted(proj.get('policyOptions') or [], option_sets)
+    ]
+    return ProjectionSet(md_data.get('product'), projections)
+
+
+def _read_product(fp):
+    """读取文件开头的 product 对象，读完即停止（不扫描后面的 projections）"""
+    from ijson.common import ObjectBuilder
+
+    builder = None
+    for prefix, event, value in ijson.parse(fp, use_float=True):
+        if prefix == 'product' or prefix.startswith('product.'):
+            if builder is None:
+                builder = ObjectBuilder()
+            builder.event(event, value)
+            if prefix == 'product' and event in ('end_map', 'end_array'):
+                return builder.value
+        elif prefix == 'projections':
+            break  # product 在 projections 之后（或不存在），不为它扫描整个文件
+    return {}
+
+
+def _stream_projections(fp, option_sets, wanted_columns):
+    """
+    用 ijson 逐个投影解析：任一时刻内存中只有一个投影的原始数据，
+    未选中的投影解析后立即丢弃，选中的投影只保留所需列的 NumPy 数组
+    """
+    product = {}
+    if fp.seekable():
+        start = fp.tell()
+        product = _read_product(fp)
+        fp.seek(start)
+
+    projections = []
+    for proj in ijson.items(fp, 'projections.item', use_float=True):
+        proj_options = proj.get('policyOptions') or []
+        if _wanted(proj_options, option_sets):
+            projections.append(_build_projection(proj_options, proj.get('columns'), wanted_columns))
+    return ProjectionSet(product, projections)
+
+
+def _file_size(fp):
+    """可定位的文件对象返回剩余字节数，否则返回 None"""
+    try:
+        if not fp.seekable():
+            return None
+        start = fp.tell()
+        fp.seek(0, 2)
+        size = fp.tell() - start
+        fp.seek(start)
+        return size
+    except (AttributeError, OSError):
+        return None
+
+
+def parse_projections_file(path_or_file, options=None, columns=None, stream=None):
+    """
+    解析 md*.json 文件
+
+    Args:
+        path_or_file: 文件路径或二进制文件对象（如上传的文件）
+        options: 只保留这些 policyOptions 组合的投影，例如 [[], ['Withdrawal']]；None 为全部
+        columns: 只保留这些列名；None 为全部
+        stream: 是否逐个投影流式解析；None 时文件大于 STREAM_THRESHOLD 且安装了 ijson 才流式解析
+                （小文件 json.load 更快，大文件流式解析只需约一个投影的内存）
+
+    Returns:
+        ProjectionSet
+    """
+    if isinstance(path_or_file, (str, bytes)) or hasattr(path_or_file, '__fspath__'):
+        with open(path_or_file, 'rb') as fp:
+            return parse_projections_file(fp, options=options, columns=columns, stream=stream)
+
+    if stream is None:
+        size = _file_size(path_or_file)
+        stream = size is None or size > STREAM_THRESHOLD
+    if stream and ijson is not None:
+        wanted_columns = set(columns) if columns is not None else None
+        return _stream_projections(path_or_file, _option_filter(options), wanted_columns)
+    return parse_projections_data(json.load(path_or_file), options=options, columns=columns)
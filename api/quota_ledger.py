@@ -0,0 +1,166 @@
+"""
+用户额度流水
+所有 UserQuota.available_quota 变化都用单条条件 UPDATE 完成
+（扣减时 WHERE available_quota >= n），不在 Python 中读-改-写，
+同一用户的并发生成不会丢失更新或超额扣减；每次变化追加一条 QuotaLedgerEntry
+
+异步任务使用预留：提交时扣减并创建 QuotaReservation，完成后结算，
+失败时退还，超时未结算的预留由定时任务 expire_reservations 退还
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def get_reservation_ttl():
+    """预留的默认有效期（秒），应大于 Celery 任务的最长运行时间"""
+    return getattr(settings, 'QUOTA_RESERVATION_TTL', 35 * 60)
+
+
+def _apply(user_id, delta, entry_type, source='', reservation=None, purchased=0):
+    """
+    原子更新可用次数并记入流水（扣减时额度不足返回 False）
+
+    UserQuota 行不存在时按默认值创建后重试一次
+    """
+    from .models import UserQuota, QuotaLedgerEntry
+
+    for attempt in range(2):
+        with transaction.atomic():
+            queryset = UserQuota.objects.filter(user_id=user_id)
+            if delta < 0:
+                queryset = queryset.filter(available_quota__gte=-delta)
+            updates = {
+                'available_quota': F('available_quota') + delta,
+                'updated_at': timezone.now(),
+            }
+            if purchased:
+                updates['total_purchased'] = F('total_purchased') + purchased
+            if queryset.update(**updates):
+                QuotaLedgerEntry.objects.create(
+                    user_id=user_id,
+                    entry_type=entry_type,
+                    delta=delta,
+                    reservation=reservation,
+                    source=source[:100]
+                )
+                return True
+        if attempt == 0:
+            _, created = UserQuota.objects.get_or_create(user_id=user_id)
+            if not created:
+                return False
+    return False
+
+
+def grant(user_id, amount, source='', purchased=True):
+    """增加额度（购买或赠送），purchased 为 True 时同时累计购买次数"""
+    return _apply(user_id, amount, 'grant', source=source, purchased=amount if purchased else 0)
+
+
+def consume(user_id, amount=1, source=''):
+    """直接消耗额度（同步生成），额度不足返回 False"""
+    return _apply(user_id, -amount, 'consume', source=source)
+
+
+def adjust_to(user_id, value, source='admin'):
+    """管理员把可用次数设为指定值（锁定单行，记录差额）"""
+    from .models import UserQuota, QuotaLedgerEntry
+
+    with transaction.atomic():
+        quota, _ = UserQuota.objects.select_for_update().get_or_create(user_id=user_id)
+        delta = value - quota.available_quota
+        if delta == 0:
+            return 0
+        UserQuota.objects.filter(pk=quota.pk).update(available_quota=value, updated_at=timezone.now())
+        QuotaLedgerEntry.objects.create(user_id=user_id, entry_type='adjust', delta=delta, source=source[:100])
+    return delta
+
+
+def reserve(user_id, amount=1, source='', ttl=None):
+    """
+    预留额度（扣减可用次数），用于提交异步任务
+
+    Returns:
+        QuotaReservation 或 None（额度不足）
+    """
+    from .models import QuotaReservation
+
+    if ttl is None:
+        ttl = get_reservation_ttl()
+    with transaction.atomic():
+        reservation = QuotaReservation.objects.create(
+            user_id=user_id,
+            amount=amount,
+            original_amount=amount,
+            source=source[:100],
+            expires_at=timezone.now() + timedelta(seconds=ttl)
+        )
+        if not _apply(user_id, -amount, 'reserve', source=source, reservation=reservation):
+            transaction.set_rollback(True)
+            return None
+    return reservation
+
+
+def commit(reservation_id):
+    """结算预留（剩余预留次数记为已消耗），预留已退还或过期时返回 False"""
+    from .models import QuotaReservation
+
+    committed = QuotaReservation.objects.filter(id=reservation_id, status='held').update(
+        status='committed', settled_at=timezone.now()
+    )
+    if not committed:
+        logger.warning(f"⚠️ 额度预留 {reservation_id} 已不是预留状态，无法结算")
+    return bool(committed)
+
+
+def release(reservation_id, amount=None, entry_type='release'):
+    """
+    退还预留的额度
+
+    Args:
+        amount: 退还次数，默认退还全部剩余预留
+        entry_type: 'release'（失败/取消）或 'expire'（过期）
+
+    Returns:
+        int: 实际退还的次数（预留已结算或已退还时为 0）
+    """
+    from .models import QuotaReservation
+
+    with transaction.atomic():
+        reservation = QuotaReservation.objects.select_for_update().filter(id=reservation_id, status='held').first()
+        if reservation is None:
+            return 0
+        refund = reservation.amount if amount is None else min(amount, reservation.amount)
+        if refund <= 0:
+            return 0
+        reservation.amount -= refund
+        if reservation.amount == 0:
+            reservation.status = 'expired' if entry_type == 'expire' else 'released'
+            reservation.settled_at = timezone.now()
+        reservation.save(update_fields=['amount', 'status', 'settled_at'])
+        _apply(reservation.user_id, refund, entry_type, source=reservation.source, reservation=reservation)
+    return refund
+
+
+def expire_reservations():
+    """
+    退还所有已过期但仍在预留中的额度（由 celery beat 定时调用）
+
+    Returns:
+        list[int]: 已过期的预留ID
+    """
+    from .models import QuotaReservation
+
+    expired_ids = list(QuotaReservation.objects.filter(
+        status='held', expires_at__lt=timezone.now()
+    ).values_list('id', flat=True)[:1000])
+
+    expired = [reservation_id for reservation_id in expired_ids if release(reservation_id, entry_type='expire')]
+    if expired:
+        logger.info(f"⏰ 已退还 {len(expired)} 个过期的额度预留")
+    return expired
@@ -0,0 +1,78 @@
+"""
+模型信号处理
+产品/公司/请求配置变更（Admin保存、脚本导入）后使派生的缓存失效，
+Gemini调用记录写入后累加调用次数汇总，素材保存后排队生成多尺寸版本，素材删除后释放图片文件引用，个人语音删除后清除语音列表缓存
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import InsuranceCompany, InsuranceProduct, InsuranceCompanyRequest, GeminiUsage, MediaLibrary, PersonalVoice
+from .comparison_service import invalidate_comparison_snapshots
+from .insurer_request_service import invalidate_compiled_request_configs
+from .usage_rollups import record_usage, remove_usage
+from .utils.image_storage import queue_media_file_releases, apply_media_file_releases
+from .media_similarity import invalidate_user_index
+from .personal_voices import invalidate_voice_list
+
+
+@receiver(post_save, sender=InsuranceProduct)
+@receiver(post_delete, sender=InsuranceProduct)
+@receiver(post_save, sender=InsuranceCompany)
+@receiver(post_delete, sender=InsuranceCompany)
+def on_insurance_product_changed(sender, **kwargs):
+    """产品或公司变更后，事务提交时递增标准对比快照版本"""
+    transaction.on_commit(invalidate_comparison_snapshots)
+
+
+@receiver(post_save, sender=InsuranceCompanyRequest)
+@receiver(post_delete, sender=InsuranceCompanyRequest)
+def on_insurance_company_request_changed(sender, instance, **kwargs):
+    """请求配置变更后清除本进程的编译缓存（其他进程通过配置字段的摘要判断过期）"""
+    transaction.on_commit(lambda: invalidate_compiled_request_configs(request_id=instance.id))
+
+
+@receiver(post_save, sender=InsuranceCompany)
+@receiver(post_delete, sender=InsuranceCompany)
+def on_insurance_company_auth_changed(sender, instance, **kwargs):
+    """保险公司的 bearer_token / cookie 变更后清除该公司所有请求的编译缓存"""
+    transaction.on_commit(lambda: invalidate_compiled_request_configs(company_id=instance.id))
+
+
+@receiver(post_save, sender=GeminiUsage)
+def on_gemini_usage_created(sender, instance, created, **kwargs):
+    """新的调用记录在事务提交后计入小时桶和累计行"""
+    if created:
+        transaction.on_commit(lambda: record_usage(instance))
+
+
+@receiver(post_delete, sender=GeminiUsage)
+def on_gemini_usage_deleted(sender, instance, **kwargs):
+    """调用记录删除（Admin、用户级联删除）后在事务提交时从小时桶（或天桶）和累计行中扣减"""
+    transaction.on_commit(lambda: remove_usage(instance))
+
+
+@receiver(post_save, sender=MediaLibrary)
+def on_media_created(sender, instance, created, **kwargs):
+    """新素材在事务提交后由 Celery 生成缩略图和 WebP 版本"""
+    if created and instance.local_path:
+        from .tasks import generate_media_variants_task
+        transaction.on_commit(lambda: generate_media_variants_task.delay(instance.id))
+
+
+@receiver(post_delete, sender=MediaLibrary)
+def on_media_deleted(sender, instance, **kwargs):
+    """素材删除（接口、Admin、用户级联删除）后释放内容文件的引用（引用归零时删除文件），并使相似图片索引失效"""
+    if instance.media_file_id:
+        # 与删除素材在同一事务中写入待释放记录，避免与引用数修正重复计算
+        batch = queue_media_file_releases({instance.media_file_id: 1})
+        transaction.on_commit(lambda: apply_media_file_releases(batch=batch))
+    if instance.phash is not None:
+        user_id = instance.user_id
+        transaction.on_commit(lambda: invalidate_user_index(user_id))
+
+
+@receiver(post_delete, sender=PersonalVoice)
+def on_personal_voice_deleted(sender, instance, **kwargs):
+    """个人语音删除（接口、Admin、用户级联删除）后清除所属用户（或共用）的语音列表缓存"""
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_voice_list(user_id))
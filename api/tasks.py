@@ -808,14 +808,11 @@ def extract_tablesummary_task(self, document_id):
 
         # 更新会员使用统计
         if doc.user:
+            from django.db.models import F
             from .models import Membership
-            try:
-                membership = Membership.objects.get(user=doc.user)
-                membership.documents_created += 1
-                membership.save()
-                logger.info(f"📊 会员已创建计划书数: {membership.documents_created}")
-            except Membership.DoesNotExist:
-                pass
+            # 原子递增，并发的文档任务不会丢失计数
+            if Membership.objects.filter(user_id=doc.user_id).update(documents_created=F('documents_created') + 1):
+                logger.info("📊 会员已创建计划书数 +1")
 
         logger.info("✅ 步骤3完成: 表格概要提取成功")
         logger.info(f"   - 概要长度: {len(content)} 字符")
@@ -860,3 +857,113 @@ def process_document_pipeline(document_id):
     extract_tablecontent_task.apply_async(args=[document_id])
 
     return {'status': 'pipeline_started', 'document_id': document_id}
+
+
+@shared_task(bind=True, max_retries=1, default_retry_delay=300)
+def refresh_product_tables_task(self, product_ids=None, company_codes=None):
+    """
+    定时任务：用保险公司API刷新产品退保价值表（由 celery beat 按 CELERY_BEAT_SCHEDULE 触发）
+    只更新有变化的产品，更新后重建标准对比快照
+
+    Args:
+        product_ids: 只刷新这些产品（可选）
+        company_codes: 只刷新这些公司的产品（可选）
+    """
+    from .product_refresh import refresh_product_tables
+
+    logger.info("🔄 开始刷新产品退保价值表")
+    try:
+        summary = refresh_product_tables(product_ids=product_ids, company_codes=company_codes)
+    except Exception as e:
+        logger.error(f"❌ 刷新产品退保价值表失败: {str(e)}")
+        raise self.retry(exc=e)
+
+    logger.info(f"✅ 产品退保价值表刷新完成: 更新 {summary['changed']} 个，失败 {summary['failed']} 个")
+    return {'success': True, **summary}
+
+
+@shared_task(bind=True)
+def run_image_generation_job_task(self, job_id):
+    """
+    执行图片生成任务（IP形象 / 文案配图）
+    不自动重试：Gemini 调用失败时任务标记为失败并退还预留额度，由用户重新提交
+
+    Args:
+        job_id: ImageGenerationJob的ID
+    """
+    from .image_generation_jobs import run_image_generation_job
+
+    job = run_image_generation_job(job_id)
+    if job is None:
+        return {'success': False, 'error': 'job not pending'}
+    return {'success': job.status == 'succeeded', 'job_id': job_id}
+
+
+@shared_task
+def expire_quota_reservations_task():
+    """
+    定时任务：退还过期未结算的额度预留，并把对应的图片生成任务标记为失败
+    （worker 崩溃或任务丢失时，预留的额度不会一直被占用）
+    """
+    from .quota_ledger import expire_reservations
+    from .image_generation_jobs import fail_expired_jobs
+
+    expired = expire_reservations()
+    failed_jobs = fail_expired_jobs() if expired else 0
+    return {'success': True, 'expired_reservations': len(expired), 'failed_jobs': failed_jobs}
+
+
+@shared_task
+def compact_gemini_usage_rollups_task():
+    """
+    定时任务：把超过保留期的Gemini调用小时桶合并为天桶
+    """
+    from .usage_rollups import compact_rollups
+
+    compacted = compact_rollups()
+    return {'success': True, 'compacted': compacted}
+
+
+@shared_task(bind=True, max_retries=2, default_retry_delay=30)
+def generate_media_variants_task(self, media_id, force=False):
+    """
+    异步任务：生成素材的缩略图和 WebP 版本
+    """
+    from .media_variants import generate_media_variants
+
+    try:
+        generated = generate_media_variants(media_id, force=force)
+    except FileNotFoundError:
+        logger.warning(f"⚠️ 素材 {media_id} 原图不存在，跳过生成多尺寸版本")
+        return {'success': False, 'media_id': media_id, 'error': 'file not found'}
+    except Exception as e:
+        logger.error(f"❌ 素材 {media_id} 生成多尺寸版本失败: {str(e)}")
+        raise self.retry(exc=e)
+    return {'success': True, 'media_id': media_id, 'generated': generated}
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def remove_media_files_task(self, batch, legacy_paths):
+    """
+    异步任务：批量删除素材后释放内容文件引用、删除文件
+    （已执行的释放记录会被删除，重试时只处理剩余的）
+    """
+    from .media_cleanup import remove_media_files
+
+    try:
+        result = remove_media_files(batch, legacy_paths)
+    except Exception as e:
+        logger.error(f"❌ 删除素材文件失败: {str(e)}")
+        raise self.retry(exc=e)
+    return {'success': True, **result}
+
+
+@shared_task
+def reconcile_media_files_task():
+    """
+    定时任务：修正素材文件引用数，回收 generated_images / plan_documents / tts 中的孤儿文件
+    """
+    from .media_cleanup import reconcile_media_files
+
+    summary = reconcile_media_files()
+    return {'success': True, **summary}
@@ -0,0 +1,162 @@
+"""
+TTS 合成结果缓存
+按合成参数（文本、语音、语速、音调）的哈希命名输出文件，相同参数再次合成时直接返回已有的音频和字幕；
+命中时更新文件修改时间，media/tts 总大小超过预算时按修改时间淘汰最久未使用的条目（LRU）
+"""
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# 缓存键版本，合成或字幕格式变化时递增使旧缓存失效
+CACHE_VERSION = 3
+
+# media/tts 已用空间计数（近似值，超过预算时扫描目录重新统计）
+USAGE_CACHE_KEY = 'tts_cache:bytes'
+
+# 淘汰到预算的该比例以下，避免每次写入都触发淘汰
+EVICT_TARGET_RATIO = 0.9
+
+
+def get_tts_dir():
+    return os.path.join(settings.BASE_DIR, 'media', 'tts')
+
+
+def get_max_bytes():
+    return getattr(settings, 'TTS_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024)
+
+
+def cache_key(engine, **params):
+    """合成参数的哈希（参数按键排序后序列化）"""
+    payload = json.dumps({'engine': engine, 'version': CACHE_VERSION, **params}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def entry_filenames(key, extensions):
+    """
+    缓存条目的文件名
+
+    Returns:
+        dict: {扩展名: 'tts_{key}.{扩展名}'}
+    """
+    return {extension: f"tts_{key}.{extension}" for extension in extensions}
+
+
+def write_file(filename, data):
+    """
+    写入 media/tts 下的文件：先写唯一的临时文件再替换，
+    并发写入同一条目时互不干扰，读取方只会看到完整的文件
+
+    Returns:
+        str: 文件绝对路径
+    """
+    tts_dir = get_tts_dir()
+    os.makedirs(tts_dir, exist_ok=True)
+    path = os.path.join(tts_dir, filename)
+    fd, temp_path = tempfile.mkstemp(dir=tts_dir, prefix=f'.{filename}.', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # mkstemp 创建的文件只有属主可读，改为与普通上传文件相同的权限
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except Exception:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return path
+
+
+def lookup(key, extensions):
+    """
+    查找缓存条目（所有文件都存在才算命中），命中时更新修改时间
+
+    Returns:
+        dict 或 None: {扩展名: 文件名}
+    """
+    filenames = entry_filenames(key, extensions)
+    tts_dir = get_tts_dir()
+    paths = [os.path.join(tts_dir, filename) for filename in filenames.values()]
+    try:
+        for path in paths:
+            os.utime(path)
+    except FileNotFoundError:
+        return None
+    return filenames
+
+
+def record_usage(filenames):
+    """写入新条目后累加已用空间，超过预算时淘汰"""
+    tts_dir = get_tts_dir()
+    size = 0
+    for filename in filenames.values():
+        try:
+            size += os.path.getsize(os.path.join(tts_dir, filename))
+        except OSError:
+            pass
+    try:
+        used = cache.incr(USAGE_CACHE_KEY, size)
+    except ValueError:
+        used = None
+    if used is None or used > get_max_bytes():
+        evict_to_budget()
+
+
+def evict_to_budget(max_bytes=None):
+    """
+    按修改时间淘汰 media/tts 中最久未使用的条目（同一前缀的音频和字幕一起删除），
+    直到总大小低于预算的 90%
+
+    Returns:
+        dict: {'used_bytes', 'evicted_entries', 'freed_bytes'}
+    """
+    if max_bytes is None:
+        max_bytes = get_max_bytes()
+    tts_dir = get_tts_dir()
+
+    # 按文件名（去掉扩展名）分组：同一次合成的 mp3/json/srt/vtt 一起淘汰
+    entries = defaultdict(lambda: {'size': 0, 'mtime': 0, 'paths': []})
+    total = 0
+    try:
+        with os.scandir(tts_dir) as iterator:
+            for item in iterator:
+                # 跳过正在写入的临时文件
+                if not item.is_file() or item.name.endswith('.part'):
+                    continue
+                stat = item.stat()
+                entry = entries[os.path.splitext(item.name)[0]]
+                entry['size'] += stat.st_size
+                entry['mtime'] = max(entry['mtime'], stat.st_mtime)
+                entry['paths'].append(item.path)
+                total += stat.st_size
+    except FileNotFoundError:
+        pass
+
+    evicted = freed = 0
+    if total > max_bytes:
+        target = max_bytes * EVICT_TARGET_RATIO
+        for entry in sorted(entries.values(), key=lambda value: value['mtime']):
+            if total <= target:
+                break
+            for path in entry['paths']:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"⚠️ 淘汰TTS缓存文件失败: {path}, {str(e)}")
+            total -= entry['size']
+            freed += entry['size']
+            evicted += 1
+        logger.info(f"🧹 TTS缓存已淘汰 {evicted} 个条目，释放 {freed / (1024 * 1024):.1f} MB")
+
+    cache.set(USAGE_CACHE_KEY, total, timeout=None)
+    return {'used_bytes': total, 'evicted_entries': evicted, 'freed_bytes': freed}
@@ -0,0 +1,171 @@
+"""
+流式语音合成会话
+合成在后台线程中进行，音频块和字幕事件写入进程内的会话对象：
+客户端一边通过音频地址边收边播（audio/mpeg 分块传输），一边通过 SSE 地址接收字幕；
+两个地址都是异步生成器（ASGI 下同步生成器会被读完后才发送），数据到达即输出；
+会话在完成后保留一段时间，供晚到的连接（例如播放器重新请求）读取完整数据
+"""
+import json
+import time
+import uuid
+import logging
+import threading
+from asgiref.sync import sync_to_async
+
+logger = logging.getLogger(__name__)
+
+# 会话保留时长（秒）
+STREAM_TTL = 10 * 60
+
+# 等待新数据的最长时间（秒），超时视为合成卡住
+WAIT_TIMEOUT = 60
+
+
+class SynthesisStream:
+    """一次流式合成：音频块、字幕事件和最终结果"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.created_at = time.time()
+        self.audio_chunks = []
+        self.cues = []
+        self.done = False
+        self.error = None
+        self.result = {}
+        self.condition = threading.Condition()
+
+    def add_audio(self, data):
+        if not data:
+            return
+        with self.condition:
+            self.audio_chunks.append(bytes(data))
+            self.condition.notify_all()
+
+    def add_cues(self, cues):
+        if not cues:
+            return
+        with self.condition:
+            self.cues.extend(cues)
+            self.condition.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self.condition:
+            self.done = True
+            self.result = result or {}
+            self.error = error
+            self.condition.notify_all()
+
+    def _read_audio(self, index):
+        """
+        等待第 index 块之后的音频（阻塞，在线程池中调用）
+
+        Returns:
+            tuple: (新的音频块列表, 是否已结束)，等待超时返回 None
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: len(self.audio_chunks) > index or self.done, timeout=WAIT_TIMEOUT):
+                return None
+            return self.audio_chunks[index:], self.done
+
+    def _read_cues(self, index):
+        """等待第 index 条之后的字幕，返回值同 _read_audio"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: len(self.cues) > index or self.done, timeout=WAIT_TIMEOUT):
+                return None
+            return self.cues[index:], self.done
+
+    async def iter_audio(self):
+        """
+        按顺序异步产出音频块，直到合成结束；
+        等待在线程池中进行（不占用 Django 的同步线程），收到一块就立即输出
+        """
+        index = 0
+        while True:
+            read = await sync_to_async(self._read_audio, thread_sensitive=False)(index)
+            if read is None:
+                logger.warning(f"⚠️ 流式合成 {self.id} 等待音频超时")
+                return
+            chunks, finished = read
+            for chunk in chunks:
+                yield chunk
+            index += len(chunks)
+            if finished:
+                return
+
+    async def iter_events(self):
+        """
+        按顺序异步产出 (事件类型, 数据)：每条字幕一个 cue 事件，最后是 done 或 error
+        """
+        index = 0
+        while True:
+            read = await sync_to_async(self._read_cues, thread_sensitive=False)(index)
+            if read is None:
+                yield 'error', {'message': '语音合成超时'}
+                return
+            cues, finished = read
+            for cue in cues:
+                yield 'cue', cue
+            index += len(cues)
+            if finished:
+                if self.error:
+                    yield 'error', {'message': self.error}
+                else:
+                    yield 'done', self.result
+                return
+
+
+_streams = {}
+_streams_lock = threading.Lock()
+
+
+def _purge_expired():
+    now = time.time()
+    with _streams_lock:
+        for stream_id in [key for key, stream in _streams.items() if now - stream.created_at > STREAM_TTL]:
+            del _streams[stream_id]
+
+
+def _register(stream):
+    _purge_expired()
+    with _streams_lock:
+        _streams[stream.id] = stream
+    return stream
+
+
+def create_stream(produce, *args):
+    """
+    创建会话并在后台线程中运行 produce(stream, *args)；
+    produce 返回最终结果 dict（作为 done 事件的数据），抛出异常时会话以 error 结束
+
+    Returns:
+        SynthesisStream
+    """
+    stream = _register(SynthesisStream())
+
+    def run():
+        try:
+            stream.finish(result=produce(stream, *args))
+        except Exception as e:
+            logger.error(f"❌ 流式合成 {stream.id} 失败: {str(e)}", exc_info=True)
+            stream.finish(error=str(e))
+
+    threading.Thread(target=run, name=f'tts-stream-{stream.id[:8]}', daemon=True).start()
+    return stream
+
+
+def create_completed_stream(audio_data, cues, result):
+    """已有合成结果（缓存命中）时直接创建已完成的会话，客户端处理方式不变"""
+    stream = _register(SynthesisStream())
+    stream.add_audio(audio_data)
+    stream.add_cues(cues)
+    stream.finish(result=result)
+    return stream
+
+
+def get_stream(stream_id):
+    with _streams_lock:
+        return _streams.get(stream_id)
+
+
+def encode_sse(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
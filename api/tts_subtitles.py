@@ -0,0 +1,215 @@
+"""
+TTS 字幕
+合成时只保存一份紧凑的词边界数据（tts_<哈希>.cues），
+JSON / SRT / WebVTT 在请求时渲染并缓存；可选按句子合并字幕条目
+"""
+import os
+import re
+import json
+import logging
+from django.core.cache import cache
+from . import tts_cache
+
+logger = logging.getLogger(__name__)
+
+CUES_EXTENSION = 'cues'
+
+# 紧凑格式版本；每条字幕为 [audio_offset, duration, text_offset, word_length, boundary_type, text]
+CUES_FORMAT_VERSION = 1
+
+SUBTITLE_FORMATS = {
+    'json': 'application/json; charset=utf-8',
+    'srt': 'application/x-subrip; charset=utf-8',
+    'vtt': 'text/vtt; charset=utf-8',
+}
+
+MERGE_MODES = ('word', 'sentence')
+
+# 渲染结果缓存（内容由合成参数的哈希决定，不会变化）
+RENDER_CACHE_KEY = 'tts_subtitle:{name}:{fmt}:{merge}'
+RENDER_CACHE_TIMEOUT = 24 * 60 * 60
+
+# 按句子合并时的句子结尾
+SENTENCE_END_CHARS = set('。！？!?；;….\n')
+
+# 按句子合并时单条字幕的最多字符数（超过后在逗号等处断开）
+SENTENCE_MAX_CHARS = 40
+CLAUSE_END_CHARS = set('，,、：:')
+
+NAME_PATTERN = re.compile(r'^tts_[0-9a-f]{32}$')
+
+
+def pack_cues(text, voice_id, rate, pitch, subtitle_data):
+    """词边界数据序列化为紧凑 JSON"""
+    return json.dumps({
+        'v': CUES_FORMAT_VERSION,
+        'text': text,
+        'voice': voice_id,
+        'rate': rate,
+        'pitch': pitch,
+        'cues': [[
+            round(item['audio_offset'], 1),
+            round(item['duration'], 1),
+            item['text_offset'],
+            item['word_length'],
+            item['boundary_type'],
+            item['text'],
+        ] for item in subtitle_data],
+    }, ensure_ascii=False, separators=(',', ':'))
+
+
+def unpack_cues(payload):
+    """
+    解析紧凑 JSON
+
+    Returns:
+        tuple: (合成参数 dict, 字幕列表)
+    """
+    data = json.loads(payload)
+    subtitle_data = [{
+        'text': text,
+        'audio_offset': audio_offset,
+        'duration': duration,
+        'word_length': word_length,
+        'text_offset': text_offset,
+        'boundary_type': boundary_type,
+    } for audio_offset, duration, text_offset, word_length, boundary_type, text in data['cues']]
+    params = {key: data[key] for key in ('text', 'voice', 'rate', 'pitch')}
+    return params, subtitle_data
+
+
+def read_cues(filename):
+    with open(os.path.join(tts_cache.get_tts_dir(), filename), 'r', encoding='utf-8') as f:
+        return unpack_cues(f.read())
+
+
+def merge_sentences(text, subtitle_data):
+    """
+    把词级字幕合并为句子级：遇到句子结尾断开，过长时在逗号等处断开；
+    text_offset 有效时用原文切片作为字幕文本（保留英文单词间的空格）
+    """
+    merged = []
+    group = []
+
+    def flush():
+        if not group:
+            return
+        first, last = group[0], group[-1]
+        start = first['text_offset']
+        end = last['text_offset'] + last['word_length']
+        if 0 <= start < end <= len(text):
+            cue_text = text[start:end].strip()
+        else:
+            cue_text = ''.join(item['text'] for item in group)
+        merged.append({
+            'text': cue_text,
+            'audio_offset': first['audio_offset'],
+            'duration': last['audio_offset'] + last['duration'] - first['audio_offset'],
+            'word_length': max(end - start, 0),
+            'text_offset': start,
+            'boundary_type': 'Sentence'
+        })
+        group.clear()
+
+    length = 0
+    for item in subtitle_data:
+        group.append(item)
+        length += len(item['text'])
+        tail = item['text'][-1:] if item['text'] else ''
+        if tail in SENTENCE_END_CHARS or (length >= SENTENCE_MAX_CHARS and tail in CLAUSE_END_CHARS):
+            flush()
+            length = 0
+    flush()
+    return merged
+
+
+def format_srt_time(milliseconds):
+    """格式化时间为SRT格式: HH:MM:SS,mmm"""
+    hours = int(milliseconds // 3600000)
+    minutes = int((milliseconds % 3600000) // 60000)
+    seconds = int((milliseconds % 60000) // 1000)
+    millis = int(milliseconds % 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{millis:03d}"
+
+
+def format_webvtt_time(milliseconds):
+    """格式化时间为WebVTT格式: HH:MM:SS.mmm"""
+    hours = int(milliseconds // 3600000)
+    minutes = int((milliseconds % 3600000) // 60000)
+    seconds = int((milliseconds % 60000) // 1000)
+    millis = int(milliseconds % 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{millis:03d}"
+
+
+def render_srt(subtitle_data):
+    """SRT格式字幕"""
+    lines = []
+    for idx, item in enumerate(subtitle_data, 1):
+        start_time = item['audio_offset']
+        end_time = start_time + item.get('duration', 0)
+        lines.append(f"{idx}\n{format_srt_time(start_time)} --> {format_srt_time(end_time)}\n{item['text']}\n")
+    return '\n'.join(lines) + ('\n' if lines else '')
+
+
+def render_webvtt(subtitle_data):
+    """WebVTT格式字幕"""
+    lines = ["WEBVTT\n"]
+    for idx, item in enumerate(subtitle_data, 1):
+        start_time = item['audio_offset']
+        end_time = start_time + item.get('duration', 0)
+        lines.append(f"{idx}\n{format_webvtt_time(start_time)} --> {format_webvtt_time(end_time)}\n{item['text']}\n")
+    return '\n'.join(lines) + '\n'
+
+
+def render_json(params, subtitle_data):
+    """JSON格式字幕（字段与原来保存的字幕文件相同）"""
+    return json.dumps({**params, 'subtitles': subtitle_data}, ensure_ascii=False)
+
+
+def render_subtitles(name, fmt, merge='word'):
+    """
+    渲染合成结果的字幕（结果缓存）；读取时更新文件修改时间，保持 LRU 顺序
+
+    Args:
+        name: 合成结果文件名（不含扩展名，tts_<哈希>）
+        fmt: json / srt / vtt
+        merge: word（词级）或 sentence（句子级）
+
+    Returns:
+        str 或 None: 合成结果不存在时返回 None
+    """
+    filename = f"{name}.{CUES_EXTENSION}"
+    try:
+        os.utime(os.path.join(tts_cache.get_tts_dir(), filename))
+    except FileNotFoundError:
+        return None
+
+    cache_key = RENDER_CACHE_KEY.format(name=name, fmt=fmt, merge=merge)
+    content = cache.get(cache_key)
+    if content is not None:
+        return content
+
+    try:
+        params, subtitle_data = read_cues(filename)
+    except FileNotFoundError:
+        return None
+    if merge == 'sentence':
+        subtitle_data = merge_sentences(params['text'], subtitle_data)
+
+    if fmt == 'srt':
+        content = render_srt(subtitle_data)
+    elif fmt == 'vtt':
+        content = render_webvtt(subtitle_data)
+    else:
+        content = render_json(params, subtitle_data)
+    cache.set(cache_key, content, timeout=RENDER_CACHE_TIMEOUT)
+    return content
+
+
+def subtitle_urls(name):
+    """合成结果的字幕地址"""
+    return {
+        'subtitle_url': f'/api/tts/subtitles/{name}/json/',
+        'srt_url': f'/api/tts/subtitles/{name}/srt/',
+        'vtt_url': f'/api/tts/subtitles/{name}/vtt/',
+    }
@@ -0,0 +1,72 @@
+"""
+TTS 文本切分
+按句子切分待合成的文本（Azure 长文本分段并发合成、CosyVoice 按句缓存共用），
+切分结果按顺序拼接后与原文完全相同
+"""
+import re
+
+# 句子结尾（中文标点、换行，或后面跟空白的英文句号）
+SENTENCE_END = re.compile(r'[。！？!?；;…\n]+|\.(?=\s)')
+
+# 句子过长时的次选切分点
+CLAUSE_END = re.compile(r'[，,、：:]+')
+
+
+def _split_long(sentence, max_chars):
+    """超长句子按逗号等切分为分句，仍然超长的分句按长度硬切"""
+    clauses = []
+    start = 0
+    for match in CLAUSE_END.finditer(sentence):
+        clauses.append(sentence[start:match.end()])
+        start = match.end()
+    clauses.append(sentence[start:])
+
+    pieces = []
+    for clause in clauses:
+        pieces.extend(clause[index:index + max_chars] for index in range(0, len(clause), max_chars))
+    return pieces
+
+
+def split_sentences(text, max_chars):
+    """
+    按句子切分，超过 max_chars 的句子再按逗号等切分
+
+    Returns:
+        list[str]
+    """
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        sentences.append(text[start:match.end()])
+        start = match.end()
+    if start < len(text):
+        sentences.append(text[start:])
+
+    pieces = []
+    for sentence in sentences:
+        pieces.extend(_split_long(sentence, max_chars) if len(sentence) > max_chars else [sentence])
+    return pieces
+
+
+def split_text(text, max_chars):
+    """
+    按句子把文本切分为不超过 max_chars 的段（相邻短句合并为一段）
+
+    Returns:
+        list[(起始偏移, 段文本)]
+    """
+    if len(text) <= max_chars:
+        return [(0, text)]
+
+    chunks = []
+    current = ''
+    offset = 0
+    for piece in split_sentences(text, max_chars):
+        if current and len(current) + len(piece) > max_chars:
+            chunks.append((offset, current))
+            offset += len(current)
+            current = ''
+        current += piece
+    if current:
+        chunks.append((offset, current))
+    return chunks
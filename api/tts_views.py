@@ -3,23 +3,16 @@ Azure Text-to-Speech Views with Word/Character Boundaries
 使用Azure认知服务提供语音合成功能，支持字符级别字幕
 """
 import os
-import uuid
 import json
 import logging
-from django.http import JsonResponse, FileResponse
+from django.http import JsonResponse, FileResponse, StreamingHttpResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-import azure.cognitiveservices.speech as speechsdk
-from dotenv import load_dotenv
-
-load_dotenv()
+from . import tts_cache, tts_streaming, tts_subtitles
+from .azure_tts import AZURE_SPEECH_KEY, AZURE_SPEECH_REGION, SynthesisError, synthesize_text, stream_text
 
 logger = logging.getLogger(__name__)
 
-# Azure配置
-AZURE_SPEECH_KEY = os.getenv('AZURE_SPEECH_KEY')
-AZURE_SPEECH_REGION = os.getenv('AZURE_SPEECH_REGION')
-
 # 语音选项配置
 VOICE_OPTIONS = {
     # 中文语音
@@ -63,6 +56,102 @@ VOICE_OPTIONS = {
     'en-GB-RyanNeural': {'name': 'Ryan (英式男声)', 'language': 'en-GB', 'gender': 'Male'},
 }
 
+# 一次合成输出的文件（音频 + 紧凑格式的词边界数据，字幕格式按需渲染）
+SYNTHESIS_EXTENSIONS = ('mp3', tts_subtitles.CUES_EXTENSION)
+
+
+def _build_synthesis_result(filenames, subtitle_data, cached=False):
+    """合成结果的文件地址（新合成和缓存命中格式相同）"""
+    return {
+        'audio_url': f"/media/tts/{filenames['mp3']}",
+        **tts_subtitles.subtitle_urls(os.path.splitext(filenames['mp3'])[0]),
+        'filename': filenames['mp3'],
+        'subtitle_count': len(subtitle_data),
+        'cached': cached
+    }
+
+
+def _build_synthesis_response(filenames, subtitle_data, cached=False):
+    """合成成功的响应"""
+    return JsonResponse({
+        'status': 'success',
+        'message': '语音合成成功',
+        **_build_synthesis_result(filenames, subtitle_data, cached=cached),
+        'subtitles': subtitle_data  # 直接返回字幕数据
+    })
+
+
+def _parse_synthesis_request(request):
+    """
+    解析并校验合成参数
+
+    Returns:
+        tuple: ({text, voice_id, rate, pitch}, None) 或 (None, 错误响应)
+    """
+    data = json.loads(request.body)
+    params = {
+        'text': data.get('text', '').strip(),
+        'voice_id': data.get('voice', 'zh-CN-XiaoxiaoNeural'),
+        'rate': data.get('rate', '0%'),
+        'pitch': data.get('pitch', '0%'),
+    }
+
+    if not params['text']:
+        return None, JsonResponse({
+            'status': 'error',
+            'message': '文本不能为空'
+        }, status=400)
+
+    if params['voice_id'] not in VOICE_OPTIONS:
+        return None, JsonResponse({
+            'status': 'error',
+            'message': f"不支持的语音: {params['voice_id']}"
+        }, status=400)
+    return params, None
+
+
+def _synthesis_cache_key(text, voice_id, rate, pitch):
+    return tts_cache.cache_key('azure', text=text, voice=voice_id, rate=rate, pitch=pitch)
+
+
+def _load_cached_synthesis(cache_key):
+    """
+    相同参数已合成过时读取已有的结果
+
+    Returns:
+        tuple 或 None: (文件名, 字幕列表)
+    """
+    cached_files = tts_cache.lookup(cache_key, SYNTHESIS_EXTENSIONS)
+    if not cached_files:
+        return None
+    try:
+        _, subtitle_data = tts_subtitles.read_cues(cached_files[tts_subtitles.CUES_EXTENSION])
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"⚠️ 读取语音合成缓存失败，重新合成: {str(e)}")
+        return None
+    logger.info(f"🎯 语音合成缓存命中: {cached_files['mp3']}")
+    return cached_files, subtitle_data
+
+
+def _save_synthesis(cache_key, text, voice_id, rate, pitch, audio_data, subtitle_data):
+    """
+    保存到media目录（按缓存键命名，每个文件先写唯一的临时文件再替换，避免并发请求读到写了一半的文件）
+
+    Returns:
+        dict: {扩展名: 文件名}
+    """
+    filenames = tts_cache.entry_filenames(cache_key, SYNTHESIS_EXTENSIONS)
+
+    # 词边界数据只保存一份紧凑格式，JSON/SRT/VTT 在请求时渲染
+    cues_data = tts_subtitles.pack_cues(text, voice_id, rate, pitch, subtitle_data).encode('utf-8')
+    tts_cache.write_file(filenames[tts_subtitles.CUES_EXTENSION], cues_data)
+
+    # 音频最后写入，缓存查找要求所有文件都存在
+    tts_cache.write_file(filenames['mp3'], audio_data)
+    tts_cache.record_usage(filenames)
+    logger.info(f"语音合成成功: {filenames['mp3']}, 字幕条目数: {len(subtitle_data)}")
+    return filenames
+
 
 @csrf_exempt
 @require_http_methods(["GET"])
@@ -100,26 +189,20 @@ def synthesize_speech(request):
     - voice: 语音ID (可选，默认为zh-CN-XiaoxiaoNeural)
     - rate: 语速 (-50% 到 +50%, 可选，默认为0%)
     - pitch: 音调 (-50% 到 +50%, 可选，默认为0%)
+
+    超过500字的文本按句子分段并发合成，音频拼接、字幕时间按段平移
     """
     try:
-        import json
-        data = json.loads(request.body)
-        text = data.get('text', '').strip()
-        voice_id = data.get('voice', 'zh-CN-XiaoxiaoNeural')
-        rate = data.get('rate', '0%')
-        pitch = data.get('pitch', '0%')
-
-        if not text:
-            return JsonResponse({
-                'status': 'error',
-                'message': '文本不能为空'
-            }, status=400)
+        params, error_response = _parse_synthesis_request(request)
+        if error_response:
+            return error_response
+        text, voice_id, rate, pitch = params['text'], params['voice_id'], params['rate'], params['pitch']
 
-        if voice_id not in VOICE_OPTIONS:
-            return JsonResponse({
-                'status': 'error',
-                'message': f'不支持的语音: {voice_id}'
-            }, status=400)
+        # 相同参数已合成过时直接返回已有的音频和字幕
+        cache_key = _synthesis_cache_key(text, voice_id, rate, pitch)
+        cached = _load_cached_synthesis(cache_key)
+        if cached:
+            return _build_synthesis_response(*cached, cached=True)
 
         # 验证Azure配置
         if not AZURE_SPEECH_KEY or not AZURE_SPEECH_REGION:
@@ -128,123 +211,19 @@ def synthesize_speech(request):
                 'message': 'Azure Speech配置缺失'
             }, status=500)
 
-        # 配置Azure Speech
-        speech_config = speechsdk.SpeechConfig(
-            subscription=AZURE_SPEECH_KEY,
-            region=AZURE_SPEECH_REGION
-        )
-
-        # 设置语音
-        speech_config.speech_synthesis_voice_name = voice_id
-
-        # 生成唯一的文件名
-        audio_filename = f"tts_{uuid.uuid4()}.mp3"
-        audio_path = os.path.join('/tmp', audio_filename)
-
-        # 配置音频输出
-        audio_config = speechsdk.audio.AudioOutputConfig(filename=audio_path)
-
-        # 创建合成器
-        synthesizer = speechsdk.SpeechSynthesizer(
-            speech_config=speech_config,
-            audio_config=audio_config
-        )
-
-        # 用于收集字幕数据
-        subtitle_data = []
-
-        # 注册事件处理器以获取字符边界信息
-        def word_boundary_cb(evt):
-            """处理词边界事件，获取每个字符/词的时间信息"""
-            subtitle_data.append({
-                'text': evt.text,
-                'audio_offset': evt.audio_offset / 10000,  # 转换为毫秒
-                'duration': evt.duration.total_seconds() * 1000 if evt.duration else 0,
-                'word_length': evt.word_length,
-                'text_offset': evt.text_offset,
-                'boundary_type': evt.boundary_type.name
-            })
-
-        # 连接词边界事件
-        synthesizer.synthesis_word_boundary.connect(word_boundary_cb)
-
-        # 构建SSML (Speech Synthesis Markup Language)
-        ssml = f"""
-        <speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xml:lang='zh-CN'>
-            <voice name='{voice_id}'>
-                <prosody rate='{rate}' pitch='{pitch}'>
-                    {text}
-                </prosody>
-            </voice>
-        </speak>
-        """
-
-        # 合成语音
-        result = synthesizer.speak_ssml_async(ssml).get()
-
-        # 检查结果
-        if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-            logger.info(f"语音合成成功: {audio_filename}, 字幕条目数: {len(subtitle_data)}")
-
-            # 保存到media目录
-            media_dir = '/var/www/harry-insurance2/media/tts'
-            os.makedirs(media_dir, exist_ok=True)
-            final_audio_path = os.path.join(media_dir, audio_filename)
-
-            # 移动文件
-            import shutil
-            shutil.move(audio_path, final_audio_path)
-
-            # 生成字幕文件（JSON格式）
-            subtitle_filename = f"tts_{uuid.uuid4().hex[:8]}.json"
-            subtitle_path = os.path.join(media_dir, subtitle_filename)
-
-            with open(subtitle_path, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'text': text,
-                    'voice': voice_id,
-                    'rate': rate,
-                    'pitch': pitch,
-                    'subtitles': subtitle_data
-                }, f, ensure_ascii=False, indent=2)
-
-            # 生成SRT格式字幕（可选）
-            srt_filename = f"tts_{uuid.uuid4().hex[:8]}.srt"
-            srt_path = os.path.join(media_dir, srt_filename)
-            generate_srt(subtitle_data, srt_path)
-
-            # 生成WebVTT格式字幕（可选）
-            vtt_filename = f"tts_{uuid.uuid4().hex[:8]}.vtt"
-            vtt_path = os.path.join(media_dir, vtt_filename)
-            generate_webvtt(subtitle_data, vtt_path)
-
-            return JsonResponse({
-                'status': 'success',
-                'message': '语音合成成功',
-                'audio_url': f'/media/tts/{audio_filename}',
-                'subtitle_url': f'/media/tts/{subtitle_filename}',
-                'srt_url': f'/media/tts/{srt_filename}',
-                'vtt_url': f'/media/tts/{vtt_filename}',
-                'filename': audio_filename,
-                'subtitle_count': len(subtitle_data),
-                'subtitles': subtitle_data  # 直接返回字幕数据
-            })
-        elif result.reason == speechsdk.ResultReason.Canceled:
-            cancellation = result.cancellation_details
-            error_msg = f"语音合成失败: {cancellation.reason}"
-            if cancellation.reason == speechsdk.CancellationReason.Error:
-                error_msg += f" - {cancellation.error_details}"
-            logger.error(error_msg)
-            return JsonResponse({
-                'status': 'error',
-                'message': error_msg
-            }, status=500)
-        else:
+        # 合成语音（长文本分段并发合成）
+        try:
+            audio_data, subtitle_data = synthesize_text(text, voice_id, rate, pitch)
+        except SynthesisError as e:
+            logger.error(str(e))
             return JsonResponse({
                 'status': 'error',
-                'message': '语音合成失败'
+                'message': str(e)
             }, status=500)
 
+        filenames = _save_synthesis(cache_key, text, voice_id, rate, pitch, audio_data, subtitle_data)
+        return _build_synthesis_response(filenames, subtitle_data)
+
     except json.JSONDecodeError:
         return JsonResponse({
             'status': 'error',
@@ -258,64 +237,144 @@ def synthesize_speech(request):
         }, status=500)
 
 
-def generate_srt(subtitle_data, output_path):
-    """生成SRT格式字幕文件"""
-    try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            for idx, item in enumerate(subtitle_data, 1):
-                start_time = item['audio_offset']
-                end_time = start_time + item.get('duration', 0)
-
-                # 转换为SRT时间格式: HH:MM:SS,mmm
-                start_srt = format_srt_time(start_time)
-                end_srt = format_srt_time(end_time)
-
-                f.write(f"{idx}\n")
-                f.write(f"{start_srt} --> {end_srt}\n")
-                f.write(f"{item['text']}\n")
-                f.write("\n")
-    except Exception as e:
-        logger.error(f"生成SRT字幕失败: {str(e)}")
+def _produce_azure_stream(stream, cache_key, text, voice_id, rate, pitch):
+    """后台线程中流式合成，完成后保存文件（之后相同参数的请求直接命中缓存）"""
+    audio_data, subtitle_data = stream_text(text, voice_id, rate, pitch, stream.add_audio, stream.add_cues)
+    filenames = _save_synthesis(cache_key, text, voice_id, rate, pitch, audio_data, subtitle_data)
+    return _build_synthesis_result(filenames, subtitle_data)
+
 
+def build_stream_response(stream):
+    """流式合成会话的地址：audio_url 边合成边播放，events_url 接收字幕（SSE）"""
+    return JsonResponse({
+        'status': 'success',
+        'stream_id': stream.id,
+        'audio_url': f'/api/tts/stream/{stream.id}/audio/',
+        'events_url': f'/api/tts/stream/{stream.id}/events/'
+    })
 
-def generate_webvtt(subtitle_data, output_path):
-    """生成WebVTT格式字幕文件"""
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def synthesize_speech_stream(request):
+    """
+    流式合成语音（参数同 synthesize_speech）
+
+    立即返回会话地址，合成在后台进行：
+    - audio_url: MP3 音频，合成出第一段音频即开始传输，可直接作为 <audio> 的 src
+    - events_url: SSE，每条字幕一个 cue 事件，结束时 done 事件返回保存后的音频和字幕文件地址
+    """
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write("WEBVTT\n\n")
+        params, error_response = _parse_synthesis_request(request)
+        if error_response:
+            return error_response
+        text, voice_id, rate, pitch = params['text'], params['voice_id'], params['rate'], params['pitch']
+
+        cache_key = _synthesis_cache_key(text, voice_id, rate, pitch)
+        cached = _load_cached_synthesis(cache_key)
+        if cached:
+            filenames, subtitle_data = cached
+            with open(os.path.join(tts_cache.get_tts_dir(), filenames['mp3']), 'rb') as f:
+                audio_data = f.read()
+            stream = tts_streaming.create_completed_stream(
+                audio_data, subtitle_data, _build_synthesis_result(filenames, subtitle_data, cached=True)
+            )
+            return build_stream_response(stream)
 
-            for idx, item in enumerate(subtitle_data, 1):
-                start_time = item['audio_offset']
-                end_time = start_time + item.get('duration', 0)
+        if not AZURE_SPEECH_KEY or not AZURE_SPEECH_REGION:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Azure Speech配置缺失'
+            }, status=500)
 
-                # 转换为WebVTT时间格式: HH:MM:SS.mmm
-                start_vtt = format_webvtt_time(start_time)
-                end_vtt = format_webvtt_time(end_time)
+        stream = tts_streaming.create_stream(_produce_azure_stream, cache_key, text, voice_id, rate, pitch)
+        return build_stream_response(stream)
 
-                f.write(f"{idx}\n")
-                f.write(f"{start_vtt} --> {end_vtt}\n")
-                f.write(f"{item['text']}\n")
-                f.write("\n")
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'status': 'error',
+            'message': '无效的JSON数据'
+        }, status=400)
     except Exception as e:
-        logger.error(f"生成WebVTT字幕失败: {str(e)}")
+        logger.error(f"流式语音合成错误: {str(e)}", exc_info=True)
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+async def stream_audio(request, stream_id):
+    """流式合成的音频（分块传输，合成结束时结束；异步视图，音频块到达即发送）"""
+    stream = tts_streaming.get_stream(stream_id)
+    if stream is None:
+        return JsonResponse({
+            'status': 'error',
+            'message': '合成会话不存在或已过期'
+        }, status=404)
+
+    response = StreamingHttpResponse(stream.iter_audio(), content_type='audio/mpeg')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+async def stream_events(request, stream_id):
+    """流式合成的字幕事件（SSE；异步视图，字幕到达即发送）"""
+    stream = tts_streaming.get_stream(stream_id)
+    if stream is None:
+        return JsonResponse({
+            'status': 'error',
+            'message': '合成会话不存在或已过期'
+        }, status=404)
 
+    async def event_stream():
+        async for event_type, data in stream.iter_events():
+            yield tts_streaming.encode_sse(event_type, data)
 
-def format_srt_time(milliseconds):
-    """格式化时间为SRT格式: HH:MM:SS,mmm"""
-    hours = int(milliseconds // 3600000)
-    minutes = int((milliseconds % 3600000) // 60000)
-    seconds = int((milliseconds % 60000) // 1000)
-    millis = int(milliseconds % 1000)
-    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{millis:03d}"
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_tts_subtitles(request, name, fmt):
+    """
+    下载合成结果的字幕（按需渲染并缓存）
+    - fmt: json / srt / vtt
+    - merge: word（默认，词级）或 sentence（按句子合并）
+    """
+    merge = request.GET.get('merge', 'word')
+    if fmt not in tts_subtitles.SUBTITLE_FORMATS or merge not in tts_subtitles.MERGE_MODES \
+            or not tts_subtitles.NAME_PATTERN.match(name):
+        return JsonResponse({
+            'status': 'error',
+            'message': '不支持的字幕格式'
+        }, status=400)
 
+    try:
+        content = tts_subtitles.render_subtitles(name, fmt, merge=merge)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"渲染字幕失败: {name}.{fmt}, {str(e)}")
+        return JsonResponse({
+            'status': 'error',
+            'message': '读取字幕失败'
+        }, status=500)
+    if content is None:
+        return JsonResponse({
+            'status': 'error',
+            'message': '文件不存在'
+        }, status=404)
 
-def format_webvtt_time(milliseconds):
-    """格式化时间为WebVTT格式: HH:MM:SS.mmm"""
-    hours = int(milliseconds // 3600000)
-    minutes = int((milliseconds % 3600000) // 60000)
-    seconds = int((milliseconds % 60000) // 1000)
-    millis = int(milliseconds % 1000)
-    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{millis:03d}"
+    response = HttpResponse(content, content_type=tts_subtitles.SUBTITLE_FORMATS[fmt])
+    response['Content-Disposition'] = f'inline; filename="{name}.{fmt}"'
+    response['Cache-Control'] = 'public, max-age=86400'
+    return response
 
 
 @csrf_exempt
@@ -323,7 +382,7 @@ def format_webvtt_time(milliseconds):
 def download_audio(request, filename):
     """下载音频文件"""
     try:
-        file_path = os.path.join('/var/www/harry-insurance2/media/tts', filename)
+        file_path = os.path.join(tts_cache.get_tts_dir(), filename)
 
         if not os.path.exists(file_path):
             return JsonResponse({
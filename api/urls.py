@@ -3,25 +3,25 @@ from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 from .views import InsurancePolicyViewSet
 from .auth_views import register, login, user_profile, wechat_login, generate_miniprogram_scheme, wechat_web_auth, wechat_update_profile, wechat_upload_avatar, get_page_permissions
-from .ocr_views import save_ocr_result, get_saved_documents, get_pending_documents, get_document_detail, analyze_document_table, analyze_basic_info, delete_documents, chat_with_document, extract_summary, get_processing_status, ocr_webhook, create_pending_document, retry_failed_document, upload_pdf_async
+from .ocr_views import save_ocr_result, get_saved_documents, get_pending_documents, get_document_detail, analyze_document_table, analyze_basic_info, delete_documents, chat_with_document, extract_summary, get_processing_status, ocr_webhook, create_pending_document, retry_failed_document, upload_pdf_async, compare_documents_view
 from .payment_views_v3 import create_payment_order_v3, payment_notify_v3, create_jsapi_payment, get_membership_plans
 from .plan_views import get_membership_status
 from .content_editor_views import process_user_request, update_tablesummary, update_surrender_value_table, update_wellness_table, update_plan_summary
 from .content_creator_views import extract_subtitle, generate_content_with_context
-from .ip_image_views import generate_ip_image, generate_ip_image_v2, get_saved_ip_image, save_ip_image, generate_content_image, get_gemini_usage_stats
-from .media_library_views import get_media_library, get_media_detail, toggle_favorite, delete_media, batch_delete_media, get_media_stats, upload_media
+from .ip_image_views import generate_ip_image, generate_ip_image_v2, get_saved_ip_image, save_ip_image, generate_content_image, get_gemini_usage_stats, get_image_generation_job, list_image_generation_jobs, generate_content_image_batch
+from .media_library_views import get_media_library, get_media_detail, toggle_favorite, delete_media, batch_delete_media, get_media_stats, upload_media, get_similar_media, get_duplicate_media, dedup_media
 from .video_generator_views import (
     generate_scene_prompts, create_video,
     get_video_projects, get_video_project_detail,
     create_video_project, update_video_project, delete_video_project,
     video_completion_callback, video_proxy_download
 )
-from .tts_views import get_voices, synthesize_speech, download_audio
-from .personal_voice_views import get_personal_voices, create_personal_voice, synthesize_with_personal_voice, delete_personal_voice
+from .tts_views import get_voices, synthesize_speech, download_audio, synthesize_speech_stream, stream_audio, stream_events, get_tts_subtitles
+from .personal_voice_views import get_personal_voices, create_personal_voice, synthesize_with_personal_voice, synthesize_with_personal_voice_stream, delete_personal_voice
 from .pdf_views import remove_pdf_footer, crop_pdf_footer
 from .poster_views import analyze_poster_view, get_analysis_templates
-from .axa_benefit_views import analyze_axa_benefit, calculate_withdrawal
-from .insurance_company_views import get_insurance_companies, get_company_requests, get_request_detail, get_company_request_by_name, execute_api_request, get_companies_standard_comparison
+from .axa_benefit_views import analyze_axa_benefit, calculate_withdrawal, simulate_withdrawal
+from .insurance_company_views import get_insurance_companies, get_company_requests, get_request_detail, get_company_request_by_name, execute_api_request, sweep_api_request, get_illustration_sweep, get_insurer_http_metrics, get_companies_standard_comparison, query_product_values
 from .stripe_views import create_checkout_session, stripe_webhook, check_membership_status
 from .product_settings_views import get_all_products, manage_user_product_settings
 # 计划书提取功能已删除
@@ -78,6 +78,7 @@ urlpatterns = [
     path('ocr/documents/<int:document_id>/chat/', chat_with_document, name='chat-with-document'),
     path('ocr/documents/<int:document_id>/retry/', retry_failed_document, name='retry-failed-document'),  # 手动重试失败任务
     path('ocr/documents/delete/', delete_documents, name='delete-documents'),
+    path('ocr/documents/compare/', compare_documents_view, name='compare-documents'),
 
     # 内容编辑器API
     path('content-editor/<int:document_id>/process/', process_user_request, name='process-user-request'),
@@ -93,6 +94,9 @@ urlpatterns = [
     # IP形象生成API
     path('ip-image/generate', generate_ip_image, name='generate-ip-image'),
     path('ip-image/generate-v2', generate_ip_image_v2, name='generate-ip-image-v2'),
+    path('ip-image/content-batch', generate_content_image_batch, name='generate-content-image-batch'),
+    path('ip-image/jobs', list_image_generation_jobs, name='list-image-generation-jobs'),
+    path('ip-image/jobs/<int:job_id>', get_image_generation_job, name='get-image-generation-job'),
     path('ip-image/saved', get_saved_ip_image, name='get-saved-ip-image'),
     path('ip-image/save', save_ip_image, name='save-ip-image'),
 
@@ -110,6 +114,9 @@ urlpatterns = [
     path('media-library/<int:media_id>/favorite/', toggle_favorite, name='toggle-favorite'),
     path('media-library/<int:media_id>/delete/', delete_media, name='delete-media'),
     path('media-library/batch-delete/', batch_delete_media, name='batch-delete-media'),
+    path('media-library/<int:media_id>/similar/', get_similar_media, name='get-similar-media'),
+    path('media-library/duplicates/', get_duplicate_media, name='get-duplicate-media'),
+    path('media-library/dedup/', dedup_media, name='dedup-media'),
 
     # 视频生成器API
     path('video/generate-prompts/', generate_scene_prompts, name='generate-scene-prompts'),
@@ -127,12 +134,17 @@ urlpatterns = [
     # 语音合成API
     path('tts/voices/', get_voices, name='get-voices'),
     path('tts/synthesize/', synthesize_speech, name='synthesize-speech'),
+    path('tts/stream/', synthesize_speech_stream, name='synthesize-speech-stream'),
+    path('tts/stream/<str:stream_id>/audio/', stream_audio, name='tts-stream-audio'),
+    path('tts/stream/<str:stream_id>/events/', stream_events, name='tts-stream-events'),
     path('tts/download/<str:filename>/', download_audio, name='download-audio'),
+    path('tts/subtitles/<str:name>/<str:fmt>/', get_tts_subtitles, name='tts-subtitles'),
 
     # 个人语音API
     path('personal-voice/', get_personal_voices, name='get-personal-voices'),
     path('personal-voice/create/', create_personal_voice, name='create-personal-voice'),
     path('personal-voice/synthesize/', synthesize_with_personal_voice, name='synthesize-with-personal-voice'),
+    path('personal-voice/synthesize/stream/', synthesize_with_personal_voice_stream, name='synthesize-with-personal-voice-stream'),
     path('personal-voice/<str:voice_id>/delete/', delete_personal_voice, name='delete-personal-voice'),
 
     # PDF处理API
@@ -146,14 +158,19 @@ urlpatterns = [
     # 安盛利益表分析API
     path('axa/benefit/analyze', analyze_axa_benefit, name='analyze-axa-benefit'),
     path('axa/withdrawal/calculate', calculate_withdrawal, name='calculate-withdrawal'),
+    path('axa/withdrawal/simulate', simulate_withdrawal, name='simulate-withdrawal'),
 
     # 保险公司和请求配置API
     path('insurance-companies/', get_insurance_companies, name='get-insurance-companies'),
     path('insurance-companies/standard-comparison/', get_companies_standard_comparison, name='get-companies-standard-comparison'),
+    path('insurance-companies/http-metrics/', get_insurer_http_metrics, name='get-insurer-http-metrics'),
     path('insurance-companies/<str:company_code>/requests/', get_company_requests, name='get-company-requests'),
     path('insurance-companies/<str:company_code>/requests/<str:request_name>/', get_company_request_by_name, name='get-company-request-by-name'),
     path('insurance-companies/<str:company_code>/requests/<str:request_name>/execute', execute_api_request, name='execute-api-request'),
+    path('insurance-companies/<str:company_code>/requests/<str:request_name>/sweep', sweep_api_request, name='sweep-api-request'),
+    path('illustration-sweeps/<int:sweep_id>/', get_illustration_sweep, name='get-illustration-sweep'),
     path('insurance-requests/<int:request_id>/', get_request_detail, name='get-request-detail'),
+    path('insurance-products/value-query/', query_product_values, name='query-product-values'),
 
     # 产品对比设置API
     path('company-comparison/products', get_all_products, name='get-all-products'),
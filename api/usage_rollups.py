@@ -0,0 +1,251 @@
+"""
+Gemini调用次数汇总
+每条 GeminiUsage 写入后（post_save 信号，事务提交时）累加到 GeminiUsageRollup 的小时桶和累计行，
+删除后（post_delete 信号，包括 Admin 删除和用户级联删除）从对应的桶中扣减，
+统计接口只对汇总表做一次聚合查询，耗时与历史记录数无关；
+超过保留期的小时桶由定时任务 compact_rollups 合并为天桶
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, TruncHour
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# 累计行的时间桶
+TOTAL_BUCKET = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# 每批压缩的小时桶行数
+COMPACT_BATCH_SIZE = 2000
+
+
+def get_hourly_retention_days():
+    """小时桶保留天数（需大于统计接口最长的按时间统计周期 30 天）"""
+    return getattr(settings, 'GEMINI_USAGE_HOURLY_RETENTION_DAYS', 35)
+
+
+def _hour_bucket(value):
+    return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _day_bucket(value):
+    """按本地时区（TIME_ZONE）的自然日分桶"""
+    return timezone.localtime(value).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _increment(user_id, generation_type, granularity, bucket, total, success, last_success_at=None):
+    """
+    原子累加一个汇总桶（单条 UPDATE），桶不存在时创建；
+    并发创建触发唯一约束冲突时改为累加
+    """
+    from .models import GeminiUsageRollup
+
+    updates = {
+        'total_count': F('total_count') + total,
+        'success_count': F('success_count') + success,
+    }
+    if last_success_at is not None:
+        # MySQL 的 GREATEST 遇到 NULL 返回 NULL，用 Coalesce 兜底
+        updates['last_success_at'] = Coalesce(Greatest(F('last_success_at'), Value(last_success_at)), Value(last_success_at))
+
+    queryset = GeminiUsageRollup.objects.filter(
+        user_id=user_id, granularity=granularity, bucket=bucket, generation_type=generation_type
+    )
+    if queryset.update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            GeminiUsageRollup.objects.create(
+                user_id=user_id,
+                generation_type=generation_type,
+                granularity=granularity,
+                bucket=bucket,
+                total_count=total,
+                success_count=success,
+                last_success_at=last_success_at,
+            )
+    except IntegrityError:
+        queryset.update(**updates)
+
+
+def record_usage(usage):
+    """把一条 GeminiUsage 计入小时桶和累计行"""
+    success = 1 if usage.success else 0
+    last_success_at = usage.created_at if usage.success else None
+    try:
+        _increment(usage.user_id, usage.generation_type, 'hour', _hour_bucket(usage.created_at),
+                   1, success, last_success_at)
+        _increment(usage.user_id, usage.generation_type, 'total', TOTAL_BUCKET,
+                   1, success, last_success_at)
+    except Exception as e:
+        # 汇总失败不影响生成流程，可用 rebuild_usage_rollups 命令重建
+        logger.error(f"❌ Gemini调用汇总更新失败: usage={usage.id}, {str(e)}")
+
+
+def _decrement(usage, granularity, bucket, span=None):
+    """
+    从一个汇总桶扣减一条记录（单条 UPDATE，不会减到负数），返回更新的行数；
+    删除的是该桶最近一次成功调用时，最后成功时间改为剩余明细中的最近一次
+
+    Args:
+        span: 桶的时间跨度（累计行为 None）
+    """
+    from .models import GeminiUsage, GeminiUsageRollup
+
+    success = 1 if usage.success else 0
+    queryset = GeminiUsageRollup.objects.filter(
+        user_id=usage.user_id, granularity=granularity, bucket=bucket, generation_type=usage.generation_type
+    )
+    updated = queryset.update(
+        total_count=Greatest(F('total_count') - 1, Value(0)),
+        success_count=Greatest(F('success_count') - success, Value(0)),
+    )
+    if updated and success:
+        remaining = GeminiUsage.objects.filter(
+            user_id=usage.user_id, generation_type=usage.generation_type, success=True
+        )
+        if span is not None:
+            remaining = remaining.filter(created_at__gte=bucket, created_at__lt=bucket + span)
+        queryset.filter(last_success_at=usage.created_at).update(
+            last_success_at=Subquery(remaining.order_by('-created_at').values('created_at')[:1])
+        )
+    return updated
+
+
+def remove_usage(usage):
+    """从小时桶（已压缩时为天桶）和累计行中扣减一条已删除的 GeminiUsage"""
+    try:
+        if not _decrement(usage, 'hour', _hour_bucket(usage.created_at), timedelta(hours=1)):
+            _decrement(usage, 'day', _day_bucket(usage.created_at), timedelta(days=1))
+        _decrement(usage, 'total', TOTAL_BUCKET)
+    except Exception as e:
+        # 与 record_usage 相同：失败时可用 rebuild_usage_rollups 命令重建
+        logger.error(f"❌ Gemini调用汇总扣减失败: usage={usage.id}, {str(e)}")
+
+
+def get_usage_counts(user, start=None, generation_type='all'):
+    """
+    从汇总表统计调用次数（一次聚合查询）
+
+    Args:
+        start: 统计起始时间，None 表示全部（读取累计行）；按小时桶统计，起始时间向下取整到整点
+        generation_type: 'ip_image' / 'content_image' / 'all'
+
+    Returns:
+        dict: {total_count, success_count, ip_image_count, content_image_count}
+    """
+    from .models import GeminiUsageRollup
+
+    queryset = GeminiUsageRollup.objects.filter(user=user)
+    if start is None:
+        queryset = queryset.filter(granularity='total')
+    else:
+        queryset = queryset.filter(granularity='hour', bucket__gte=_hour_bucket(start))
+    if generation_type != 'all':
+        queryset = queryset.filter(generation_type=generation_type)
+
+    counts = queryset.aggregate(
+        total_count=Coalesce(Sum('total_count'), 0),
+        success_count=Coalesce(Sum('success_count'), 0),
+        ip_image_count=Coalesce(Sum('total_count', filter=Q(generation_type='ip_image')), 0),
+        content_image_count=Coalesce(Sum('total_count', filter=Q(generation_type='content_image')), 0),
+    )
+    return counts
+
+
+def compact_rollups(before=None):
+    """
+    把保留期之前的小时桶合并到天桶并删除（由 celery beat 每天调用）
+
+    Returns:
+        int: 合并的小时桶行数
+    """
+    from .models import GeminiUsageRollup
+
+    if before is None:
+        before = timezone.now() - timedelta(days=get_hourly_retention_days())
+    compacted = 0
+    while True:
+        rows = list(GeminiUsageRollup.objects.filter(
+            granularity='hour', bucket__lt=_hour_bucket(before)
+        ).order_by('id')[:COMPACT_BATCH_SIZE])
+        if not rows:
+            break
+
+        merged = defaultdict(lambda: {'total': 0, 'success': 0, 'last_success_at': None})
+        for row in rows:
+            day = merged[(row.user_id, row.generation_type, _day_bucket(row.bucket))]
+            day['total'] += row.total_count
+            day['success'] += row.success_count
+            if row.last_success_at and (day['last_success_at'] is None or row.last_success_at > day['last_success_at']):
+                day['last_success_at'] = row.last_success_at
+
+        with transaction.atomic():
+            for (user_id, generation_type, bucket), day in merged.items():
+                _increment(user_id, generation_type, 'day', bucket,
+                           day['total'], day['success'], day['last_success_at'])
+            GeminiUsageRollup.objects.filter(id__in=[row.id for row in rows]).delete()
+        compacted += len(rows)
+
+    if compacted:
+        logger.info(f"🗜️ 已把 {compacted} 个Gemini调用小时桶合并为天桶")
+    return compacted
+
+
+def rebuild_rollups(user_ids=None):
+    """
+    从 GeminiUsage 明细重建汇总（首次上线回填，或信号丢失后修复）
+    保留期内重建小时桶，更早的记录直接汇总到天桶
+
+    Returns:
+        int: 重建的汇总行数
+    """
+    from .models import GeminiUsage, GeminiUsageRollup
+
+    usages = GeminiUsage.objects.all()
+    if user_ids:
+        usages = usages.filter(user_id__in=user_ids)
+    hour_cutoff = _hour_bucket(timezone.now() - timedelta(days=get_hourly_retention_days()))
+
+    # 按 UTC 取整，避免依赖 MySQL 时区表（CONVERT_TZ）
+    hourly = usages.annotate(
+        hour=TruncHour('created_at', tzinfo=dt_timezone.utc)
+    ).values('user_id', 'generation_type', 'hour').annotate(
+        total=Count('id'),
+        success=Count('id', filter=Q(success=True)),
+        last_success_at=Max('created_at', filter=Q(success=True)),
+    ).order_by()
+
+    rows = {}
+    for item in hourly.iterator():
+        hour = item['hour']
+        if hour >= hour_cutoff:
+            granularity, bucket = 'hour', hour
+        else:
+            granularity, bucket = 'day', _day_bucket(hour)
+        for key in ((item['user_id'], item['generation_type'], granularity, bucket),
+                    (item['user_id'], item['generation_type'], 'total', TOTAL_BUCKET)):
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = GeminiUsageRollup(
+                    user_id=key[0], generation_type=key[1], granularity=key[2], bucket=key[3],
+                    total_count=0, success_count=0
+                )
+            row.total_count += item['total']
+            row.success_count += item['success']
+            if item['last_success_at'] and (row.last_success_at is None or item['last_success_at'] > row.last_success_at):
+                row.last_success_at = item['last_success_at']
+
+    with transaction.atomic():
+        existing = GeminiUsageRollup.objects.all()
+        if user_ids:
+            existing = existing.filter(user_id__in=user_ids)
+        existing.delete()
+        GeminiUsageRollup.objects.bulk_create(rows.values(), batch_size=1000)
+
+    logger.info(f"🔁 已重建 {len(rows)} 行Gemini调用汇总")
+    return len(rows)
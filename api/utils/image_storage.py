@@ -1,19 +1,277 @@
 """
 图像存储工具模块
 处理从Gemini下载图像并保存到本地服务器
+
+图片按内容的 SHA-256 保存（generated_images/objects/ab/abcd....png），
+相同内容只存一份，由 MediaFile.ref_count 记录引用它的素材数，引用归零时删除文件；
+下载和上传都分块写入临时文件并同时计算哈希，只读取文件头获取尺寸
 """
 import os
-import requests
+import time
 import uuid
-from datetime import datetime
+import hashlib
+import logging
+import tempfile
+from contextlib import contextmanager
+import requests
 from PIL import Image
-from io import BytesIO
 from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# 内容寻址存储目录（相对 media 目录）
+OBJECTS_SUBDIR = os.path.join('generated_images', 'objects')
+
+# 临时文件目录（与存储目录在同一文件系统，可直接 os.replace）
+TEMP_SUBDIR = os.path.join('generated_images', 'tmp')
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# 下载图片的大小上限
+MAX_DOWNLOAD_SIZE = 30 * 1024 * 1024
+
+# 同一内容的"写入文件 + 创建记录"与"确认无记录 + 删除文件"互斥（跨进程 Redis 锁）
+CONTENT_LOCK_KEY = 'media_file:lock:{digest}'
+CONTENT_LOCK_TIMEOUT = 60
+LOCK_POLL_INTERVAL = 0.05
+
+IMAGE_EXTENSIONS = {
+    'PNG': '.png',
+    'JPEG': '.jpg',
+    'WEBP': '.webp',
+    'GIF': '.gif',
+}
+
+
+def _media_root():
+    return os.path.join(settings.BASE_DIR, 'media')
+
+
+def _object_relative_path(digest, extension):
+    return os.path.join(OBJECTS_SUBDIR, digest[:2], f"{digest}{extension}")
+
+
+def _remove_quietly(absolute_path):
+    try:
+        os.remove(absolute_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"⚠️ 删除文件失败: {absolute_path}, {str(e)}")
+
+
+@contextmanager
+def _content_lock(digest):
+    """按内容哈希加锁（持有者异常退出时锁在超时后自动释放）"""
+    lock_key = CONTENT_LOCK_KEY.format(digest=digest)
+    while not cache.add(lock_key, 1, timeout=CONTENT_LOCK_TIMEOUT):
+        time.sleep(LOCK_POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        cache.delete(lock_key)
+
+
+def _write_temp(chunks, max_size=None):
+    """
+    分块写入临时文件并计算哈希
+
+    Returns:
+        tuple: (临时文件绝对路径, sha256, 文件大小)
+    """
+    temp_dir = os.path.join(_media_root(), TEMP_SUBDIR)
+    os.makedirs(temp_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=temp_dir, suffix='.part')
+    sha256 = hashlib.sha256()
+    file_size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                file_size += len(chunk)
+                if max_size and file_size > max_size:
+                    raise ValueError(f'图片超过大小限制 {max_size // (1024 * 1024)}MB')
+                sha256.update(chunk)
+                f.write(chunk)
+    except Exception:
+        _remove_quietly(temp_path)
+        raise
+    return temp_path, sha256.hexdigest(), file_size
+
+
+def _read_header(absolute_path):
+    """只解析文件头，返回 (格式, 宽, 高)，不是支持的图片格式时抛出 ValueError"""
+    try:
+        with Image.open(absolute_path) as image:
+            image_format = image.format
+            width, height = image.size
+    except Exception as e:
+        raise ValueError(f'无法识别的图片文件: {str(e)}')
+    if image_format not in IMAGE_EXTENSIONS:
+        raise ValueError(f'不支持的图片格式: {image_format}')
+    return image_format, width, height
+
+
+def store_image_chunks(chunks, max_size=None):
+    """
+    把图片数据流保存到内容寻址存储并增加一次引用
+
+    相同内容已存在时丢弃临时文件，只增加引用数
+
+    Returns:
+        MediaFile: 调用方必须把它关联到素材，失败时调用 release_media_file 释放引用
+    """
+    from api.models import MediaFile
+
+    temp_path, digest, file_size = _write_temp(chunks, max_size=max_size)
+    try:
+        if MediaFile.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1, updated_at=timezone.now()):
+            return MediaFile.objects.get(sha256=digest)
+
+        image_format, width, height = _read_header(temp_path)
+        relative_path = _object_relative_path(digest, IMAGE_EXTENSIONS[image_format])
+        absolute_path = os.path.join(_media_root(), relative_path)
+        # 加锁后替换文件并创建记录，避免正在删除同一内容的 _remove_media_file 删掉新文件
+        with _content_lock(digest):
+            # 等锁期间可能已有请求保存了相同内容
+            if MediaFile.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1, updated_at=timezone.now()):
+                return MediaFile.objects.get(sha256=digest)
+            os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
+            os.replace(temp_path, absolute_path)
+            temp_path = None
+            try:
+                with transaction.atomic():
+                    return MediaFile.objects.create(
+                        sha256=digest,
+                        path=relative_path,
+                        file_size=file_size,
+                        width=width,
+                        height=height,
+                        ref_count=1
+                    )
+            except IntegrityError:
+                # 并发保存了相同内容（文件内容相同，替换无影响）
+                MediaFile.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+                return MediaFile.objects.get(sha256=digest)
+    finally:
+        if temp_path:
+            _remove_quietly(temp_path)
+
+
+def _release_locked(media_file, count):
+    """已加行锁的 MediaFile 释放引用（在调用方的事务中），引用归零时删除记录，事务提交后删除文件"""
+    from api.models import MediaFile
+
+    if media_file.ref_count > count:
+        MediaFile.objects.filter(id=media_file.id).update(ref_count=F('ref_count') - count)
+        return False
+    media_file.delete()
+    transaction.on_commit(lambda: _remove_media_file(media_file.sha256, media_file.path))
+    return True
+
+
+def release_media_file(media_file_id, count=1):
+    """
+    释放引用（批量删除时一次释放多次），引用归零时删除记录，并在事务提交后删除图片文件和多尺寸版本
+
+    Returns:
+        bool: 文件是否被删除
+    """
+    from api.models import MediaFile
+
+    with transaction.atomic():
+        media_file = MediaFile.objects.select_for_update().filter(id=media_file_id).first()
+        if media_file is None:
+            return False
+        return _release_locked(media_file, count)
+
+
+def queue_media_file_releases(media_file_counts):
+    """
+    写入待释放的引用（必须在删除素材记录的同一事务中调用），由 apply_media_file_releases 处理
+
+    Args:
+        media_file_counts: {media_file_id: 释放次数}
+
+    Returns:
+        str: 批次号
+    """
+    from api.models import MediaFileRelease
+
+    batch = uuid.uuid4().hex
+    MediaFileRelease.objects.bulk_create([
+        MediaFileRelease(media_file_id=media_file_id, batch=batch, count=count)
+        for media_file_id, count in media_file_counts.items()
+    ])
+    return batch
+
+
+def apply_media_file_release(release_id):
+    """
+    执行一条待释放记录：减少引用和删除该记录在同一事务中，已执行过（记录不存在）时跳过，可安全重试
+
+    Returns:
+        bool: 文件是否被删除
+    """
+    from api.models import MediaFile, MediaFileRelease
+
+    media_file_id = MediaFileRelease.objects.filter(id=release_id).values_list('media_file_id', flat=True).first()
+    if media_file_id is None:
+        return False
+    with transaction.atomic():
+        # 与 release_media_file 相同，先锁 MediaFile 再锁释放记录
+        media_file = MediaFile.objects.select_for_update().filter(id=media_file_id).first()
+        release = MediaFileRelease.objects.select_for_update().filter(id=release_id).first()
+        if media_file is None or release is None:
+            return False
+        release.delete()
+        return _release_locked(media_file, release.count)
+
+
+def apply_media_file_releases(batch=None, older_than=None):
+    """
+    执行一个批次（或创建时间早于 older_than 的全部）待释放记录
+
+    Returns:
+        int: 删除的文件数
+    """
+    from api.models import MediaFileRelease
+
+    releases = MediaFileRelease.objects.all()
+    if batch is not None:
+        releases = releases.filter(batch=batch)
+    if older_than is not None:
+        releases = releases.filter(created_at__lt=older_than)
+    removed = 0
+    for release_id in list(releases.values_list('id', flat=True)):
+        if apply_media_file_release(release_id):
+            removed += 1
+    return removed
+
+
+def _remove_media_file(digest, relative_path):
+    """
+    删除内容文件及其多尺寸版本（删除前再次确认没有被重新保存）；
+    确认和删除在内容锁内进行，同时保存相同内容的 store_image_chunks 会等删除完成后再写入文件
+    """
+    from api.models import MediaFile
+    from api.media_variants import delete_variant_files
+
+    with _content_lock(digest):
+        if MediaFile.objects.filter(sha256=digest).exists():
+            return
+        _remove_quietly(os.path.join(_media_root(), relative_path))
+        delete_variant_files(relative_path)
 
 
 def download_and_save_image(image_url, media_type, user_id):
     """
-    从URL下载图像并保存到本地
+    从URL下载图像并保存到本地（流式下载，按内容哈希存储）
 
     Args:
         image_url: Gemini生成的图像URL
@@ -27,51 +285,25 @@ def download_and_save_image(image_url, media_type, user_id):
             'width': int,
             'height': int,
             'file_size': int,
+            'media_file': MediaFile,  # 已增加一次引用
             'error': str  # 如果失败
         }
     """
     try:
-        # 1. 下载图像
-        response = requests.get(image_url, timeout=30)
-        response.raise_for_status()
-
-        # 2. 获取图像数据
-        image_data = response.content
-        file_size = len(image_data)
-
-        # 3. 使用PIL获取图像尺寸
-        image = Image.open(BytesIO(image_data))
-        width, height = image.size
-
-        # 4. 生成文件名和路径
-        # 格式: user_{user_id}_{uuid}_{timestamp}.png
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        unique_id = str(uuid.uuid4())[:8]
-        filename = f"user_{user_id}_{unique_id}_{timestamp}.png"
-
-        # 确定子目录
-        subdir = 'ip_images' if media_type == 'ip_image' else 'content_images'
-
-        # 相对路径 (用于数据库)
-        relative_path = os.path.join('generated_images', subdir, filename)
-
-        # 绝对路径 (用于文件系统)
-        media_root = os.path.join(settings.BASE_DIR, 'media')
-        absolute_path = os.path.join(media_root, 'generated_images', subdir, filename)
-
-        # 5. 确保目录存在
-        os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
-
-        # 6. 保存文件
-        with open(absolute_path, 'wb') as f:
-            f.write(image_data)
+        with requests.get(image_url, timeout=30, stream=True) as response:
+            response.raise_for_status()
+            media_file = store_image_chunks(
+                response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE),
+                max_size=MAX_DOWNLOAD_SIZE
+            )
 
         return {
             'success': True,
-            'local_path': relative_path,
-            'width': width,
-            'height': height,
-            'file_size': file_size
+            'local_path': media_file.path,
+            'width': media_file.width,
+            'height': media_file.height,
+            'file_size': media_file.file_size,
+            'media_file': media_file
         }
 
     except requests.RequestException as e:
@@ -116,6 +348,7 @@ def save_to_media_library(user, media_type, original_url, prompt='', related_ip_
             media_type=media_type,
             original_url=original_url,
             local_path=result['local_path'],
+            media_file=result['media_file'],
             prompt=prompt,
             width=result.get('width'),
             height=result.get('height'),
@@ -127,12 +360,10 @@ def save_to_media_library(user, media_type, original_url, prompt='', related_ip_
 
     except Exception as e:
         print(f"❌ 创建素材库记录失败: {str(e)}")
-        # 如果数据库保存失败，删除已下载的文件
+        # 如果数据库保存失败，释放文件引用（没有其他素材引用时删除文件）
         try:
-            absolute_path = os.path.join(settings.BASE_DIR, 'media', result['local_path'])
-            if os.path.exists(absolute_path):
-                os.remove(absolute_path)
-        except:
+            release_media_file(result['media_file'].id)
+        except Exception:
             pass
         return None
 
@@ -156,3 +387,66 @@ def delete_media_file(local_path):
     except Exception as e:
         print(f"❌ 删除文件失败: {str(e)}")
         return False
+
+
+def delete_media_files(media):
+    """
+    删除旧数据（没有 media_file）的原图和多尺寸版本；
+    内容寻址存储的文件由 MediaLibrary 的 post_delete 信号释放引用
+    """
+    from api.media_variants import delete_media_variants
+
+    if media.media_file_id:
+        return
+    if media.local_path:
+        delete_media_file(media.local_path)
+    delete_media_variants(media)
+
+
+def _iter_file(absolute_path):
+    with open(absolute_path, 'rb') as f:
+        while True:
+            chunk = f.read(DOWNLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def adopt_legacy_media(media):
+    """
+    把旧数据（随机文件名）迁移到内容寻址存储：关联 MediaFile，删除原文件和旧的多尺寸版本
+    （新版本由调用方重新生成，相同内容的素材会直接复用）
+
+    Returns:
+        bool: 是否迁移
+    """
+    from api.models import MediaLibrary
+    from api.media_variants import delete_media_variants
+
+    if media.media_file_id or not media.local_path:
+        return False
+    absolute_path = os.path.join(_media_root(), media.local_path)
+    if not os.path.exists(absolute_path):
+        return False
+
+    media_file = store_image_chunks(_iter_file(absolute_path))
+    try:
+        updated = MediaLibrary.objects.filter(id=media.id, media_file__isnull=True).update(
+            media_file=media_file,
+            local_path=media_file.path,
+            file_size=media_file.file_size,
+            thumbnail_path='',
+            variants={},
+            variants_generated_at=None
+        )
+    except Exception:
+        release_media_file(media_file.id)
+        raise
+    if not updated:
+        release_media_file(media_file.id)
+        return False
+
+    if media_file.path != media.local_path:
+        _remove_quietly(absolute_path)
+    delete_media_variants(media)
+    return True
@@ -0,0 +1,316 @@
+"""
+本地提取（入息）情景模拟器
+基于已存储的基本计划预测（InsuranceProduct 退保价值表 / 计划书 table1 / md*.json 投影），
+一次性向量化模拟多个提取方案下的名义金额、保证/非保证退保价值和总价值，
+供前端滑块交互即时响应；最终结果仍以保险公司API为准
+
+名义金额递减规则（与 md4.json Withdrawal 投影一致）：
+    每次提取按"提取额 / 提取前退保价值"等比例减少名义金额，
+    由于提取前退保价值 = 基本计划退保价值 × 名义金额比例，
+    名义金额比例 r(t) = 1 - Σ W(k) / 基本计划总退保价值(k)，可直接用 cumsum 计算
+保证现金价值按 r(t) 等比例缩放；非保证部分可用参考提取投影（md Withdrawal 投影或 table2）校准
+"""
+import json
+import numpy as np
+from .projection_parser import parse_projections_data
+from .plan_comparison import METRIC_FALLBACKS
+
+# md*.json 基本计划投影使用的列（当前假设情景，无Low/High后缀）
+MD_BASE_COLUMNS = {
+    'policy_year': 'columnYear',
+    'premiums_paid': 'colAccumulateAnnualizedPremium',
+    'guaranteed': 'colGuaranteedCashValue',
+    'non_guaranteed': 'colNonGuaranteedSurrender',
+    'total': 'colTotalSurrender',
+}
+
+# md*.json Withdrawal 投影使用的列
+MD_WITHDRAWAL_COLUMNS = {
+    'policy_year': 'columnYear',
+    'withdrawal_amount': 'colCurrentTotalWithdrawalAmount',
+    'notional_amount': 'colAfterWDNotionalAmount',
+    'guaranteed': 'colGuaranteedCashValue',
+    'non_guaranteed': 'colNonGuaranteedSurrender',
+    'total': 'colTotalSurrender',
+}
+
+# 单次请求最多模拟的方案数
+MAX_SCENARIOS = 200
+
+
+def _to_float_array(values):
+    """列表转 float64 数组，无法转换的值记为 NaN"""
+    result = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        if value is None or value == '':
+            continue
+        try:
+            result[i] = float(str(value).replace(',', ''))
+        except (TypeError, ValueError):
+            pass
+    return result
+
+
+def _row_value(row, metric):
+    """读取行中的指标，缺失时按 plan_comparison.METRIC_FALLBACKS 读取旧字段名（如 guaranteed_cash_value）"""
+    value = row.get(metric)
+    if (value is None or value == '') and metric in METRIC_FALLBACKS:
+        value = row.get(METRIC_FALLBACKS[metric])
+    return value
+
+
+class WithdrawalSimulator:
+    """
+    提取情景模拟器
+
+    Args:
+        policy_year: 保单年度数组（升序，从1开始连续）
+        guaranteed, non_guaranteed, total: 基本计划（无提取）各年度退保价值
+        premiums_paid: 累计已缴保费（可选）
+        reference: 参考提取投影（可选），dict 包含 withdrawal_amount、total，
+                   以及可选的 guaranteed、non_guaranteed，用于校准非保证部分
+        initial_notional: 初始名义金额（可选），用于返回名义金额绝对值
+    """
+
+    def __init__(self, policy_year, guaranteed, non_guaranteed, total, premiums_paid=None,
+                 reference=None, initial_notional=None):
+        self.policy_year = np.asarray(policy_year, dtype=np.int64)
+        self.guaranteed = np.nan_to_num(np.asarray(guaranteed, dtype=np.float64))
+        self.total = np.nan_to_num(np.asarray(total, dtype=np.float64))
+        non_guaranteed = np.asarray(non_guaranteed, dtype=np.float64)
+        self.non_guaranteed = np.where(np.isnan(non_guaranteed), self.total - self.guaranteed, non_guaranteed)
+        self.premiums_paid = None if premiums_paid is None else np.nan_to_num(np.asarray(premiums_paid, dtype=np.float64))
+        self.initial_notional = initial_notional
+        self.calibration = None
+        self.reference_ratio = None
+        if reference is not None:
+            self._calibrate(reference)
+
+    @property
+    def years(self):
+        return self.policy_year.size
+
+    def _notional_ratio(self, withdrawals):
+        """
+        名义金额比例 r(t)，withdrawals 形状为 (S, Y)
+        基本计划退保价值为0的年度无法提取（该年提取视为无效）
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = np.where(self.total > 0, withdrawals / self.total, np.where(withdrawals > 0, np.inf, 0.0))
+        return 1.0 - np.cumsum(step, axis=1)
+
+    def _calibrate(self, reference):
+        """
+        用参考提取投影校准非保证部分：
+            k(t) = 参考非保证价值 / (基本计划非保证价值 × 参考名义金额比例)
+        """
+        ref_withdrawals = np.nan_to_num(np.asarray(reference['withdrawal_amount'], dtype=np.float64))[:self.years]
+        ref_withdrawals = np.pad(ref_withdrawals, (0, self.years - ref_withdrawals.size))
+        ref_ratio = self._notional_ratio(ref_withdrawals[None, :])[0]
+
+        ref_total = np.asarray(reference['total'], dtype=np.float64)[:self.years]
+        ref_total = np.pad(ref_total, (0, self.years - ref_total.size), constant_values=np.nan)
+        if reference.get('non_guaranteed') is not None:
+            ref_ng = np.asarray(reference['non_guaranteed'], dtype=np.float64)[:self.years]
+            ref_ng = np.pad(ref_ng, (0, self.years - ref_ng.size), constant_values=np.nan)
+        else:
+            ref_ng = ref_total - self.guaranteed * ref_ratio
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            k = ref_ng / (self.non_guaranteed * ref_ratio)
+        valid = np.isfinite(k) & (ref_ratio > 0) & (ref_ratio < 1 - 1e-9)
+        self.calibration = np.where(valid, np.clip(k, 0, None), 1.0)
+        self.reference_ratio = ref_ratio
+
+    def build_schedules(self, scenarios):
+        """
+        把提取方案转为 (S, Y) 的提取金额矩阵
+
+        每个方案支持：
+            {'amount': 10000, 'start_year': 5, 'end_year': 138, 'growth_rate': 0}
+            或 {'amounts': {"5": 10000, "6": 12000, ...}} 按年度指定
+        """
+        schedules = np.zeros((len(scenarios), self.years))
+        years = self.policy_year.astype(np.float64)
+        for i, scenario in enumerate(scenarios):
+            if scenario.get('amounts'):
+                for year, amount in scenario['amounts'].items():
+                    idx = np.flatnonzero(self.policy_year == int(year))
+                    if idx.size:
+                        schedules[i, idx[0]] = float(amount)
+                continue
+            amount = float(scenario.get('amount', 0))
+            start = int(scenario.get('start_year', 1))
+            end = int(scenario.get('end_year', self.policy_year[-1] if self.years else 0))
+            growth = float(scenario.get('growth_rate', 0))
+            active = (years >= start) & (years <= end)
+            schedules[i] = np.where(active, amount * (1 + growth) ** np.clip(years - start, 0, None), 0.0)
+        return schedules
+
+    def simulate(self, withdrawals, premium_scale=1.0):
+        """
+        向量化模拟多个提取方案
+
+        Args:
+            withdrawals: (S, Y) 提取金额矩阵
+            premium_scale: 保费缩放系数（实际保费 / 预测所用保费），基本计划价值按比例缩放
+
+        Returns:
+            dict: 各字段均为 (S, Y) 矩阵，另含每个方案的失效年度（名义金额耗尽，无则为 None）
+        """
+        withdrawals = np.atleast_2d(np.asarray(withdrawals, dtype=np.float64))
+        scaled = premium_scale != 1.0
+        if scaled:
+            # 提取额按保费比例折算回基准预测，再把结果放大
+            withdrawals = withdrawals / premium_scale
+
+        ratio = self._notional_ratio(withdrawals)
+        lapsed = ratio <= 0
+        ratio = np.clip(ratio, 0, 1)
+
+        if self.calibration is not None:
+            ref_drop = 1.0 - self.reference_ratio
+            with np.errstate(divide='ignore', invalid='ignore'):
+                weight = np.where(ref_drop > 1e-9, (1.0 - ratio) / ref_drop, 0.0)
+            k_eff = np.clip(1.0 + (self.calibration - 1.0) * weight, 0, None)
+        else:
+            k_eff = 1.0
+
+        guaranteed = self.guaranteed * ratio
+        non_guaranteed = self.non_guaranteed * ratio * k_eff
+        # 名义金额耗尽后保单终止，之后年度不再提取
+        first_lapse = np.where(lapsed.any(axis=1), lapsed.argmax(axis=1), -1)
+        after_lapse = np.arange(self.years)[None, :] > np.where(first_lapse < 0, self.years, first_lapse)[:, None]
+        withdrawals = np.where(after_lapse, 0.0, withdrawals)
+        guaranteed = np.where(lapsed, 0.0, guaranteed)
+        non_guaranteed = np.where(lapsed, 0.0, non_guaranteed)
+
+        total_surrender = guaranteed + non_guaranteed
+        accumulated = np.cumsum(withdrawals, axis=1)
+
+        result = {
+            'withdrawal_amount': withdrawals,
+            'accumulated_withdrawal': accumulated,
+            'notional_ratio': ratio,
+            'guaranteed': guaranteed,
+            'non_guaranteed': non_guaranteed,
+            'total_surrender': total_surrender,
+            'total_value': accumulated + total_surrender,
+        }
+        if scaled:
+            for key in result:
+                if key != 'notional_ratio':
+                    result[key] = result[key] * premium_scale
+        if self.initial_notional:
+            result['notional_amount'] = ratio * self.initial_notional * premium_scale
+
+        result['lapse_year'] = [
+            int(self.policy_year[idx]) if idx >= 0 else None for idx in first_lapse
+        ]
+        return result
+
+    # ---------- 构建方法 ----------
+
+    @classmethod
+    def from_rows(cls, rows, reference=None, initial_notional=None):
+        """从行式数据 [{"policy_year": 1, "guaranteed": ..., "total": ...}] 构建"""
+        rows = sorted(
+            (r for r in rows if isinstance(r, dict) and r.get('policy_year', r.get('year')) is not None),
+            key=lambda r: int(r.get('policy_year', r.get('year')))
+        )
+        return cls(
+            policy_year=[int(r.get('policy_year', r.get('year'))) for r in rows],
+            guaranteed=_to_float_array([_row_value(r, 'guaranteed') for r in rows]),
+            non_guaranteed=_to_float_array([_row_value(r, 'non_guaranteed') for r in rows]),
+            total=_to_float_array([_row_value(r, 'total') for r in rows]),
+            premiums_paid=_to_float_array([_row_value(r, 'premiums_paid') for r in rows]),
+            reference=reference,
+            initial_notional=initial_notional,
+        )
+
+    @classmethod
+    def from_md_projection(cls, md_data):
+        """
+        从 md*.json 构建：基本计划取 policyOptions 为空的投影，
+        若存在 Withdrawal 投影（有数据列）则作为参考校准
+        """
+        return cls.from_projection_set(parse_projections_data(md_data, options=[[], ['Withdrawal']]))
+
+    @classmethod
+    def from_projection_set(cls, projections):
+        """从 projection_parser.ProjectionSet 构建（如上传的 md*.json 文件流式解析结果）"""
+        base_proj = projections.find([])
+        withdrawal_proj = projections.find(['Withdrawal'])
+        if base_proj is None:
+            raise ValueError('未找到基本计划投影（policyOptions为空）')
+
+        base = base_proj.select(MD_BASE_COLUMNS)
+        reference = None
+        initial_notional = None
+        if withdrawal_proj is not None:
+            reference = withdrawal_proj.select(MD_WITHDRAWAL_COLUMNS)
+            notional = reference.get('notional_amount')
+            if notional is not None and notional.size:
+                initial_notional = float(notional[0])
+
+        return cls(
+            policy_year=base['policy_year'].astype(np.int64),
+            guaranteed=base['guaranteed'],
+            non_guaranteed=base.get('non_guaranteed', np.full(base['total'].size, np.nan)),
+            total=base['total'],
+            premiums_paid=base.get('premiums_paid'),
+            reference=reference,
+            initial_notional=initial_notional,
+        )
+
+    @classmethod
+    def from_product(cls, product):
+        """从 InsuranceProduct 的标准退保价值表构建"""
+        from .comparison_service import parse_surrender_table
+        standard_data = parse_surrender_table(product.surrender_value_table)
+        if standard_data is None:
+            raise ValueError('该产品没有退保价值表数据')
+        return cls.from_rows(standard_data['standard'])
+
+    @classmethod
+    def from_plan_document(cls, doc):
+        """
+        从计划书构建：table1 作为基本计划，table2（无忧选/入息表）作为参考校准
+        """
+        try:
+            table1 = json.loads(doc.table1) if doc.table1 else None
+        except (json.JSONDecodeError, TypeError):
+            table1 = None
+        if not isinstance(table1, dict) or not isinstance(table1.get('years'), list) or not table1['years']:
+            raise ValueError('该计划书没有基本计划退保价值表（table1）')
+
+        simulator_rows = table1['years']
+        reference = None
+        try:
+            table2 = json.loads(doc.table2) if doc.table2 else None
+        except (json.JSONDecodeError, TypeError):
+            table2 = None
+        if isinstance(table2, dict) and isinstance(table2.get('years'), list) and table2['years']:
+            by_year = {int(r['policy_year']): r for r in table2['years'] if isinstance(r, dict) and r.get('policy_year') is not None}
+            years = sorted(int(r['policy_year']) for r in simulator_rows if isinstance(r, dict) and r.get('policy_year') is not None)
+            reference = {
+                'withdrawal_amount': _to_float_array([by_year.get(y, {}).get('withdraw') for y in years]),
+                'total': _to_float_array([by_year.get(y, {}).get('total') for y in years]),
+            }
+        return cls.from_rows(simulator_rows, reference=reference)
+
+
+def result_to_columns(result, digits=0):
+    """模拟结果转为紧凑的列式 JSON（每个方案一组列）"""
+    scenarios = []
+    count = len(result['lapse_year'])
+    for i in range(count):
+        columns = {}
+        for key, matrix in result.items():
+            if key == 'lapse_year':
+                continue
+            precision = 6 if key == 'notional_ratio' else digits
+            columns[key] = [float(v) for v in np.round(matrix[i], precision)]
+        columns['lapse_year'] = result['lapse_year'][i]
+        scenarios.append(columns)
+    return scenarios
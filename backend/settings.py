@@ -14,6 +14,7 @@ from pathlib import Path
 import pymysql
 import os
 from dotenv import load_dotenv
+from celery.schedules import crontab
 
 # 加载环境变量
 load_dotenv()
@@ -154,6 +155,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # CORS设置 - 允许所有来源（开发环境）
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
+# 允许前端读取的响应头（ETag 用于条件请求，X-Cache/Age 为保险公司API缓存状态）
+CORS_EXPOSE_HEADERS = ['ETag', 'X-Cache', 'Age']
 
 # CSRF设置 - 信任的来源（Django 4.0+需要）
 CSRF_TRUSTED_ORIGINS = [
@@ -223,6 +226,51 @@ LOGGING = {
     },
 }
 
+# 缓存配置（Redis）
+# 用于标准对比快照等派生数据，通过版本号失效
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_CACHE_URL', 'redis://localhost:6379/1'),
+        'KEY_PREFIX': 'insurancetools',
+    }
+}
+
+# 保险公司API批量（网格）请求
+# 每个保险公司主机同时进行的最大请求数，避免触发对方限流
+INSURER_MAX_CONCURRENCY_PER_HOST = int(os.getenv('INSURER_MAX_CONCURRENCY_PER_HOST', '4'))
+# 单次网格请求最多的参数组合数
+ILLUSTRATION_SWEEP_MAX_POINTS = int(os.getenv('ILLUSTRATION_SWEEP_MAX_POINTS', '500'))
+# 每个主机的 keep-alive 连接池大小、幂等请求的最大重试次数
+INSURER_HTTP_POOL_SIZE = int(os.getenv('INSURER_HTTP_POOL_SIZE', '10'))
+INSURER_HTTP_MAX_RETRIES = int(os.getenv('INSURER_HTTP_MAX_RETRIES', '2'))
+# 按主机配置超时（秒）：(连接超时, 读取超时)，未配置的主机使用 (10, 120)
+INSURER_HTTP_TIMEOUTS = {
+    'az-api.axa.com.hk': (5, 30),
+}
+# 固定参数的保险公司请求（如安盛提取计算）的响应缓存时长（秒），0表示不缓存
+# 配置在 InsuranceCompanyRequest 中的请求使用各自的 response_cache_ttl
+INSURER_RESPONSE_CACHE_DEFAULT_TTL = int(os.getenv('INSURER_RESPONSE_CACHE_DEFAULT_TTL', '3600'))
+
+# 图片生成异步任务：未传 async=true 的旧客户端在接口内等待任务完成的最长时间（秒，上限5秒），
+# 未完成时返回 202 和 status_url，客户端需轮询
+IMAGE_JOB_SYNC_WAIT_TIMEOUT = int(os.getenv('IMAGE_JOB_SYNC_WAIT_TIMEOUT', '5'))
+# 批量文案配图：每个进程同时进行的 Gemini 调用总数、单个用户的并发数
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '24'))
+GEMINI_MAX_CONCURRENCY_PER_USER = int(os.getenv('GEMINI_MAX_CONCURRENCY_PER_USER', '9'))
+# 额度预留的有效期（秒），超时未结算的预留由定时任务退还，应大于 CELERY_TASK_TIME_LIMIT
+QUOTA_RESERVATION_TTL = int(os.getenv('QUOTA_RESERVATION_TTL', str(35 * 60)))
+# Gemini调用汇总的小时桶保留天数（统计接口最长按30天统计），更早的合并为天桶
+GEMINI_USAGE_HOURLY_RETENTION_DAYS = int(os.getenv('GEMINI_USAGE_HOURLY_RETENTION_DAYS', '35'))
+# TTS 合成结果（media/tts，没有数据库记录）保留天数，由孤儿文件回收任务清理
+MEDIA_TTS_RETENTION_DAYS = int(os.getenv('MEDIA_TTS_RETENTION_DAYS', '7'))
+# media/tts 磁盘预算（字节），超过时按最近使用时间淘汰合成结果（默认2GB）
+TTS_CACHE_MAX_BYTES = int(os.getenv('TTS_CACHE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+# 每个进程同时进行的 Azure 语音合成数（长文本分段合成共用）
+AZURE_TTS_MAX_CONCURRENCY = int(os.getenv('AZURE_TTS_MAX_CONCURRENCY', '8'))
+# 个人语音（CosyVoice）多句文本每个请求同时合成的句子数
+COSYVOICE_MAX_CONCURRENCY = int(os.getenv('COSYVOICE_MAX_CONCURRENCY', '4'))
+
 # Celery配置
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = 'django-db'  # 使用Django数据库存储结果
@@ -236,3 +284,25 @@ CELERY_TASK_TIME_LIMIT = 30 * 60  # 任务最长运行30分钟
 CELERY_TASK_SOFT_TIME_LIMIT = 25 * 60  # 软超时25分钟
 CELERY_WORKER_PREFETCH_MULTIPLIER = 1  # 每次只取一个任务
 CELERY_WORKER_MAX_TASKS_PER_CHILD = 50  # 每个worker处理50个任务后重启
+
+# 定时任务（需要运行 celery -A backend beat）
+# 产品退保价值表刷新时间，crontab 格式 "分 时"，默认每天凌晨3点
+PRODUCT_TABLE_REFRESH_CRON = os.getenv('PRODUCT_TABLE_REFRESH_CRON', '0 3').split()
+CELERY_BEAT_SCHEDULE = {
+    'refresh-product-tables': {
+        'task': 'api.tasks.refresh_product_tables_task',
+        'schedule': crontab(minute=PRODUCT_TABLE_REFRESH_CRON[0], hour=PRODUCT_TABLE_REFRESH_CRON[1]),
+    },
+    'expire-quota-reservations': {
+        'task': 'api.tasks.expire_quota_reservations_task',
+        'schedule': crontab(minute='*/5'),
+    },
+    'compact-gemini-usage-rollups': {
+        'task': 'api.tasks.compact_gemini_usage_rollups_task',
+        'schedule': crontab(minute=30, hour=4),
+    },
+    'reconcile-media-files': {
+        'task': 'api.tasks.reconcile_media_files_task',
+        'schedule': crontab(minute=0, hour=5),
+    },
+}
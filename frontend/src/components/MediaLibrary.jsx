@@ -20,7 +20,8 @@ function MediaLibrary() {
   const [selectedType, setSelectedType] = useState(''); // '' | 'ip_image' | 'content_image'
   const [showFavoriteOnly, setShowFavoriteOnly] = useState(false);
   const [currentPage, setCurrentPage] = useState(1);
-  const [totalPages, setTotalPages] = useState(1);
+  const [pageCursors, setPageCursors] = useState(['']); // 每一页的起始游标（游标分页）
+  const [hasMore, setHasMore] = useState(false);
   const [selectedItems, setSelectedItems] = useState(new Set());
   const [previewImage, setPreviewImage] = useState(null);
 
@@ -51,12 +52,19 @@ function MediaLibrary() {
     fetchStats();
   }, [currentPage, selectedType, showFavoriteOnly]);
 
+  // 切换筛选条件时回到第一页
+  const changeFilter = (apply) => {
+    apply();
+    setPageCursors(['']);
+    setCurrentPage(1);
+  };
+
   const fetchMediaLibrary = async () => {
     try {
       setIsLoading(true);
       const token = localStorage.getItem('access_token');
       const params = new URLSearchParams({
-        page: currentPage,
+        cursor: pageCursors[currentPage - 1] || '',
         page_size: 12
       });
 
@@ -77,7 +85,14 @@ function MediaLibrary() {
       const data = await response.json();
       if (data.status === 'success') {
         setMediaList(data.data.items);
-        setTotalPages(data.data.total_pages);
+        setHasMore(data.data.has_more);
+        if (data.data.next_cursor) {
+          setPageCursors(prev => {
+            const next = prev.slice(0, currentPage);
+            next[currentPage] = data.data.next_cursor;
+            return next;
+          });
+        }
       }
     } catch (error) {
       console.error('获取素材库失败:', error);
@@ -356,7 +371,7 @@ function MediaLibrary() {
             {/* 类型筛选 */}
             <div className="flex items-center gap-1 md:gap-2 flex-1 md:flex-initial">
               <button
-                onClick={() => setSelectedType('')}
+                onClick={() => changeFilter(() => setSelectedType(''))}
                 className={`flex-1 md:flex-initial px-2 md:px-4 py-1.5 md:py-2 text-xs md:text-sm rounded-lg transition-all ${
                   selectedType === ''
                     ? 'bg-blue-600 text-white'
@@ -366,7 +381,7 @@ function MediaLibrary() {
                 全部
               </button>
               <button
-                onClick={() => setSelectedType('ip_image')}
+                onClick={() => changeFilter(() => setSelectedType('ip_image'))}
                 className={`flex-1 md:flex-initial px-2 md:px-4 py-1.5 md:py-2 text-xs md:text-sm rounded-lg transition-all ${
                   selectedType === 'ip_image'
                     ? 'bg-purple-600 text-white'
@@ -376,7 +391,7 @@ function MediaLibrary() {
                 IP形象
               </button>
               <button
-                onClick={() => setSelectedType('content_image')}
+                onClick={() => changeFilter(() => setSelectedType('content_image'))}
                 className={`flex-1 md:flex-initial px-2 md:px-4 py-1.5 md:py-2 text-xs md:text-sm rounded-lg transition-all ${
                   selectedType === 'content_image'
                     ? 'bg-indigo-600 text-white'
@@ -391,7 +406,7 @@ function MediaLibrary() {
             <div className="flex items-center gap-2 flex-wrap">
               {/* 收藏筛选 */}
               <button
-                onClick={() => setShowFavoriteOnly(!showFavoriteOnly)}
+                onClick={() => changeFilter(() => setShowFavoriteOnly(!showFavoriteOnly))}
                 className={`px-2 md:px-4 py-1.5 md:py-2 text-xs md:text-sm rounded-lg transition-all flex items-center gap-1 md:gap-2 ${
                   showFavoriteOnly
                     ? 'bg-red-600 text-white'
@@ -473,8 +488,9 @@ function MediaLibrary() {
                   onClick={() => setPreviewImage(item)}
                 >
                   <img
-                    src={item.url}
+                    src={item.thumbnail_url || item.url}
                     alt={item.prompt}
+                    loading="lazy"
                     className="w-full h-full object-cover"
                   />
                 </div>
@@ -522,7 +538,7 @@ function MediaLibrary() {
         )}
 
         {/* 分页 */}
-        {totalPages > 1 && (
+        {(currentPage > 1 || hasMore) && (
           <div className="flex justify-center items-center gap-2 mt-4 md:mt-6">
             <button
               onClick={() => setCurrentPage(prev => Math.max(1, prev - 1))}
@@ -533,12 +549,12 @@ function MediaLibrary() {
             </button>
 
             <span className="px-2 md:px-4 py-1.5 md:py-2 text-xs md:text-sm text-gray-600">
-              {currentPage} / {totalPages}
+              第 {currentPage} 页
             </span>
 
             <button
-              onClick={() => setCurrentPage(prev => Math.min(totalPages, prev + 1))}
-              disabled={currentPage === totalPages}
+              onClick={() => setCurrentPage(prev => prev + 1)}
+              disabled={!hasMore}
               className="px-3 py-1.5 md:px-4 md:py-2 text-xs md:text-sm bg-white rounded-lg shadow-md disabled:opacity-50 disabled:cursor-not-allowed hover:bg-gray-50 transition-colors"
             >
               下一页
@@ -570,6 +586,8 @@ function MediaLibrary() {
               >
                 <img
                   src={previewImage.url}
+                  srcSet={previewImage.srcset || undefined}
+                  sizes="(max-width: 768px) 100vw, 768px"
                   alt={previewImage.prompt}
                   className="w-full h-auto max-h-[70vh] object-contain"
                 />
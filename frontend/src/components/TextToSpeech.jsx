@@ -73,9 +73,17 @@ function TextToSpeech() {
     }
   };
 
+  // 个人语音按用户区分，登录时带上 token
+  const authHeaders = () => {
+    const token = localStorage.getItem('access_token');
+    return token ? { 'Authorization': `Bearer ${token}` } : {};
+  };
+
   const fetchPersonalVoices = async () => {
     try {
-      const response = await fetch(`${API_BASE_URL}/api/personal-voice/`);
+      const response = await fetch(`${API_BASE_URL}/api/personal-voice/`, {
+        headers: authHeaders(),
+      });
       const data = await response.json();
       if (data.status === 'success') {
         setPersonalVoices(data.voices);
@@ -97,6 +105,43 @@ function TextToSpeech() {
     { label: '英语（英国）', voices: voices.filter(v => v.language === 'en-GB') },
   ].filter(group => group.voices.length > 0);
 
+  // 流式合成：立即播放音频流，通过 SSE 等待合成结束（返回保存后的文件地址）
+  const startStreamSynthesis = (data, isPersonal) => {
+    const previousAudio = isPersonal ? personalAudioElement : audioElement;
+    const setAudio = isPersonal ? setPersonalAudioElement : setAudioElement;
+    const setPlaying = isPersonal ? setIsPersonalPlaying : setIsPlaying;
+    const setUrl = isPersonal ? setPersonalAudioUrl : setAudioUrl;
+
+    if (previousAudio) {
+      previousAudio.pause();
+    }
+
+    const streamAudio = new Audio(`${API_BASE_URL}${data.audio_url}`);
+    // 播放结束后丢弃流式音频元素，再次播放时使用保存后的文件
+    streamAudio.addEventListener('ended', () => {
+      setPlaying(false);
+      setAudio(null);
+    });
+    streamAudio.addEventListener('error', () => setPlaying(false));
+    setUrl(`${API_BASE_URL}${data.audio_url}`);
+    setAudio(streamAudio);
+    streamAudio.play().then(() => setPlaying(true)).catch(() => setPlaying(false));
+
+    return new Promise((resolve) => {
+      const events = new EventSource(`${API_BASE_URL}${data.events_url}`);
+      events.addEventListener('done', (event) => {
+        events.close();
+        const result = JSON.parse(event.data);
+        setUrl(`${API_BASE_URL}${result.audio_url}`);
+        resolve(result);
+      });
+      events.addEventListener('error', (event) => {
+        events.close();
+        resolve({ error: event.data ? JSON.parse(event.data).message : '语音合成失败' });
+      });
+    });
+  };
+
   // 标准语音合成
   const handleSynthesize = async () => {
     if (!text.trim()) {
@@ -109,7 +154,7 @@ function TextToSpeech() {
     setSubtitleUrls(null);
 
     try {
-      const response = await fetch(`${API_BASE_URL}/api/tts/synthesize/`, {
+      const response = await fetch(`${API_BASE_URL}/api/tts/stream/`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -123,14 +168,17 @@ function TextToSpeech() {
       const data = await response.json();
 
       if (data.status === 'success') {
-        setAudioUrl(`${API_BASE_URL}${data.audio_url}`);
-        // 保存字幕URL
-        setSubtitleUrls({
-          json: data.subtitle_url,
-          srt: data.srt_url,
-          vtt: data.vtt_url,
-        });
-        alert('语音合成成功！');
+        const result = await startStreamSynthesis(data, false);
+        if (result.error) {
+          alert(result.error);
+        } else {
+          // 保存字幕URL
+          setSubtitleUrls({
+            json: result.subtitle_url,
+            srt: result.srt_url,
+            vtt: result.vtt_url,
+          });
+        }
       } else {
         alert(data.message || '语音合成失败');
       }
@@ -158,9 +206,9 @@ function TextToSpeech() {
     setPersonalAudioUrl(null);
 
     try {
-      const response = await fetch(`${API_BASE_URL}/api/personal-voice/synthesize/`, {
+      const response = await fetch(`${API_BASE_URL}/api/personal-voice/synthesize/stream/`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { ...authHeaders(), 'Content-Type': 'application/json' },
         body: JSON.stringify({
           text: personalText,
           voice_id: selectedPersonalVoice,
@@ -172,8 +220,10 @@ function TextToSpeech() {
       const data = await response.json();
 
       if (data.status === 'success') {
-        setPersonalAudioUrl(`${API_BASE_URL}${data.audio_url}`);
-        alert('个人语音合成成功！');
+        const result = await startStreamSynthesis(data, true);
+        if (result.error) {
+          alert(result.error);
+        }
       } else {
         alert(data.message || '个人语音合成失败');
       }
@@ -207,6 +257,7 @@ function TextToSpeech() {
 
       const response = await fetch(`${API_BASE_URL}/api/personal-voice/create/`, {
         method: 'POST',
+        headers: authHeaders(),
         body: formData,
       });
 
@@ -316,6 +367,7 @@ function TextToSpeech() {
     try {
       const response = await fetch(`${API_BASE_URL}/api/personal-voice/${voiceId}/delete/`, {
         method: 'DELETE',
+        headers: authHeaders(),
       });
 
       const data = await response.json();
@@ -9,6 +9,7 @@ import {
   ArrowPathIcon,
 } from '@heroicons/react/24/outline';
 import { API_BASE_URL } from '../config';
+import { generateContentImage } from '../services/geminiApi';
 
 function VideoGenerator() {
   const navigate = useNavigate();
@@ -353,20 +354,8 @@ function VideoGenerator() {
         i === index ? { ...p, isGenerating: true } : p
       ));
 
-      const token = localStorage.getItem('access_token');
-      const formData = new FormData();
-      formData.append('content', prompt.text);
-      formData.append('image_index', 1);
-
-      const response = await fetch(`${API_BASE_URL}/api/ip-image/generate-v2`, {
-        method: 'POST',
-        headers: {
-          'Authorization': `Bearer ${token}`
-        },
-        body: formData
-      });
-
-      const data = await response.json();
+      // 异步提交生成任务并轮询结果
+      const data = await generateContentImage(prompt.text, 1, {}, '9:16');
 
       if (data.status === 'success') {
         // 更新图片
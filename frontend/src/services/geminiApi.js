@@ -5,6 +5,52 @@ import { API_BASE_URL } from '../config';
  * 统一管理所有与 Gemini 图像生成相关的 API 调用
  */
 
+// ==================== 异步生成任务 ====================
+
+const JOB_POLL_INTERVAL = 2000;
+const JOB_POLL_TIMEOUT = 5 * 60 * 1000;
+
+/**
+ * 提交生成请求（async=true）并轮询任务直到完成
+ * 返回与同步接口相同格式的结果
+ * @param {FormData} formData - 生成参数
+ * @returns {Promise<{status: string, image_url?: string, message?: string}>}
+ */
+const submitAndWaitForImageJob = async (formData) => {
+  formData.append('async', 'true');
+  const token = localStorage.getItem('access_token');
+  const response = await fetch(`${API_BASE_URL}/api/ip-image/generate-v2`, {
+    method: 'POST',
+    headers: {
+      'Authorization': `Bearer ${token}`
+    },
+    body: formData,
+  });
+
+  const data = await response.json();
+  if (data.status !== 'pending' || !data.status_url) {
+    return data;
+  }
+
+  const deadline = Date.now() + JOB_POLL_TIMEOUT;
+  while (Date.now() < deadline) {
+    await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL));
+    const jobResponse = await fetch(`${API_BASE_URL}${data.status_url}`, {
+      headers: {
+        'Authorization': `Bearer ${token}`
+      }
+    });
+    const job = await jobResponse.json();
+    if (job.status !== 'success') {
+      return job;
+    }
+    if (job.data.status === 'succeeded' || job.data.status === 'failed') {
+      return job.data.result;
+    }
+  }
+  return { status: 'error', message: '生成超时，请稍后在素材库中查看' };
+};
+
 // ==================== IP 形象生成 API ====================
 
 /**
@@ -52,17 +98,7 @@ export const generateIPImageV2 = async (image, prompt, aspectRatio = '1:1') => {
     formData.append('prompt', prompt);
     formData.append('aspect_ratio', aspectRatio);
 
-    const token = localStorage.getItem('access_token');
-    const response = await fetch(`${API_BASE_URL}/api/ip-image/generate-v2`, {
-      method: 'POST',
-      headers: {
-        'Authorization': `Bearer ${token}`
-      },
-      body: formData,
-    });
-
-    const data = await response.json();
-    return data;
+    return await submitAndWaitForImageJob(formData);
   } catch (error) {
     console.error('生成IP形象失败 (V2):', error);
     throw error;
@@ -145,17 +181,7 @@ export const generateContentImageV2 = async (content, imageIndex = 1, options =
       formData.append('ip_image_url', options.ipImageUrl);
     }
 
-    const token = localStorage.getItem('access_token');
-    const response = await fetch(`${API_BASE_URL}/api/ip-image/generate-v2`, {
-      method: 'POST',
-      headers: {
-        'Authorization': `Bearer ${token}`
-      },
-      body: formData,
-    });
-
-    const data = await response.json();
-    return data;
+    return await submitAndWaitForImageJob(formData);
   } catch (error) {
     console.error('生成文案配图失败 (V2):', error);
     throw error;
@@ -174,6 +200,69 @@ export const generateContentImageV2 = async (content, imageIndex = 1, options =
  */
 export const generateContentImage = generateContentImageV2;
 
+/**
+ * 批量生成文案配图（并发生成，每张完成即回调）
+ * @param {string} content - 文案内容
+ * @param {string[]} aspectRatios - 每张图片的纵横比，数组长度即图片数量（最多9张）
+ * @param {Object} options - 可选参数
+ * @param {boolean} options.includeIpImage - 是否包含IP形象
+ * @param {string} options.ipImageUrl - IP形象的URL
+ * @param {Function} options.onImage - 每张图片完成时的回调 (result) => void
+ * @returns {Promise<{succeeded: number, failed: number, remaining_quota?: number, images: Object[]}>}
+ */
+export const generateContentImageBatch = async (content, aspectRatios, options = {}) => {
+  const token = localStorage.getItem('access_token');
+  const response = await fetch(`${API_BASE_URL}/api/ip-image/content-batch`, {
+    method: 'POST',
+    headers: {
+      'Authorization': `Bearer ${token}`,
+      'Content-Type': 'application/json'
+    },
+    body: JSON.stringify({
+      content,
+      aspect_ratios: aspectRatios,
+      include_ip_image: options.includeIpImage && options.ipImageUrl ? 'true' : 'false',
+      ip_image_url: options.ipImageUrl || ''
+    }),
+  });
+
+  if (!response.ok) {
+    const data = await response.json();
+    throw new Error(data.message || '批量生成失败');
+  }
+
+  const images = [];
+  let summary = { succeeded: 0, failed: 0 };
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  const handleLine = (line) => {
+    if (!line.trim()) return;
+    const event = JSON.parse(line);
+    if (event.type === 'image') {
+      images.push(event);
+      if (options.onImage) options.onImage(event);
+    } else if (event.type === 'done') {
+      summary = event;
+    } else if (event.type === 'error') {
+      console.error('批量生成文案配图出错:', event.message);
+    }
+  };
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop();
+    lines.forEach(handleLine);
+  }
+  handleLine(buffer);
+
+  return { ...summary, images };
+};
+
 // ==================== IP 形象管理 API ====================
 
 /**
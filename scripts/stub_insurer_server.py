@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+本地保险公司API桩服务器：对任意路径的 GET/POST 返回 md*.json 格式的利益演示投影，
+用于在不访问真实保险公司的情况下测试产品退保价值表刷新
+
+使用方法：
+    python scripts/stub_insurer_server.py --file tasks/md3.json --port 8765
+    python manage.py refresh_product_tables --base-url http://127.0.0.1:8765 --dry-run
+
+    # 模拟费率调整（所有金额乘以 1.05）、慢响应或故障
+    python scripts/stub_insurer_server.py --scale 1.05
+    python scripts/stub_insurer_server.py --delay 2
+    python scripts/stub_insurer_server.py --status 503
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def scale_projections(data, factor):
+    """把投影中所有数值单元格乘以 factor（年度 / 年龄列除外）"""
+    if factor == 1:
+        return data
+    for projection in data.get('projections', []):
+        for column in projection.get('columns', []):
+            if column.get('Name') in ('columnYear', 'columnAge'):
+                continue
+            for cell in column.get('Values', []):
+                if isinstance(cell, dict) and isinstance(cell.get('value'), (int, float)):
+                    cell['value'] = round(cell['value'] * factor, 2)
+    return data
+
+
+def make_handler(payload, status, delay):
+    class StubInsurerHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # 支持 keep-alive，与真实保险公司API一致
+
+        def _respond(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            request_body = self.rfile.read(length) if length else b''
+            if delay:
+                time.sleep(delay)
+
+            if status >= 400:
+                body = json.dumps({'error': f'stub error {status}'}).encode('utf-8')
+            else:
+                body = payload
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            print(f"📨 {self.command} {self.path} ({len(request_body)} bytes) -> {status}")
+
+        do_GET = _respond
+        do_POST = _respond
+        do_PUT = _respond
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubInsurerHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地保险公司API桩服务器')
+    parser.add_argument('--file', default=os.path.join(BASE_DIR, 'tasks', 'md3.json'), help='返回的 md*.json 文件')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--scale', type=float, default=1.0, help='金额缩放系数，用于模拟退保价值表变化')
+    parser.add_argument('--delay', type=float, default=0, help='每个响应的延迟（秒）')
+    parser.add_argument('--status', type=int, default=200, help='响应状态码，用于模拟故障')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.file):
+        print(f"❌ 找不到文件: {args.file}")
+        sys.exit(1)
+    with open(args.file, 'r', encoding='utf-8') as f:
+        data = scale_projections(json.load(f), args.scale)
+    payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(payload, args.status, args.delay))
+    print(f"🚀 桩服务器已启动: http://{args.host}:{args.port} （{os.path.basename(args.file)}，缩放 {args.scale}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 已停止")
+
+
+if __name__ == '__main__':
+    main()